@@ -1,4 +1,4 @@
 from config import Configuration
 from core import Ausroller
+from fanout import FanOut
 from main import main
-from kube import KubeCtl, KubeCtlException
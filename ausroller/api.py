@@ -0,0 +1,392 @@
+# encoding: utf-8
+
+from Queue import Queue, Empty, Full
+from cache import write_atomically
+from config import kubectl_default_bin
+from kube import KubeCtl, KubeCtlException
+from manifest import documents, fields
+from timing import current_recorder
+import base64
+import hashlib
+import httplib
+import json
+import logging
+import os
+import re
+import socket
+import ssl
+import tempfile
+import threading
+import time
+import urllib
+import urlparse
+
+field_manager = 'ausroller'
+# server-side apply is available since Kubernetes 1.16
+min_server_version = (1, 16, 0)
+# seconds the discovered resources of an API group are reused
+discovery_ttl = 600
+
+
+class ApiError(Exception):
+
+    def __init__(self, method, path, status, body):
+        try:
+            message = json.loads(body)['message']
+        except (ValueError, KeyError, TypeError):
+            message = body.strip()
+        super(ApiError, self).__init__("{} {} returned {}: {}".format(
+            method, path, status, message))
+        self.status = status
+        # named like the output of CalledProcessError for KubeCtlException
+        self.output = message
+
+
+class ConnectionPool(object):
+    '''
+    Keeps up to size keep-alive connections to the API server open and
+    reuses them for subsequent requests.
+    '''
+
+    def __init__(self, url, ssl_context=None, size=4, timeout=60):
+        parsed = urlparse.urlsplit(url)
+        self.https = parsed.scheme == 'https'
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.prefix = parsed.path.rstrip('/')
+        self.ssl_context = ssl_context
+        self.timeout = timeout
+        self.idle = Queue(size)
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def _connect(self):
+        with self.lock:
+            self.opened += 1
+        current_recorder().count('api connections')
+        if self.https:
+            return httplib.HTTPSConnection(self.host, self.port,
+                                           timeout=self.timeout,
+                                           context=self.ssl_context)
+        return httplib.HTTPConnection(self.host, self.port,
+                                      timeout=self.timeout)
+
+    def request(self, method, path, body=None, headers={}):
+        ''' (string, string, string, dict) -> (int, string)
+            Sends a request on an idle or a new connection and returns
+            status and body of the response.
+        '''
+        try:
+            (connection, reused) = (self.idle.get_nowait(), True)
+        except Empty:
+            (connection, reused) = (self._connect(), False)
+        try:
+            connection.request(method, self.prefix + path, body, headers)
+            response = connection.getresponse()
+            data = response.read()
+        except (httplib.HTTPException, socket.error):
+            connection.close()
+            if not reused:
+                raise
+            # the server closed the idle connection in the meantime
+            return self.request(method, path, body, headers)
+        if response.will_close:
+            connection.close()
+        else:
+            try:
+                self.idle.put_nowait(connection)
+            except Full:
+                connection.close()
+        return (response.status, data)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Empty:
+                return
+
+
+class KubeApi(KubeCtl):
+    '''
+    KubeCtl applying resources with server-side apply requests sent
+    directly to the API server over pooled keep-alive connections instead
+    of starting kubectl for every call. kubectl is started once to read
+    the kubeconfig; watching rollouts and diffs still use kubectl.
+    '''
+
+    def __init__(self, context, namespace, path=kubectl_default_bin, dryrun=False, skip_verify=False, verify_cache=None, discovery_cache=None):
+        self.discovery_cache = discovery_cache
+        self._kubeconfig = None
+        self._pool = None
+        self._headers = {}
+        self._resources = {}
+        self._api_lock = threading.Lock()
+        super(KubeApi, self).__init__(context, namespace, path, dryrun,
+                                      skip_verify, verify_cache)
+
+    def kubeconfig(self):
+        ''' () -> dict
+            Returns the merged kubeconfig as read by kubectl.
+        '''
+        with self._api_lock:
+            if self._kubeconfig is None:
+                output = self._run("config view --raw -o json")
+                try:
+                    self._kubeconfig = json.loads(output)
+                except (TypeError, ValueError) as e:
+                    raise KubeCtlException("Cannot read the kubeconfig", e)
+            return self._kubeconfig
+
+    def _named(self, section, name):
+        for entry in self.kubeconfig().get(section) or []:
+            if entry.get('name') == name:
+                return entry.get(section[:-1]) or {}
+        return None
+
+    @staticmethod
+    def _load_client_certificate(ssl_context, user):
+        certfile = user.get('client-certificate')
+        keyfile = user.get('client-key')
+        tempfiles = []
+        try:
+            for (key, filename) in [('client-certificate-data', 'certfile'),
+                                    ('client-key-data', 'keyfile')]:
+                if not user.get(key):
+                    continue
+                (fd, path) = tempfile.mkstemp()
+                tempfiles.append(path)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(base64.b64decode(user[key]))
+                if filename == 'certfile':
+                    certfile = path
+                else:
+                    keyfile = path
+            if certfile:
+                ssl_context.load_cert_chain(certfile, keyfile)
+        finally:
+            for path in tempfiles:
+                os.unlink(path)
+
+    def _connect(self):
+        context = self._named('contexts', self.context)
+        if context is None:
+            raise KubeCtlException(
+                "The requested kubectl context [{}] is not available.".format(self.context))
+        cluster = self._named('clusters', context.get('cluster')) or {}
+        user = self._named('users', context.get('user')) or {}
+        if not cluster.get('server'):
+            raise KubeCtlException(
+                "No server configured for context [{}].".format(self.context))
+        if user.get('exec') or user.get('auth-provider'):
+            raise KubeCtlException(
+                "The credentials of context [{}] are not supported by the api backend, use backend = kubectl.".format(self.context))
+
+        token = user.get('token')
+        if not token and user.get('tokenFile'):
+            try:
+                with open(user['tokenFile']) as f:
+                    token = f.read().strip()
+            except IOError as e:
+                raise KubeCtlException(
+                    "Cannot read the token of context [{}].".format(self.context), e)
+        if token:
+            self._headers['Authorization'] = "Bearer {}".format(token)
+        elif user.get('username'):
+            self._headers['Authorization'] = "Basic {}".format(
+                base64.b64encode("{}:{}".format(user['username'],
+                                                user.get('password', ''))))
+        ssl_context = None
+        if cluster['server'].startswith('https:'):
+            ssl_context = ssl.create_default_context()
+            if cluster.get('insecure-skip-tls-verify'):
+                ssl_context.check_hostname = False
+                ssl_context.verify_mode = ssl.CERT_NONE
+            try:
+                if cluster.get('certificate-authority-data'):
+                    ssl_context.load_verify_locations(cadata=base64.b64decode(
+                        cluster['certificate-authority-data']).decode('ascii'))
+                elif cluster.get('certificate-authority'):
+                    ssl_context.load_verify_locations(
+                        cafile=cluster['certificate-authority'])
+                self._load_client_certificate(ssl_context, user)
+            except (IOError, ssl.SSLError) as e:
+                raise KubeCtlException(
+                    "Cannot load the certificates of context [{}].".format(self.context), e)
+        logging.debug("Connecting to {}".format(cluster['server']))
+        return ConnectionPool(cluster['server'], ssl_context)
+
+    def pool(self):
+        if self._pool is None:
+            pool = self._connect()
+            with self._api_lock:
+                if self._pool is None:
+                    self._pool = pool
+        return self._pool
+
+    def request(self, method, path, body=None, content_type=None):
+        ''' (string, string, string, string) -> dict
+            Sends a request to the API server and returns the decoded
+            response. Raises ApiError if the server rejects the request.
+        '''
+        pool = self.pool()
+        headers = dict(self._headers, Accept='application/json')
+        if content_type:
+            headers['Content-Type'] = content_type
+        logging.debug("{} {}".format(method, path))
+        current_recorder().count('api requests')
+        try:
+            with current_recorder().phase("api {}".format(method)):
+                (status, data) = pool.request(method, path, body, headers)
+        except (httplib.HTTPException, socket.error) as e:
+            raise KubeCtlException("Cannot reach the api server", e)
+        if status >= 400:
+            raise ApiError(method, path, status, data)
+        return json.loads(data) if data else {}
+
+    @staticmethod
+    def group_path(api_version):
+        if api_version == 'v1':
+            return "/api/v1"
+        return "/apis/{}".format(api_version)
+
+    def _discovery_cachefile(self):
+        if not self.discovery_cache:
+            return None
+        server = "{}:{}{}".format(self.pool().host, self.pool().port,
+                                  self.pool().prefix)
+        return os.path.join(self.discovery_cache,
+                            hashlib.sha1(server).hexdigest() + '.json')
+
+    def _load_discovery(self):
+        cachefile = self._discovery_cachefile()
+        try:
+            with open(cachefile) as f:
+                return json.load(f)
+        except (IOError, ValueError, TypeError):
+            return {}
+
+    def discover(self, api_version, refresh=False):
+        ''' (string, bool) -> dict
+            Returns the resources of an API group version, mapping kinds to
+            (resource, namespaced). Discovered resources are kept in memory
+            and on disk for discovery_ttl seconds.
+        '''
+        with self._api_lock:
+            resources = self._resources.get(api_version)
+        if resources and not refresh:
+            return resources
+        cached = self._load_discovery()
+        entry = cached.get(api_version)
+        if entry and not refresh and entry['time'] + discovery_ttl > time.time():
+            resources = entry['resources']
+        else:
+            resources = {}
+            for resource in self.request(
+                    'GET', self.group_path(api_version))['resources']:
+                # skip sub resources like deployments/scale
+                if '/' not in resource['name']:
+                    resources[resource['kind']] = (resource['name'],
+                                                   resource['namespaced'])
+            cachefile = self._discovery_cachefile()
+            if cachefile:
+                cached[api_version] = {'time': time.time(),
+                                       'resources': resources}
+                try:
+                    write_atomically(cachefile, json.dumps(cached))
+                except (IOError, OSError) as e:
+                    logging.warn("Cannot write discovery cache \"{}\" [{}]".format(
+                        cachefile, e))
+        with self._api_lock:
+            self._resources[api_version] = resources
+        return resources
+
+    def resource(self, api_version, kind):
+        ''' (string, string) -> (string, bool)
+            Returns the resource name of a kind and if it is namespaced.
+        '''
+        resources = self.discover(api_version)
+        if kind not in resources:
+            # the kind may have been added since it was discovered
+            resources = self.discover(api_version, refresh=True)
+        if kind not in resources:
+            raise KubeCtlException(
+                "The server does not know {} in {}".format(kind, api_version))
+        return tuple(resources[kind])
+
+    def apply_document(self, document):
+        ''' (string) -> string
+            Applies one object with a server-side apply request and returns
+            its name as printed by kubectl -o name.
+        '''
+        manifest = fields(document)
+        if not all(key in manifest for key in ('apiVersion', 'kind', 'name')):
+            raise KubeCtlException(
+                "Manifest without apiVersion, kind or metadata.name")
+        (api_version, kind, name) = (manifest['apiVersion'], manifest['kind'],
+                                     manifest['name'])
+        (plural, namespaced) = self.resource(api_version, kind)
+        path = self.group_path(api_version)
+        if namespaced:
+            path += "/namespaces/{}".format(
+                manifest.get('namespace', self.namespace))
+        path += "/{}/{}?fieldManager={}&force=true".format(
+            plural, urllib.quote(name), field_manager)
+        self.request('PATCH', path, document, 'application/apply-patch+yaml')
+        group = api_version.rpartition('/')[0]
+        return "{}{}/{}".format(kind.lower(), "." + group if group else "", name)
+
+    def apply_manifests(self, manifests):
+        ''' (string) -> list of strings
+            Applies all objects of the given manifests one after another on
+            the pooled connections and returns their names.
+        '''
+        if self.dryrun:
+            logging.debug("Skipping applying manifests")
+            return []
+        names = []
+        for document in documents(manifests):
+            try:
+                names.append(self.apply_document(document))
+            except ApiError as e:
+                logging.error("api server failed with [{}]".format(e))
+                raise KubeCtlException("applying manifests failed", e)
+        return names
+
+    def apply_resourcefiles(self, resourcefiles):
+        if self.dryrun:
+            logging.debug("Skipping applying {}".format(" ".join(resourcefiles)))
+            return []
+        names = []
+        for resourcefile in resourcefiles:
+            with open(resourcefile) as f:
+                manifests = f.read()
+            try:
+                names.extend(self.apply_manifests(manifests))
+            except KubeCtlException as e:
+                raise KubeCtlException("applying {} failed".format(
+                    resourcefile), e.cause)
+        return names
+
+    def apply_resourcefile(self, resourcefile):
+        self.apply_resourcefiles([resourcefile])
+
+    def get_contexts(self):
+        return "\n".join(context['name'] for context in
+                         self.kubeconfig().get('contexts') or [])
+
+    def verify_version(self):
+        try:
+            version = self.request('GET', '/version')
+        except ApiError as e:
+            raise KubeCtlException(
+                "Failed to get the server version. The api server might not be available.", e)
+        match = re.match(r"v(\d+)\.(\d+)\.(\d+)", version.get('gitVersion', ''))
+        if not match:
+            raise KubeCtlException("Failed to get the server version.")
+        server_version = tuple(int(part) for part in match.groups())
+        logging.debug("Found server version {}".format(
+            '.'.join(map(str, server_version))))
+        if server_version < min_server_version:
+            raise KubeCtlException(
+                "The server is too old for server-side apply, use backend = kubectl.")
@@ -0,0 +1,203 @@
+# encoding: utf-8
+
+import cPickle
+import errno
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+
+
+def write_atomically(path, data, mode=0777):
+    ''' (string, string, int) -> None
+        Writes data to path via a temporary file which is renamed into
+        place, so concurrent runs sharing a cache never read a partially
+        written file. Missing directories are created with the given mode.
+    '''
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory, mode)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+    (fd, tmpfile) = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmpfile, path)
+    except:
+        os.unlink(tmpfile)
+        raise
+
+
+def stream_digest(chunks, out=None):
+    ''' (iterable of strings, file) -> (int, string)
+        Returns size and sha1 digest of the data given in chunks, writing
+        the chunks to out on the way if a file is given.
+        >>> stream_digest(['a', 'bc']) == (3, hashlib.sha1('abc').hexdigest())
+        True
+    '''
+    digest = hashlib.sha1()
+    size = 0
+    for chunk in chunks:
+        digest.update(chunk)
+        size += len(chunk)
+        if out is not None:
+            out.write(chunk)
+    return (size, digest.hexdigest())
+
+
+def file_digest(path, blocksize=65536):
+    ''' (string, int) -> (int, string)
+        Returns size and sha1 digest of a file, read in blocks, or None if
+        it cannot be read.
+    '''
+    try:
+        with open(path, 'rb') as f:
+            return stream_digest(iter(lambda: f.read(blocksize), ''))
+    except (IOError, OSError):
+        return None
+
+
+# names of the files created by write_temporary
+TEMPORARY_NAME = re.compile(r"^\..+\.[0-9a-f]{12}$")
+
+
+def write_temporary(path, chunks):
+    ''' (string, iterable of strings) -> (string, int, string)
+        Writes the chunks to a new temporary file in the directory of path
+        and returns its name with size and sha1 digest of the data. The
+        caller renames it into place or removes it. Unlike mkstemp the
+        file gets the permissions of a file created with open.
+    '''
+    directory = os.path.dirname(path)
+    while True:
+        tmpfile = os.path.join(directory, ".{}.{}".format(
+            os.path.basename(path), os.urandom(6).encode('hex')))
+        try:
+            fd = os.open(tmpfile, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0666)
+            break
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            (size, digest) = stream_digest(chunks, f)
+    except:
+        os.unlink(tmpfile)
+        raise
+    return (tmpfile, size, digest)
+
+
+def fsync_directory(path):
+    ''' (string) -> None
+        Makes the renames within a directory durable.
+    '''
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class AppliedCache(object):
+    '''
+    Remembers the sha1 digest of every resource file last applied
+    successfully to a namespace of a context. Committed resources are
+    only skipped if they reached the cluster, also when the apply after
+    their commit failed or another context shares the rollout directory.
+    '''
+
+    def __init__(self, cachedir, context, namespace):
+        self.cachefile = os.path.join(cachedir, hashlib.sha1(
+            json.dumps([context, namespace])).hexdigest() + '.json')
+        self._applied = None
+
+    def _load(self):
+        try:
+            with open(self.cachefile) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def is_applied(self, path, digest):
+        ''' (string, string) -> bool
+            Checks if the resource file at path was applied with the given
+            digest.
+        '''
+        if self._applied is None:
+            self._applied = self._load()
+        return self._applied.get(os.path.realpath(path)) == digest
+
+    def store(self, digests):
+        ''' (dict) -> None
+            Records the digests of the resource files they map to as
+            applied.
+        '''
+        if not digests:
+            return
+        applied = self._load()
+        applied.update((os.path.realpath(path), digest)
+                       for (path, digest) in digests.items())
+        self._applied = applied
+        try:
+            write_atomically(self.cachefile, json.dumps(applied))
+        except (IOError, OSError) as e:
+            logging.warn("Cannot write applied resources \"{}\" [{}]".format(
+                self.cachefile, e))
+
+
+class VariablesCache(object):
+    '''
+    Keeps parsed variable files pickled in a private directory. An entry is
+    used as long as size and mtime of the file are unchanged or its content
+    has the same sha1 digest.
+    '''
+
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+
+    def entry_path(self, path):
+        return os.path.join(self.cachedir, hashlib.sha1(
+            os.path.realpath(path)).hexdigest() + '.pickle')
+
+    def _load_entry(self, cachefile):
+        try:
+            with open(cachefile, 'rb') as f:
+                return cPickle.load(f)
+        except (IOError, EOFError, cPickle.UnpicklingError, ValueError,
+                TypeError, AttributeError):
+            return None
+
+    def load(self, path, parse):
+        ''' (string, function) -> dict
+            Returns the variables of the file at path, calling parse with
+            its content if they are not cached.
+        '''
+        stat = os.stat(path)
+        cachefile = self.entry_path(path)
+        entry = self._load_entry(cachefile)
+        if entry and entry['size'] == stat.st_size and \
+                entry['mtime'] == stat.st_mtime:
+            logging.debug("Using cached variables of {}".format(path))
+            return entry['variables']
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha1(content).hexdigest()
+        if entry and entry['sha1'] == digest:
+            variables = entry['variables']
+        else:
+            variables = parse(content)
+        try:
+            write_atomically(cachefile, cPickle.dumps(
+                {'size': stat.st_size, 'mtime': stat.st_mtime,
+                 'sha1': digest, 'variables': variables},
+                cPickle.HIGHEST_PROTOCOL), 0700)
+        except (IOError, OSError) as e:
+            logging.warn("Cannot write variables cache \"{}\" [{}]".format(
+                cachefile, e))
+        return variables
@@ -0,0 +1,215 @@
+# encoding: utf-8
+
+import logging
+import os
+import threading
+
+TEMPLATE_SUFFIX = '.tpl.yaml'
+
+# one catalog per templates directory, shared by all Ausroller instances
+# of the process
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def plural(resource):
+    ''' (string) -> string
+        Returns the name of the directory holding the templates and
+        manifests of a resource type.
+        >>> plural('deployment')
+        'deployments'
+        >>> plural('ingress')
+        'ingresses'
+        >>> plural('networkpolicy')
+        'networkpolicies'
+    '''
+    if resource.endswith(('s', 'x', 'ch', 'sh')):
+        return resource + 'es'
+    if resource.endswith('y') and resource[-2:-1] not in 'aeiou':
+        return resource[:-1] + 'ies'
+    return resource + 's'
+
+
+def resource_types_of(directory):
+    ''' (string) -> list of strings
+        Returns the resource types whose templates may be found in a
+        directory, the one it is the plural of first.
+        >>> resource_types_of('ingresses')
+        ['ingress', 'ingresse']
+    '''
+    if not directory.endswith('s'):
+        return []
+    candidates = []
+    if directory.endswith('ies'):
+        candidates.append(directory[:-3] + 'y')
+    if directory.endswith('es'):
+        candidates.append(directory[:-2])
+    candidates.append(directory[:-1])
+    return sorted((candidate for candidate in candidates if candidate),
+                  key=lambda candidate: plural(candidate) != directory)
+
+
+def place(name):
+    ''' (string) -> tuple
+        Returns (app, resource type) of a template given by its name
+        relative to the templates directory, or None if the name is not of
+        the form <type directory>/<app>-<type>.tpl.yaml.
+        >>> place('ingresses/my-app-ingress.tpl.yaml')
+        ('my-app', 'ingress')
+        >>> place('networkpolicies/app-networkpolicy.tpl.yaml')
+        ('app', 'networkpolicy')
+        >>> place('deployments/app.tpl.yaml') is None
+        True
+    '''
+    (directory, _, filename) = name.rpartition('/')
+    if not directory or '/' in directory or \
+            not filename.endswith(TEMPLATE_SUFFIX):
+        return None
+    for resource in resource_types_of(directory):
+        suffix = "-{}{}".format(resource, TEMPLATE_SUFFIX)
+        if filename.endswith(suffix) and len(filename) > len(suffix):
+            return (filename[:-len(suffix)], resource)
+    return None
+
+
+def template_catalog(templates_path):
+    ''' (string) -> TemplateCatalog
+        Returns the shared, up to date catalog of the given templates
+        directory.
+    '''
+    with _catalogs_lock:
+        catalog = _catalogs.get(templates_path)
+        if catalog is None:
+            catalog = TemplateCatalog(templates_path)
+            _catalogs[templates_path] = catalog
+    catalog.refresh()
+    return catalog
+
+
+class TemplateCatalog(object):
+    '''
+    The templates of every application below a templates directory, found
+    by listing the directories of all resource types, e.g.
+    ingresses/app-ingress.tpl.yaml. A directory is only listed again when
+    its mtime changed, i.e. when templates were added, removed or renamed.
+    '''
+
+    def __init__(self, templates_path):
+        self.templates_path = templates_path
+        self._lock = threading.Lock()
+        self._mtime = None
+        # directory -> (mtime, list of (app, resource type, template name))
+        self._directories = {}
+        # app -> {resource type: template name}
+        self._apps = {}
+        # resource type -> directory
+        self._resources = {}
+
+    def _mtime_of(self, path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def _list(self, directory):
+        ''' (string) -> list of tuples
+            Returns (app, resource type, template name) of all templates in
+            the given directory.
+        '''
+        try:
+            filenames = os.listdir(os.path.join(self.templates_path, directory))
+        except OSError:
+            return []
+        templates = []
+        for filename in sorted(filenames):
+            name = "{}/{}".format(directory, filename)
+            placed = place(name)
+            if placed:
+                templates.append(placed + (name,))
+            elif filename.endswith(TEMPLATE_SUFFIX):
+                logging.warn(
+                    "Ignoring template \"{}\", it is not named <app>-<type>{} after its directory".format(
+                        name, TEMPLATE_SUFFIX))
+        return templates
+
+    def refresh(self):
+        ''' () -> bool
+            Lists the directories which changed since the last refresh and
+            returns whether any did.
+        '''
+        with self._lock:
+            mtime = self._mtime_of(self.templates_path)
+            if mtime != self._mtime:
+                self._mtime = mtime
+                try:
+                    names = os.listdir(self.templates_path)
+                except OSError:
+                    names = []
+                found = set(name for name in names
+                            if resource_types_of(name) and
+                            os.path.isdir(os.path.join(self.templates_path, name)))
+            else:
+                found = set(self._directories)
+
+            directories = {}
+            changed = found != set(self._directories)
+            for directory in found:
+                mtime = self._mtime_of(os.path.join(self.templates_path,
+                                                    directory))
+                known = self._directories.get(directory)
+                if known and known[0] == mtime:
+                    directories[directory] = known
+                else:
+                    directories[directory] = (mtime, self._list(directory))
+                    changed = True
+            if not changed:
+                return False
+
+            apps = {}
+            resources = {}
+            for directory in sorted(directories):
+                for (app_name, resource, name) in directories[directory][1]:
+                    # the plural wins over other spellings of the directory
+                    preferred = directory == plural(resource)
+                    templates = apps.setdefault(app_name, {})
+                    if preferred or resource not in templates:
+                        templates[resource] = name
+                    if preferred or resource not in resources:
+                        resources[resource] = directory
+            self._directories = directories
+            self._apps = apps
+            self._resources = resources
+            return True
+
+    def templates(self, app_name):
+        ''' (string) -> dict
+            Returns the template names of an application by resource type.
+        '''
+        return self._apps.get(app_name, {})
+
+    def apps(self):
+        ''' () -> list of strings
+            Returns all applications having a template.
+        '''
+        return sorted(self._apps)
+
+    def names(self):
+        ''' () -> list of strings
+            Returns the names of all templates relative to the templates
+            directory.
+        '''
+        return sorted(name for (_, templates) in self._directories.values()
+                      for (_, _, name) in templates)
+
+    def resources(self):
+        ''' () -> set of strings
+            Returns all resource types having a template.
+        '''
+        return set(self._resources)
+
+    def directory(self, resource):
+        ''' (string) -> string
+            Returns the name of the directory holding the templates of a
+            resource type, which is also used for its manifests.
+        '''
+        return self._resources.get(resource) or plural(resource)
@@ -0,0 +1,216 @@
+# encoding: utf-8
+
+from jinja2 import TemplateError
+from catalog import place, plural
+from config import Configuration
+from core import Ausroller, ordered, render
+from index import TemplateIndex
+from repo import RolloutRepository
+from timing import Recorder, current_recorder
+import json
+import logging
+import os
+import re
+import sys
+
+# rendered in place of the version to find it in rolled out manifests
+VERSION_SENTINEL = u"@@ausroller-app-version@@"
+
+
+class ChangeDetector(object):
+    '''
+    Works out which resources of which applications in a namespace are
+    affected by the changes of the resources repository since a given
+    revision: changed templates and templates using changed variables.
+    '''
+
+    def __init__(self, ausroller, repo, since):
+        self.a = ausroller
+        self.c = ausroller.c
+        self.repo = repo
+        self.since = since
+        self.index = TemplateIndex.for_configuration(self.c, ausroller.env)
+        self.index.update()
+
+    def template_name(self, app_name, resource):
+        return self.a.catalog.templates(app_name).get(resource) or \
+            "{}/{}-{}.tpl.yaml".format(plural(resource), app_name, resource)
+
+    def variables_of(self, app_name, resource):
+        ''' (string, string) -> set of strings
+            Returns the variables used by a template.
+        '''
+        return self.index.variables(self.template_name(app_name, resource))
+
+    def changed_templates(self, paths):
+        changed = set()
+        for path in paths:
+            (directory, _, name) = path.partition('/')
+            placed = place(name) if directory == 'templates' else None
+            if placed and os.path.exists(os.path.join(self.c.repopath, path)):
+                changed.add(placed)
+        return changed
+
+    def _variables_at(self, revision, path):
+        content = self.repo.show_file(revision, path)
+        if content is None:
+            return {}
+        return json.loads(
+            content, object_pairs_hook=Configuration._custom_json_pairs_hook)
+
+    def changed_variables(self, paths):
+        ''' (set of strings) -> set of strings
+            Returns the names of the secret and extra variables whose
+            values changed.
+        '''
+        changed = set()
+        for varfile in [self.c.secretsfile, self.c.extravarsfile]:
+            if not varfile:
+                continue
+            path = os.path.relpath(os.path.realpath(varfile), self.c.repopath)
+            if path.startswith(os.pardir):
+                logging.warn(
+                    "Cannot detect changes of \"{}\" outside of the repository".format(varfile))
+                continue
+            if path not in paths:
+                continue
+            before = self._variables_at(self.since, path)
+            with open(varfile) as f:
+                after = json.load(
+                    f, object_pairs_hook=Configuration._custom_json_pairs_hook)
+            changed.update(key for key in set(before) | set(after)
+                           if before.get(key) != after.get(key))
+        return changed
+
+    def affected(self):
+        ''' () -> dict
+            Maps the affected applications to their affected resources.
+        '''
+        paths = set(self.repo.changed_files(self.since))
+        pairs = self.changed_templates(paths)
+        keys = self.changed_variables(paths)
+        if keys:
+            logging.info("Changed variables: {}".format(
+                ", ".join(sorted(keys))))
+            for key in keys:
+                for name in self.index.templates(key):
+                    placed = place(name)
+                    if placed:
+                        pairs.add(placed)
+
+        affected = {}
+        for (app_name, resource) in pairs:
+            affected.setdefault(app_name, set()).add(resource)
+        return affected
+
+    def is_deployed(self, app_name):
+        return any(os.path.exists(self.a.resource_path(app_name, resource))
+                   for resource in self.a.resource_types())
+
+    def _templates(self, app_name, resource):
+        name = self.template_name(app_name, resource)
+        # the manifest was most likely rendered from the old template
+        before = self.repo.show_file(self.since, "templates/" + name)
+        if before is not None:
+            try:
+                yield self.a.env.from_string(before.decode('utf-8'))
+            except TemplateError:
+                pass
+        try:
+            template = self.a.get_template(resource, app_name)
+        except TemplateError:
+            return
+        if template is not None:
+            yield template
+
+    def _match_version(self, template, manifest):
+        try:
+            rendered = render(template, self.a.render_context(),
+                              VERSION_SENTINEL)
+        except TemplateError:
+            return None
+        for line in rendered.splitlines():
+            if VERSION_SENTINEL not in line:
+                continue
+            pattern = "^{}$".format("(.+?)".join(
+                re.escape(part) for part in line.split(VERSION_SENTINEL)))
+            match = re.search(pattern, manifest, re.MULTILINE)
+            if match and len(set(match.groups())) == 1:
+                return match.group(1)
+        return None
+
+    def deployed_version(self, app_name):
+        ''' (string) -> string
+            Returns the version of the application as found in its rolled
+            out manifests or None if it cannot be found.
+        '''
+        for resource in self.a.resource_types():
+            manifest = self.a.resource_path(app_name, resource)
+            if not os.path.exists(manifest):
+                continue
+            with open(manifest) as f:
+                content = f.read().decode('utf-8')
+            for template in self._templates(app_name, resource):
+                version = self._match_version(template, content)
+                if version is not None:
+                    return version
+        return None
+
+    def rollouts(self):
+        ''' () -> (list of tuples, dict)
+            Returns the (app, deployed version) pairs to roll out again and
+            the affected resources of each application.
+        '''
+        apps = []
+        selection = {}
+        for (app_name, resources) in sorted(self.affected().items()):
+            if not self.is_deployed(app_name):
+                logging.info("{} is not deployed in {}, skipping".format(
+                    app_name, self.c.namespace))
+                continue
+            version = self.deployed_version(app_name)
+            if version is None:
+                if any('app_version' in self.variables_of(app_name, resource)
+                       for resource in resources):
+                    logging.warn(
+                        "Cannot find the deployed version of {}, skipping".format(app_name))
+                    continue
+                version = ''
+            apps.append((app_name, version))
+            selection[app_name] = ordered(resources)
+        return (apps, selection)
+
+
+def changed(argv):
+    def add_arguments(parser):
+        parser.add_argument('--since', type=str, required=True,
+                            help='Roll out what changed between this revision of the resources repository and HEAD')
+
+    c = Configuration()
+    args = c.parse_args(argv, prog='ausroller changed',
+                        add_arguments=add_arguments, apps_required=False)
+    logging.basicConfig(format='%(levelname)s: %(message)s',
+                        level=c.log_level)
+    logging.getLogger("gbp").propagate = False
+    if c.apps:
+        logging.error("Applications are detected from the changes, do not pass --app or --manifest")
+        sys.exit(2)
+
+    for (namespace, context) in c.targets:
+        t = c.for_target(namespace, context)
+        r = Recorder(parent=current_recorder())
+        with r.activate():
+            t.read_config()
+            a = Ausroller(t, recorder=r)
+        detector = ChangeDetector(a, RolloutRepository(t.repopath), args.since)
+        (t.apps, selection) = detector.rollouts()
+        if not t.apps:
+            logging.info("Nothing in {} is affected by changes since {}".format(
+                namespace, args.since))
+            continue
+        logging.info("Affected in {}: {}".format(namespace, ", ".join(
+            "{} ({})".format(app_name, ", ".join(selection[app_name]))
+            for (app_name, _) in t.apps)))
+        if not t.commit_message:
+            t.commit_message = "Rolled out changes since {}".format(args.since)
+        a.deploy(selection)
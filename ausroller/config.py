@@ -1,22 +1,42 @@
 # encoding: utf-8
 import argparse
+import copy
 import sys
 import os
 import json
 import logging
 from ConfigParser import ConfigParser, NoOptionError, NoSectionError
-from kube import kubectl_default_bin
+from cache import VariablesCache
+from timing import timed
 from ausroller import version
 
+# ways to talk to the cluster: starting kubectl or requests to the API server
+BACKENDS = ['kubectl', 'api']
+# kubectl found in PATH if none is configured
+kubectl_default_bin = "kubectl"
+
 
 class Configuration(object):
 
-    def parse_args(self):
-        parser = argparse.ArgumentParser()
-        parser.add_argument('-a', '--app', type=str, required=True,
-                            help='Application to rollout')
-        parser.add_argument('-v', '--ver', type=str, required=True,
-                            help='Version to rollout')
+    def parse_args(self, argv=None, prog=None, add_arguments=None,
+                   apps_required=True, versions=True):
+        ''' (list of strings, string, function, bool, bool) -> Namespace
+            Parses the rollout arguments. Sub commands may add their own
+            arguments with add_arguments(parser), may choose the
+            applications themselves and may take applications without
+            versions (which are None then). Returns the parsed arguments.
+        '''
+        parser = argparse.ArgumentParser(prog=prog)
+        if add_arguments:
+            add_arguments(parser)
+        parser.add_argument('-a', '--app', type=str, action='append',
+                            default=[],
+                            help='Application to rollout (may be repeated)')
+        parser.add_argument('-v', '--ver', type=str, action='append',
+                            default=[],
+                            help='Version to rollout (one per --app)')
+        parser.add_argument('-f', '--manifest', type=str, required=False,
+                            help='Path to JSON file mapping applications to versions')
         parser.add_argument('-m', '--message', type=str, required=False,
                             default='', help='Optional commit message')
         parser.add_argument('-c', '--config', type=str, required=False,
@@ -26,26 +46,100 @@ class Configuration(object):
                             help='Don\'t do anything just print')
         parser.add_argument('-D', '--dryruntemp', action='store_true',
                             help='Don\'t do apply but produce git commits')
+        parser.add_argument('--diff', action='store_true',
+                            help='Show what would change in the cluster without writing or applying anything')
+        parser.add_argument('-F', '--force', action='store_true',
+                            help='Apply all resources, even unchanged ones')
+        parser.add_argument('--reverify', action='store_true',
+                            help='Verify kubectl and the cluster even if verified recently')
+        parser.add_argument('-w', '--wait', action='store_true',
+                            help='Wait until deployments, statefulsets and replicationcontrollers are rolled out')
+        parser.add_argument('--wait-timeout', type=int, default=600,
+                            help='Seconds to wait for all rollouts [600]')
+        parser.add_argument('--profile', action='store_true',
+                            help='Print the time spent in each phase')
+        parser.add_argument('--profile-output', type=str, required=False,
+                            help='Write the timings to the given file')
+        parser.add_argument('--profile-format', choices=['json', 'trace'],
+                            default='json',
+                            help='Format of --profile-output: plain json or Chrome trace events [json]')
         parser.add_argument('-V', '--verbose', action='store_true',
                             help='Be verbose; print debug messages')
-        parser.add_argument('-n', '--namespace', type=str, required=True,
+        parser.add_argument('-n', '--namespace', type=str, required=False,
                             help='Which namespace to rollout on')
         parser.add_argument('-e', '--extravars', type=str, required=False,
                             help='Path to file holding extra variables')
         parser.add_argument('-s', '--secret', type=str, required=False,
                             help='Path to file holding [<repopath>/secrets/<namespace>/secret_vars.json]')
-        parser.add_argument('-C', '--context', type=str, required=True,
+        parser.add_argument('-C', '--context', type=str, required=False,
                             help='Kubernetes context to use]')
+        parser.add_argument('-t', '--target', type=str, action='append',
+                            default=[],
+                            help='Rollout target as <namespace>@<context> (may be repeated)')
+        parser.add_argument('-P', '--max-parallel', type=int, default=4,
+                            help='Maximum number of targets to roll out concurrently [4]')
+        parser.add_argument('--apply-parallel', type=int, default=1,
+                            help='Split each wave of independent resources into up to this many concurrent apply calls [1]')
         parser.add_argument('--version', action='version',
                             version=version.__version__)
-        args = parser.parse_args()
+        args = parser.parse_args(argv)
+
+        if not versions:
+            if args.ver or args.manifest:
+                parser.error("--ver and --manifest cannot be used here")
+            args.ver = [None] * len(args.app)
+        if len(args.app) != len(args.ver):
+            parser.error("Each --app needs exactly one --ver")
+        self.apps = list(zip(args.app, args.ver))
+        if args.manifest:
+            try:
+                self.apps.extend(self.read_manifest(args.manifest))
+            except (IOError, KeyError, ValueError) as e:
+                parser.error("Cannot read manifest \"{}\"! [{}]".format(
+                    args.manifest, e))
+        if not self.apps and apps_required:
+            parser.error("Nothing to rollout. Use --app/--ver or --manifest")
+        app_names = [app_name for (app_name, _) in self.apps]
+        if len(set(app_names)) != len(app_names):
+            parser.error("Each application may only be rolled out once")
+
+        self.targets = []
+        if args.namespace or args.context:
+            if not (args.namespace and args.context):
+                parser.error("--namespace and --context have to be used together")
+            self.targets.append((args.namespace, args.context))
+        for target in args.target:
+            (namespace, sep, context) = target.partition('@')
+            if not (namespace and sep and context):
+                parser.error(
+                    "Target \"{}\" is not of the form <namespace>@<context>".format(target))
+            self.targets.append((namespace, context))
+        if not self.targets:
+            parser.error("Nowhere to rollout. Use --namespace/--context or --target")
+        if len(set(self.targets)) != len(self.targets):
+            parser.error("Each target may only be given once")
+        if args.max_parallel < 1:
+            parser.error("--max-parallel has to be at least 1")
+        self.max_parallel = args.max_parallel
+        if args.apply_parallel < 1:
+            parser.error("--apply-parallel has to be at least 1")
+        self.apply_parallel = args.apply_parallel
+        (self.namespace, self.context) = self.targets[0]
+
+        if args.diff and (args.dryrun or args.dryruntemp):
+            parser.error("--diff cannot be combined with --dryrun or --dryruntemp")
 
-        self.app_name = args.app
-        self.app_version = args.ver
-        self.namespace = args.namespace
         self.commit_message = args.message
         self.is_dryrun = args.dryrun
         self.is_dryrun_but_templates = args.dryruntemp
+        self.diff = args.diff
+        self.force_apply = args.force
+        self.reverify = args.reverify
+        self.wait = args.wait
+        self.wait_timeout = args.wait_timeout
+        self.profile = args.profile
+        self.profile_output = args.profile_output
+        self.profile_format = args.profile_format
         self.is_verbose = args.verbose
         if self.is_verbose:
             self.log_level = logging.DEBUG
@@ -54,9 +148,58 @@ class Configuration(object):
         self.configfile = args.config
         self.extravarsfile = args.extravars
         self.secretsfile = args.secret
-        self.context = args.context
+        return args
+
+    def for_target(self, namespace, context):
+        ''' (string, string) -> Configuration
+            Returns a copy of the parsed arguments for the given target.
+            Has to be called before read_config as the copy reads the
+            configuration of its target itself.
+        '''
+        c = copy.copy(self)
+        c.namespace = namespace
+        c.context = context
+        c.targets = [(namespace, context)]
+        return c
 
+    @timed('read config')
     def read_config(self):
+        self.read_settings()
+
+        # set paths and read in the json file with the secrets
+        self.rollout_path = os.path.join(
+            self.repopath, 'rollout', self.namespace)
+        if not self.secretsfile:
+            self.secretsfile = os.path.join(
+                self.repopath, 'secrets', self.namespace, 'secret_vars.json')
+        try:
+            self.variables = self.load_variables(self.secretsfile)
+        except KeyError as e:
+            logging.error("Cannot read secret variables from \"{}\"! [{}]".format(
+                self.secretsfile, e))
+            sys.exit(1)
+
+        self.extra_variables = {}
+        if not self.extravarsfile:
+            default_extravarsfile = os.path.join(
+                self.repopath, 'manifests', self.namespace, 'extra_vars.json')
+            if os.path.exists(default_extravarsfile):
+                logging.info("found default extra vars file")
+                self.extravarsfile = default_extravarsfile
+
+        if self.extravarsfile:
+            try:
+                self.extra_variables = self.load_variables(self.extravarsfile)
+            except KeyError as e:
+                logging.error("Cannot read extra variables from \"{}\"! [{}]".format(
+                    self.extravarsfile, e))
+                sys.exit(1)
+
+    def read_settings(self):
+        '''
+        Reads the options of the configuration file, i.e. everything
+        independent of the namespace.
+        '''
         home_dir = os.path.expanduser("~")
         # read config file
         if not self.configfile:
@@ -92,35 +235,45 @@ class Configuration(object):
             logging.warn("Trying to use default 'kubectl' from PATH")
             self.kubectlpath = kubectl_default_bin
 
-        # set paths and read in the json file with the secrets
-        self.templates_path = os.path.join(self.repopath, 'templates')
-        self.rollout_path = os.path.join(
-            self.repopath, 'rollout', self.namespace)
-        if not self.secretsfile:
-            self.secretsfile = os.path.join(
-                self.repopath, 'secrets', self.namespace, 'secret_vars.json')
+        # optional settings of the local caches
         try:
-            self.variables = self.read_variables(self.secretsfile)
-        except KeyError as e:
-            logging.error("Cannot read secret variables from \"{}\"! [{}]".format(
-                self.secretsfile, e))
+            self.cachepath = os.path.realpath(os.path.expanduser(
+                cp.get('ausroller', 'cachepath')))
+        except NoOptionError:
+            self.cachepath = os.path.join(home_dir, '.cache', 'ausroller')
+        try:
+            self.templatecache = cp.getboolean('ausroller', 'templatecache')
+        except NoOptionError:
+            self.templatecache = True
+        try:
+            self.verifyttl = cp.getint('ausroller', 'verifyttl')
+        except NoOptionError:
+            self.verifyttl = 300
+        try:
+            self.variablescache = cp.getboolean('ausroller', 'variablescache')
+        except NoOptionError:
+            self.variablescache = True
+        try:
+            self.backend = cp.get('ausroller', 'backend')
+        except NoOptionError:
+            self.backend = 'kubectl'
+        if self.backend not in BACKENDS:
+            logging.error("Unknown backend '{}' in configuration file \"{}\", use one of {}.".format(
+                self.backend, self.configfile, ", ".join(BACKENDS)))
             sys.exit(1)
+        try:
+            history = cp.getboolean('ausroller', 'history')
+        except NoOptionError:
+            history = True
+        try:
+            self.historyfile = os.path.realpath(os.path.expanduser(
+                cp.get('ausroller', 'historyfile')))
+        except NoOptionError:
+            self.historyfile = os.path.join(self.cachepath, 'history.sqlite')
+        if not history:
+            self.historyfile = None
 
-        self.extra_variables = {}
-        if not self.extravarsfile:
-            default_extravarsfile = os.path.join(
-                self.repopath, 'manifests', self.namespace, 'extra_vars.json')
-            if os.path.exists(default_extravarsfile):
-                logging.info("found default extra vars file")
-                self.extravarsfile = default_extravarsfile
-
-        if self.extravarsfile:
-            try:
-                self.extra_variables = self.read_variables(self.extravarsfile)
-            except KeyError as e:
-                logging.error("Cannot read extra variables from \"{}\"! [{}]".format(
-                    self.extravarsfile, e))
-                sys.exit(1)
+        self.templates_path = os.path.join(self.repopath, 'templates')
 
     @staticmethod
     def _custom_json_pairs_hook(pairs):
@@ -138,14 +291,43 @@ class Configuration(object):
                 result[key] = value
         return result
 
+    @staticmethod
+    def read_manifest(manifestfile):
+        ''' (string) -> list of tuples
+            Reads a json file mapping application names to versions and
+            returns a list of (app, version) pairs sorted by application.
+        '''
+        manifest = Configuration.read_variables(manifestfile)
+        for (app_name, app_version) in manifest.items():
+            if not isinstance(app_version, basestring):
+                raise ValueError(
+                    "Version of \"{}\" is not a string.".format(app_name))
+        return sorted(manifest.items())
+
     @staticmethod
     def read_variables(varfile):
         ''' (string) -> dict
             Reads from a given json filename and returns a dict.
         '''
-        variables = {}
         logging.debug("Reading variables from {}".format(varfile))
         with open(varfile) as f:
-            variables = json.load(
-                f, object_pairs_hook=Configuration._custom_json_pairs_hook)
-        return variables
+            return Configuration.parse_variables(f.read())
+
+    @staticmethod
+    def parse_variables(content):
+        ''' (string) -> dict
+            Parses json variables and returns a dict.
+        '''
+        return json.loads(
+            content, object_pairs_hook=Configuration._custom_json_pairs_hook)
+
+    def load_variables(self, varfile):
+        ''' (string) -> dict
+            Reads variables like read_variables, but reuses the parsed
+            variables cached below cachepath while the file is unchanged.
+        '''
+        if not self.variablescache:
+            return self.read_variables(varfile)
+        logging.debug("Loading variables from {}".format(varfile))
+        return VariablesCache(os.path.join(self.cachepath, 'variables')).load(
+            varfile, self.parse_variables)
@@ -1,145 +1,624 @@
 # encoding: utf-8
 
-from jinja2 import Template, Environment, FileSystemLoader, exceptions
-from gbp.git import repository
-from kube import KubeCtl, KubeCtlException
+# jinja2, gbp, kubectl and the rollout watcher are imported when they are
+# first needed to keep the start of the command line tool fast
+from cache import TEMPORARY_NAME, AppliedCache, file_digest, fsync_directory, stream_digest, write_temporary
+from catalog import template_catalog
+from manifest import documents, header, join_documents, skeleton
+from schedule import batches, rank_of, waves
+from timing import Recorder, bound, current_recorder, timed
 import subprocess
 import shlex
 import logging
 import os
 import sys
+import threading
+import time
 
 
-RESOURCES = ["configmap", "deployment", "secret",
+# common resource types of an application; templates of any other type are
+# found as well. The order resources are applied in is worked out by
+# schedule.waves
+RESOURCES = ["configmap", "secret", "deployment",
              "service", "pod", "replicationcontroller",
              "horizontalpodautoscaler", "statefulset"]
 
+# one jinja2 environment (and with it one compiled template cache) per
+# templates directory, shared by all Ausroller instances of the process
+_environments = {}
+_environments_lock = threading.Lock()
+
+
+def template_environment(templates_path, bytecode_cache_path=None):
+    ''' (string, string) -> Environment
+        Returns the shared jinja2 environment for the given templates
+        directory. Compiled templates are kept in memory and, if a
+        bytecode cache path is given, also on disk. Both are invalidated
+        when a template changes.
+    '''
+    from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+    with _environments_lock:
+        env = _environments.get(templates_path)
+        if env is None:
+            bytecode_cache = None
+            if bytecode_cache_path:
+                try:
+                    if not os.path.isdir(bytecode_cache_path):
+                        os.makedirs(bytecode_cache_path)
+                    bytecode_cache = FileSystemBytecodeCache(
+                        bytecode_cache_path)
+                except OSError as e:
+                    logging.warn("Cannot use template cache \"{}\" [{}]".format(
+                        bytecode_cache_path, e))
+            env = Environment(loader=FileSystemLoader(templates_path),
+                              bytecode_cache=bytecode_cache,
+                              cache_size=-1, auto_reload=True)
+            _environments[templates_path] = env
+        return env
+
+
+def ordered(resources):
+    ''' (iterable of strings) -> list of strings
+        Sorts resource types like RESOURCES, followed by all other types
+        in alphabetical order.
+        >>> ordered(['ingress', 'service', 'cronjob', 'configmap'])
+        ['configmap', 'service', 'cronjob', 'ingress']
+    '''
+    return sorted(resources, key=lambda resource: (
+        RESOURCES.index(resource) if resource in RESOURCES else len(RESOURCES),
+        resource))
+
+
+def render_context(env, c):
+    ''' (Environment, Configuration) -> dict
+        Merges the globals of the environment, the secrets, the namespace
+        and the extra variables of a configuration into the variables
+        shared by all templates.
+    '''
+    context = dict(env.globals)
+    context.update(c.variables)
+    context['namespace'] = c.namespace
+    context.update(c.extra_variables)
+    return context
+
+
+def generate(template, context, app_version):
+    ''' (Template, dict, string) -> generator of unicode
+        Renders a template with the shared variables and the version chunk
+        by chunk, so large manifests never have to be held in memory.
+    '''
+    # a shared context refers to the variables instead of copying them
+    template_context = template.new_context(context, shared=True)
+    template_context.vars['app_version'] = app_version
+    chunks = template.root_render_func(template_context)
+    # rendering is interleaved with writing the chunks, so only the time
+    # spent producing them is recorded
+    (started, rendering) = (time.time(), 0.0)
+    try:
+        while True:
+            start = time.time()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            finally:
+                rendering += time.time() - start
+            yield chunk
+    except Exception:
+        template.environment.handle_exception()
+    current_recorder().add('render', started, rendering)
+
+
+def render(template, context, app_version):
+    ''' (Template, dict, string) -> unicode
+        Renders a template with the shared variables and the version.
+    '''
+    return u"".join(generate(template, context, app_version))
+
 
 class Ausroller(object):
 
-    def __init__(self, configurator):
+    def __init__(self, configurator, git_lock=None, kubectl=None,
+                 recorder=None):
         self.c = configurator
-        self.kubectl = KubeCtl(self.c.context, self.c.namespace, self.c.kubectlpath,
-                               (self.c.is_dryrun or
-                                self.c.is_dryrun_but_templates))
+        # collects the phases of this rollout for the history and passes
+        # them on to the recorder of the caller
+        self.recorder = recorder or Recorder(parent=current_recorder())
+        # serializes writing and committing into a shared resources repo
+        self.git_lock = git_lock or threading.Lock()
+        bytecode_cache_path = None
+        if self.c.templatecache:
+            bytecode_cache_path = os.path.join(self.c.cachepath, 'templates')
+        self.env = template_environment(
+            self.c.templates_path, bytecode_cache_path)
+        self.catalog = template_catalog(self.c.templates_path)
+        self._kubectl = kubectl
+        # a dry-run applies nothing, so kubectl is neither loaded nor
+        # verified unless it is used anyway, e.g. by a rollback
+        if self._kubectl is None and not self.c.is_dryrun:
+            with self.recorder.activate():
+                self._kubectl = self.make_kubectl(self.c)
+        self._render_context = None
+        # commit of the rollout, only looked up for the history
+        self.commit_id = None
+        # resources known to be in the cluster, keyed by the target as
+        # several contexts may share the rollout directory
+        self.applied = AppliedCache(os.path.join(self.c.cachepath, 'applied'),
+                                    self.c.context, self.c.namespace)
+        # digests of the resources to apply, recorded once they are applied
+        self.applying = {}
 
-    def render_template(self, resource):
-        env = Environment(
-            loader=FileSystemLoader(os.path.join(self.c.templates_path, resource + 's')))
+    @property
+    def kubectl(self):
+        if self._kubectl is None:
+            with self.recorder.activate():
+                self._kubectl = self.make_kubectl(self.c)
+        return self._kubectl
+
+    @staticmethod
+    def make_kubectl(c):
+        ''' (Configuration) -> KubeCtl
+            Creates a verified KubeCtl for the namespace and context of the
+            given configuration using the configured backend.
+        '''
+        from kube import KubeCtl, VerificationCache
+
+        verify_cache = None
+        if c.verifyttl > 0:
+            verify_cache = VerificationCache(
+                os.path.join(c.cachepath, 'verified.json'),
+                c.verifyttl, c.reverify)
+        dryrun = c.is_dryrun or c.is_dryrun_but_templates
+        if c.backend == 'api':
+            from api import KubeApi
+
+            return KubeApi(c.context, c.namespace, c.kubectlpath, dryrun,
+                           verify_cache=verify_cache,
+                           discovery_cache=os.path.join(c.cachepath,
+                                                        'discovery'))
+        return KubeCtl(c.context, c.namespace, c.kubectlpath, dryrun,
+                       verify_cache=verify_cache)
+
+    def render_context(self):
+        ''' () -> dict
+            Returns the variables shared by all templates of the rollout.
+            They are merged only once as the secrets may be large.
+        '''
+        if self._render_context is None:
+            self._render_context = render_context(self.env, self.c)
+        return self._render_context
+
+    def resource_types(self):
+        ''' () -> list of strings
+            Returns RESOURCES and all other resource types having a
+            template in apply order.
+        '''
+        return ordered(set(RESOURCES) | self.catalog.resources())
+
+    def get_template(self, resource, app_name):
+        from jinja2 import TemplateNotFound
+
+        name = self.catalog.templates(app_name).get(resource)
+        if name is None:
+            logging.debug("No {} template for {}.".format(resource, app_name))
+            return
         try:
-            template = env.get_template(
-                "{}-{}.tpl.yaml".format(self.c.app_name, resource))
-        except exceptions.TemplateNotFound as e:
+            return self.env.get_template(name)
+        except TemplateNotFound as e:
             logging.debug("Template \"{}\" not found.".format(e))
             return
-        return template.render(self.c.variables, app_version=self.c.app_version, namespace=self.c.namespace, **self.c.extra_variables)
 
-    def prepare_k8s_resources(self):
+    def render_template(self, resource, app_name, app_version):
+        template = self.get_template(resource, app_name)
+        if template is None:
+            return
+        return render(template, self.render_context(), app_version)
+
+    def generate_template(self, resource, app_name, app_version):
+        template = self.get_template(resource, app_name)
+        if template is None:
+            return
+        return generate(template, self.render_context(), app_version)
+
+    def prepare_k8s_resources(self, app_name, app_version, resources=None,
+                              stream=False):
+        '''
+        Render the templates of an application, by default of all resource
+        types it has a template of. Returns a dict of the rendered resources;
+        if stream is set they are generators rendering the resources only
+        while they are written.
+        '''
         logging.info("Preparing k8s resources of {} in version {}".format(
-            self.c.app_name, self.c.app_version))
+            app_name, app_version))
+        if resources is None:
+            resources = self.catalog.templates(app_name)
+        render_resource = self.generate_template if stream else \
+            self.render_template
         result_map = {}
-        for resource in RESOURCES:
-            rendered_template = self.render_template(resource)
+        for resource in ordered(resources):
+            rendered_template = render_resource(
+                resource, app_name, app_version)
             if rendered_template:
-                result_map[resource] = self.render_template(resource)
+                result_map[resource] = rendered_template
         if len(result_map) == 0:
-            logging.warn("No templates found for {}".format(self.c.app_name))
+            logging.warn("No templates found for {}".format(app_name))
         return result_map
 
-    def write_k8s_resources(self, resources):
-        repo = repository.GitRepository(self.c.repopath)
-        (repo_is_clean, repo_msg) = repo.is_clean()
-        if not repo_is_clean:
+    def resource_path(self, app_name, resource):
+        return os.path.join(self.c.rollout_path,
+                            self.catalog.directory(resource),
+                            "{}-{}.yaml".format(app_name, resource))
+
+    @staticmethod
+    def is_unchanged(outfile, content):
+        ''' (string, string) -> bool
+            Checks if the given file already holds exactly the given content
+            by comparing size and sha1 digest.
+        '''
+        return Ausroller.holds(outfile, *stream_digest([content]))
+
+    @staticmethod
+    def holds(outfile, size, digest):
+        ''' (string, int, string) -> bool
+            Checks if the given file holds content of the given size and
+            sha1 digest. The file is only read if the size matches.
+        '''
+        try:
+            if os.path.getsize(outfile) != size:
+                return False
+        except OSError:
+            return False
+        return file_digest(outfile) == (size, digest)
+
+    @staticmethod
+    def encoded(content):
+        ''' (unicode or iterable of unicode) -> generator of strings
+            Returns the chunks of a rendered resource encoded as UTF-8.
+        '''
+        if isinstance(content, basestring):
+            content = [content]
+        return (chunk.encode('utf-8') for chunk in content)
+
+    @staticmethod
+    def make_directory(outdir, resource):
+        if not os.path.exists(outdir):
+            try:
+                os.makedirs(outdir)
+            except OSError:
+                # this is still not completely safe as we could run
+                # into a (next) race-condition, but it is suitable for
+                # out needs
+                if not os.path.exists(outdir):
+                    logging.error(
+                        "Can not create rollout directory for resource \"{}\"".format(resource))
+
+    @timed('write')
+    def write_k8s_resources(self, rollouts):
+        '''
+        Write the rendered resources of all given (app, version, resources)
+        rollouts and commit them at once. Resources which are identical to
+        the already committed ones are not written again and only applied
+        if they were not applied to the target yet (or forced). Returns a
+        list of (app, resource names to apply) pairs.
+
+        Resources may be given as generators; they are streamed into
+        temporary files which are only renamed into place once all
+        resources are rendered, followed by one fsync per directory.
+        Rendering does not need the git lock, so targets sharing the
+        repository render concurrently.
+        '''
+        repo = None
+        if not self.c.is_dryrun:
+            from repo import RolloutRepository
+
+            repo = RolloutRepository(self.c.repopath)
+
+        # (app, resource, resource file, temporary file, size, digest)
+        rendered = []
+        try:
+            for (app_name, app_version, resources) in rollouts:
+                for resource in ordered(resources):
+                    outfile = self.resource_path(app_name, resource)
+                    chunks = self.encoded(resources[resource])
+                    if self.c.is_dryrun:
+                        tmpfile = None
+                        (size, digest) = stream_digest(chunks)
+                    else:
+                        self.make_directory(os.path.dirname(outfile), resource)
+                        (tmpfile, size, digest) = write_temporary(outfile, chunks)
+                    rendered.append((app_name, resource, outfile, tmpfile,
+                                     size, digest))
+            with self.git_lock:
+                return self.publish(repo, rollouts, rendered)
+        finally:
+            # temporary files which were not renamed into place
+            for (_, _, _, tmpfile, _, _) in rendered:
+                if tmpfile and os.path.exists(tmpfile):
+                    os.unlink(tmpfile)
+
+    def publish(self, repo, rollouts, rendered):
+        '''
+        Rename the rendered files which changed into place and commit them.
+        Has to be called with the git lock held.
+        '''
+        if repo and not repo.is_clean(ignore=TEMPORARY_NAME):
             logging.error("Git repo is not in a clean state! Exiting..")
             sys.exit(1)
 
-        if not self.c.is_dryrun:
-            files_to_commit = []
-            for resource in resources.keys():
-                # make sure path exists
-                outdir = os.path.join(
-                    self.c.rollout_path, "{}s".format(resource))
-                if not os.path.exists(outdir):
-                    try:
-                        os.makedirs(outdir)
-                    except OSError:
-                        # this is still not completely safe as we could run
-                        # into a (next) race-condition, but it is suitable for
-                        # out needs
-                        if not os.path.exists(outdir):
-                            logging.error(
-                                "Can not create rollout directory for resource \"{}\"".format(resource))
-
-                outfile = os.path.join(
-                    outdir, "{}-{}.yaml".format(self.c.app_name, resource))
-                with open(outfile, 'w') as out:
-                    out.write(resources[resource])
-                    # flush & sync to avoid git adding an empty file
-                    out.flush()
-                    os.fsync(out)
-                    repo.add_files(outfile)
+        to_apply = dict((app_name, []) for (app_name, _, _) in rollouts)
+        self.applying = {}
+        files_to_commit = []
+        directories = set()
+        (changed, unchanged) = (0, 0)
+        for (app_name, resource, outfile, tmpfile, size, digest) in rendered:
+            if size == 0:
+                logging.debug("{} is empty".format(outfile))
+                continue
+            if self.holds(outfile, size, digest):
+                unchanged += 1
+                if not self.c.force_apply and \
+                        self.applied.is_applied(outfile, digest):
+                    logging.debug("{} is unchanged".format(outfile))
+                    continue
+                logging.debug("{} is unchanged but not applied to {}@{}".format(
+                    outfile, self.c.namespace, self.c.context))
+            else:
+                changed += 1
+                if tmpfile:
+                    os.rename(tmpfile, outfile)
+                    directories.add(os.path.dirname(outfile))
+                    current_recorder().count('bytes written', size)
                     files_to_commit.append(outfile)
-            self.commit_rollout(files_to_commit)
-        else:
-            logging.info(
-                "Dry-run: skip writing files for {}".format(resources.keys()))
-        return resources.keys()
+            to_apply[app_name].append(resource)
+            self.applying[outfile] = digest
+        # the renames have to be durable before they are committed
+        for directory in sorted(directories):
+            fsync_directory(directory)
 
-    def commit_rollout(self, files_to_commit):
-        repo = repository.GitRepository(self.c.repopath)
-        (repo_is_clean, repo_msg) = repo.is_clean()
+        written = []
+        for (app_name, _, _) in rollouts:
+            if self.c.is_dryrun:
+                logging.info("Dry-run: skip writing files of {} for {}".format(
+                    app_name, to_apply[app_name]))
+            written.append((app_name, to_apply[app_name]))
+        logging.info("{} changed, {} unchanged".format(changed, unchanged))
+        if not self.c.is_dryrun:
+            self.commit_rollout(repo, files_to_commit, rollouts)
+            if self.c.historyfile and not self.c.is_dryrun_but_templates:
+                # the commit holding the manifests rolled out
+                self.commit_id = repo.resolve('HEAD')
+        self.git_subprocesses = repo.subprocess_count if repo else 0
+        logging.debug("Spawned {} git subprocesses".format(
+            self.git_subprocesses))
+        return written
 
+    def commit_message(self, rollouts):
+        if len(rollouts) == 1:
+            (app_name, app_version, _) = rollouts[0]
+            subject = "Created rollout for {} with version {}".format(
+                app_name, app_version)
+        else:
+            subject = "Created rollout for {} applications\n\n{}".format(
+                len(rollouts),
+                "\n".join("{}: {}".format(app_name, app_version)
+                          for (app_name, app_version, _) in rollouts))
+        return "[{}] {}\n\n{}".format(self.c.namespace, subject,
+                                      self.c.commit_message)
+
+    @timed('commit')
+    def commit_rollout(self, repo, files_to_commit, rollouts):
+        '''
+        Stage and commit all written files of the rollouts with one git call
+        each. Only changed files are written, so there is nothing to commit
+        if the list is empty.
+        '''
         if len(files_to_commit) == 0:
-            logging.warn("Nothing to commit.")
+            logging.warn(
+                "Definition of rollout already exists. Nothing changed.")
+            return
+
+        if self.c.is_dryrun or self.c.is_dryrun_but_templates:
+            repo.stage(files_to_commit)
+            logging.debug("Dry run: skipping commit")
             return
 
-        if not repo_is_clean:
+        repo.commit(files_to_commit, self.commit_message(rollouts))
+
+    def apply_wave(self, resourcefiles):
+        '''
+        Apply resource files with one kubectl call, or independent ones
+        with up to apply_parallel concurrent calls, and return the names of
+        the applied objects.
+        '''
+        calls = min(self.c.apply_parallel, len(resourcefiles))
+        if calls == 1:
+            return self.kubectl.apply_resourcefiles(resourcefiles)
+        from multiprocessing.pool import ThreadPool
+
+        pool = ThreadPool(calls)
+        try:
+            results = pool.map(bound(self.kubectl.apply_resourcefiles),
+                               [resourcefiles[i::calls] for i in range(calls)])
+        finally:
+            pool.close()
+            pool.join()
+        return [name for names in results for name in names]
+
+    @timed('apply')
+    def rollout(self, written):
+        nodes = []
+        for (app_name, resources) in written:
             if self.c.is_dryrun or self.c.is_dryrun_but_templates:
-                logging.debug("Dry run: skipping commit")
-                return
-
-            repo.commit_files(files_to_commit,
-                              "[{}] Created rollout for {} with version {}\n\n{}".format(
-                                  self.c.namespace,
-                                  self.c.app_name,
-                                  self.c.app_version,
-                                  self.c.commit_message))
-            logging.debug("Commited changes:\n{}".format(
-                repo.show(self.c.rollout_path)))
-        else:
-            logging.warn(
-                "Definition of rollout already exists. Nothing changed.")
+                logging.info("Dry-run: skip applying changes of {} to Kubernetes".format(
+                    app_name))
+            else:
+                logging.info("Rolling out resources {} of {}".format(
+                    resources, app_name))
+            for resource in ordered(resources):
+                resourcefile = self.resource_path(app_name, resource)
+                try:
+                    with open(resourcefile) as f:
+                        if rank_of(resource) == 0:
+                            # config maps and secrets are only referred to,
+                            # so their possibly large data is not needed
+                            content = "".join(skeleton(f))
+                        else:
+                            content = f.read()
+                except IOError:
+                    # not written in a dry-run
+                    content = ""
+                nodes.append((app_name, resource, content))
 
-    def rollout(self, resources):
-        if len(resources) == 0:
+        if len(nodes) == 0:
             logging.warn("No resource to roll out.")
-            return
+            return []
 
-        if self.c.is_dryrun or self.c.is_dryrun_but_templates:
-            logging.info("Dry-run: skip applying changes to Kubernetes")
+        # resources only wait for the resources they depend on; unless
+        # asked to apply waves concurrently as few kubectl calls as possible
+        # are started
+        if self.c.apply_parallel > 1:
+            groups = waves(nodes)
         else:
-            logging.info("Rolling out resources {}".format(resources))
-        for resource in resources:
-            resourcefile = os.path.join(self.c.rollout_path,
-                                        "{}s".format(resource),
-                                        "{}-{}.yaml".format(
-                                            self.c.app_name,
-                                            resource))
+            groups = batches(nodes)
+        groups = [[self.resource_path(nodes[index][0], nodes[index][1])
+                   for index in group] for group in groups]
+        for (number, resourcefiles) in enumerate(groups, 1):
+            logging.debug("Applying batch {}: {}".format(
+                number, ", ".join(resourcefiles)))
+        if self.c.is_dryrun:
+            return []
+        from kube import KubeCtlException
+
+        names = []
+        for resourcefiles in groups:
             try:
-                self.kubectl.apply_resourcefile(resourcefile)
+                names.extend(self.apply_wave(resourcefiles))
             except KubeCtlException as e:
                 logging.error("Rolling out failed. [{}]".format(e))
                 sys.exit(1)
+        return names
 
-    def deploy(self):
+    @timed('wait')
+    def wait(self, names):
         '''
-        Prepare, write and rollout the k8s resources
+        Wait for the rollout of all applied workloads
         '''
-        # render all templates for the given application
-        resources = self.prepare_k8s_resources()
+        from watch import RolloutWatcher
 
-        # write rendered templates as filesystem
-        res_names = self.write_k8s_resources(resources)
+        watcher = RolloutWatcher(self.kubectl, self.c.wait_timeout)
+        if not watcher.watch(names):
+            logging.error("Waiting for the rollout failed.")
+            sys.exit(1)
+
+    @timed('diff')
+    def diff(self, rollouts):
+        '''
+        Compare the rendered resources of all given (app, version, resources)
+        rollouts with the cluster using a single kubectl call. Nothing is
+        written or applied. Returns a list of (app, resource, object,
+        status) with status "changed", "new" or "unchanged".
+        '''
+        from kube import KubeCtlException, diff_objects, is_diff_object
+
+        objects = []
+        contents = []
+        for (app_name, _, resources) in rollouts:
+            for resource in ordered(resources):
+                contents.append(resources[resource])
+                for document in documents(resources[resource]):
+                    (kind, name) = header(document)
+                    if kind and name:
+                        objects.append((app_name, resource, kind, name))
+        if not contents:
+            logging.warn("No resource to compare.")
+            return []
+
+        try:
+            output = self.kubectl.diff_manifests(
+                join_documents(contents).encode('utf-8'))
+        except KubeCtlException as e:
+            logging.error("Comparing with the cluster failed. [{}]".format(e))
+            sys.exit(1)
+        logging.debug(output)
+        differences = diff_objects(output)
+
+        results = []
+        for (app_name, resource, kind, name) in objects:
+            status = 'unchanged'
+            for (filename, change) in differences.items():
+                if is_diff_object(filename, kind, name):
+                    status = change
+            logging.info("{}: {} {}/{}".format(app_name, status, kind, name))
+            results.append((app_name, resource, "{}/{}".format(kind, name),
+                            status))
+        statuses = [status for (_, _, _, status) in results]
+        logging.info("{} changed, {} new, {} unchanged".format(
+            statuses.count('changed'), statuses.count('new'),
+            statuses.count('unchanged')))
+        return results
+
+    def deploy(self, selection=None):
+        '''
+        Prepare, write and rollout the k8s resources of all configured
+        applications. An optional selection maps applications to the
+        resource types to roll out; by default all types are rolled out.
+        '''
+        with self.recorder.activate():
+            self._deploy(selection)
+
+    def _deploy(self, selection):
+        # find the templates of the given applications; unless comparing
+        # with the cluster they are rendered while they are written
+        rollouts = []
+        for (app_name, app_version) in self.c.apps:
+            resources = self.prepare_k8s_resources(
+                app_name, app_version,
+                selection[app_name] if selection is not None else None,
+                stream=not self.c.diff)
+            rollouts.append((app_name, app_version, resources))
 
-        # rollout kubernetes resources
-        self.rollout(res_names)
+        if self.c.diff:
+            self.diff(rollouts)
+            return
+
+        written = []
+        outcome = 'failed'
+        try:
+            # write rendered templates as filesystem and commit them at once
+            written = self.write_k8s_resources(rollouts)
+
+            # rollout kubernetes resources
+            names = self.rollout(written)
+            if not self.c.is_dryrun and not self.c.is_dryrun_but_templates:
+                self.applied.store(self.applying)
+
+            if self.c.wait and names:
+                self.wait(names)
+            outcome = 'succeeded'
+        finally:
+            self.record_history(outcome, written)
+
+    def record_history(self, outcome, written):
+        '''
+        Append the rollout with the duration of each of its phases to the
+        local history unless it is disabled or a dry-run.
+        '''
+        if not self.c.historyfile or self.c.is_dryrun or \
+                self.c.is_dryrun_but_templates:
+            return
+        from history import History, HistoryError
+
+        changed = dict(written)
+        rollouts = [(app_name, app_version, changed.get(app_name, []))
+                    for (app_name, app_version) in self.c.apps]
+        try:
+            history = History(self.c.historyfile)
+            try:
+                history.record(self.recorder.started, self.c.namespace,
+                               self.c.context, self.commit_id, outcome,
+                               rollouts, self.recorder.phases())
+            finally:
+                history.close()
+        except HistoryError as e:
+            logging.warn(e)
@@ -0,0 +1,365 @@
+# encoding: utf-8
+
+from config import Configuration
+from kube import KubeCtl, KubeCtlException
+from decimal import Decimal
+from manifest import documents, fields
+import argparse
+import base64
+import json
+import logging
+import os
+import re
+import sys
+
+try:
+    import yaml
+except ImportError:
+    # without PyYAML only images, missing and extra objects are compared
+    yaml = None
+
+LAST_APPLIED = 'kubectl.kubernetes.io/last-applied-configuration'
+IMAGE = re.compile(r"^\s*(?:- )?image:\s*[\"']?([^\"'\s#]+)", re.MULTILINE)
+# objects the cluster creates in every namespace by itself
+CLUSTER_OBJECTS = frozenset([('ConfigMap', 'kube-root-ca.crt'),
+                             ('Service', 'kubernetes')])
+# differences are reported in this order, image changes first
+CATEGORIES = ['image', 'missing', 'modified', 'extra']
+# maps of resource quantities, which the cluster stores canonicalized
+QUANTITY_MAPS = frozenset(['limits', 'requests', 'hard', 'default',
+                           'defaultRequest', 'max', 'min'])
+QUANTITY = re.compile(r"^([+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+))"
+                      r"(?:[eE]([+-]?[0-9]+)|([KMGTPE]i|[numkMGTPE]))?$")
+DECIMAL_SUFFIXES = {'n': -9, 'u': -6, 'm': -3, 'k': 3, 'M': 6, 'G': 9,
+                    'T': 12, 'P': 15, 'E': 18}
+BINARY_SUFFIXES = {'Ki': 10, 'Mi': 20, 'Gi': 30, 'Ti': 40, 'Pi': 50, 'Ei': 60}
+
+
+def resource_argument(api_version, kind):
+    ''' (string, string) -> string
+        Returns the fully qualified resource kubectl get expects for a kind.
+        >>> resource_argument('apps/v1', 'Deployment')
+        'deployment.v1.apps'
+        >>> resource_argument('v1', 'ConfigMap')
+        'configmap'
+    '''
+    (group, _, version) = api_version.rpartition('/')
+    if not group:
+        return kind.lower()
+    return "{}.{}.{}".format(kind.lower(), version, group)
+
+
+def images_of(value):
+    ''' (object) -> list of strings
+        Returns all container images of a live object.
+        >>> images_of({'spec': {'containers': [{'image': 'b:1'}], 'initContainers': [{'image': 'a:2'}]}})
+        ['a:2', 'b:1']
+    '''
+    images = []
+    if isinstance(value, dict):
+        for (key, child) in value.items():
+            if key == 'image' and isinstance(child, basestring):
+                images.append(child)
+            else:
+                images.extend(images_of(child))
+    elif isinstance(value, list):
+        for child in value:
+            images.extend(images_of(child))
+    return sorted(images)
+
+
+def quantity(value):
+    ''' (object) -> Decimal
+        Returns the amount of a resource quantity, given as a number or
+        a string like "500m" or "1Gi", or None if it is none.
+        >>> quantity(0.5) == quantity("500m"), quantity("1Gi") == quantity("1024Mi")
+        (True, True)
+        >>> quantity(1) == quantity("1"), quantity("1e3") == quantity("1k"), quantity("a")
+        (True, True, None)
+    '''
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, long, float)):
+        return Decimal(str(value))
+    match = QUANTITY.match(value) if isinstance(value, basestring) else None
+    if not match:
+        return None
+    (number, exponent, suffix) = match.groups()
+    if suffix in BINARY_SUFFIXES:
+        return Decimal(number) * 2 ** BINARY_SUFFIXES[suffix]
+    return Decimal(number).scaleb(
+        int(exponent or 0) + DECIMAL_SUFFIXES.get(suffix, 0))
+
+
+def with_quantities(value):
+    ''' (object) -> object
+        Returns a copy of an object with the values of its quantity maps,
+        e.g. resources.limits, replaced by their amounts.
+        >>> with_quantities({'resources': {'limits': {'cpu': 1, 'memory': 'x'}}})
+        {'resources': {'limits': {'cpu': Decimal('1'), 'memory': 'x'}}}
+    '''
+    if isinstance(value, list):
+        return [with_quantities(child) for child in value]
+    if not isinstance(value, dict):
+        return value
+    result = {}
+    for (key, child) in value.items():
+        if key in QUANTITY_MAPS and isinstance(child, dict):
+            child = dict((name, quantity(amount)
+                          if quantity(amount) is not None else amount)
+                         for (name, amount) in child.items())
+        result[key] = with_quantities(child)
+    return result
+
+
+def normalized(manifest):
+    ''' (dict) -> dict
+        Returns an object without status and without the metadata the
+        cluster maintains. Quantities are compared by their amount and the
+        stringData of secrets as the data the cluster stores it as.
+    '''
+    result = dict((key, value) for (key, value)
+                  in with_quantities(manifest).items()
+                  if key not in ('status', 'stringData'))
+    if manifest.get('kind') == 'Secret' and manifest.get('stringData'):
+        data = dict(manifest.get('data') or {})
+        for (key, value) in manifest['stringData'].items():
+            if not isinstance(value, basestring):
+                value = str(value)
+            data[key] = base64.b64encode(value.encode('utf-8'))
+        result['data'] = data
+    metadata = manifest.get('metadata') or {}
+    result['metadata'] = {'name': metadata.get('name')}
+    if metadata.get('labels'):
+        result['metadata']['labels'] = metadata['labels']
+    annotations = dict((key, value) for (key, value)
+                       in (metadata.get('annotations') or {}).items()
+                       if key != LAST_APPLIED)
+    if annotations:
+        result['metadata']['annotations'] = annotations
+    return result
+
+
+def changed_paths(desired, live, subset=False, prefix=''):
+    ''' (object, object, bool, string) -> list of strings
+        Returns the paths of the values which differ between two objects.
+        With subset only the values given in desired are compared, e.g.
+        because live also holds the defaults of the cluster.
+        >>> changed_paths({'a': 1, 'b': {'c': 2, 'd': 3}}, {'a': 1, 'b': {'c': 4}})
+        ['b.c', 'b.d']
+        >>> changed_paths({'b': [{'c': 2}]}, {'a': 1, 'b': [{'c': 2, 'e': 5}]}, subset=True)
+        []
+    '''
+    if isinstance(desired, dict) and isinstance(live, dict):
+        keys = set(desired) if subset else set(desired) | set(live)
+        paths = []
+        for key in sorted(keys):
+            paths.extend(changed_paths(desired.get(key), live.get(key), subset,
+                                       "{}.{}".format(prefix, key) if prefix else key))
+        return paths
+    if subset and isinstance(desired, list) and isinstance(live, list) and \
+            len(desired) == len(live):
+        paths = []
+        for (index, (mine, theirs)) in enumerate(zip(desired, live)):
+            paths.extend(changed_paths(mine, theirs, subset,
+                                       "{}[{}]".format(prefix, index)))
+        return paths
+    return [] if desired == live else [prefix]
+
+
+class Drift(object):
+    '''
+    Compares the manifests committed below rollout/<namespace> with the
+    objects in the namespace. Live objects are read with one kubectl call
+    for all kinds.
+    '''
+
+    def __init__(self, kubectl, rollout_path):
+        self.kubectl = kubectl
+        self.rollout_path = rollout_path
+
+    def manifest_files(self):
+        files = []
+        for (dirpath, dirnames, filenames) in os.walk(self.rollout_path):
+            dirnames.sort()
+            files.extend(os.path.join(dirpath, filename)
+                         for filename in sorted(filenames)
+                         if filename.endswith('.yaml'))
+        return files
+
+    @staticmethod
+    def parse(path, document):
+        if yaml is None:
+            return None
+        try:
+            return yaml.safe_load(document)
+        except yaml.YAMLError as e:
+            logging.warn("Cannot parse a document of \"{}\" [{}]".format(path, e))
+            return None
+
+    def desired(self):
+        ''' () -> dict
+            Maps (kind, name) of every committed object to its apiVersion,
+            images and, if PyYAML is installed, the parsed object.
+        '''
+        objects = {}
+        for path in self.manifest_files():
+            with open(path) as f:
+                content = f.read().decode('utf-8')
+            for document in documents(content):
+                manifest = fields(document)
+                if 'kind' not in manifest or 'name' not in manifest:
+                    logging.warn("Skipping a document without kind or name in \"{}\"".format(path))
+                    continue
+                if manifest.get('namespace', self.kubectl.namespace) != \
+                        self.kubectl.namespace:
+                    logging.debug("Skipping {}/{} of namespace {}".format(
+                        manifest['kind'], manifest['name'],
+                        manifest['namespace']))
+                    continue
+                objects[(manifest['kind'], manifest['name'])] = {
+                    'apiVersion': manifest.get('apiVersion', 'v1'),
+                    'images': sorted(IMAGE.findall(document)),
+                    'object': self.parse(path, document)}
+        return objects
+
+    def live(self, resources):
+        ''' (iterable of strings) -> dict
+            Maps (kind, name) of the live objects of the given resources to
+            the objects.
+        '''
+        output = self.kubectl.get(",".join(sorted(resources)), "json")
+        items = json.loads(output or '{}').get('items', [])
+        return dict(((item.get('kind'), item['metadata']['name']), item)
+                    for item in items)
+
+    @staticmethod
+    def is_managed_elsewhere(key, item):
+        metadata = item.get('metadata', {})
+        return key in CLUSTER_OBJECTS or bool(metadata.get('ownerReferences')) \
+            or item.get('type') == 'kubernetes.io/service-account-token'
+
+    @staticmethod
+    def modification(desired, item):
+        ''' (dict, dict) -> list of strings
+            Returns the paths in which a live object differs from the
+            committed one: values changed in the cluster, e.g. by kubectl
+            edit, and values added or removed by applying another manifest
+            as far as kubectl apply recorded it.
+        '''
+        if desired['object'] is None:
+            return []
+        manifest = normalized(desired['object'])
+        paths = set(changed_paths(manifest, normalized(item), subset=True))
+        applied = item.get('metadata', {}).get('annotations', {}).get(
+            LAST_APPLIED)
+        if applied:
+            paths.update(changed_paths(manifest,
+                                       normalized(json.loads(applied))))
+        return sorted(paths)
+
+    def compare(self):
+        ''' () -> (int, list of tuples)
+            Returns the number of committed objects and (category, kind,
+            name, detail) of every difference.
+        '''
+        desired = self.desired()
+        if not desired:
+            return (0, [])
+        live = self.live(set(resource_argument(manifest['apiVersion'], kind)
+                             for ((kind, _), manifest) in desired.items()))
+
+        differences = []
+        for (key, manifest) in sorted(desired.items()):
+            (kind, name) = key
+            item = live.get(key)
+            if item is None:
+                differences.append(('missing', kind, name, ''))
+                continue
+            images = images_of(item.get('spec', {}))
+            if manifest['images'] != images:
+                differences.append(('image', kind, name, "{} (live {})".format(
+                    ", ".join(manifest['images']), ", ".join(images))))
+                continue
+            paths = self.modification(manifest, item)
+            if paths:
+                differences.append(('modified', kind, name, ", ".join(paths)))
+        for (key, item) in sorted(live.items()):
+            if key not in desired and not self.is_managed_elsewhere(key, item):
+                differences.append(('extra', key[0], key[1], ''))
+        return (len(desired), differences)
+
+
+def drift(argv):
+    parser = argparse.ArgumentParser(
+        prog='ausroller drift',
+        description='Compare the manifests committed in rollout/ with the cluster')
+    parser.add_argument('-c', '--config', type=str, default='',
+                        help='Path to config file [$HOME/.ausroller.ini]')
+    parser.add_argument('-C', '--context', type=str, required=True,
+                        help='Kubernetes context to compare with')
+    parser.add_argument('-n', '--namespace', type=str, action='append',
+                        help='Only compare this namespace; may be given multiple times [all namespaces in rollout/]')
+    parser.add_argument('-P', '--max-parallel', type=int, default=4,
+                        help='Maximal number of namespaces compared at the same time [4]')
+    parser.add_argument('-V', '--verbose', action='store_true',
+                        help='Be verbose; print debug messages')
+    args = parser.parse_args(argv)
+    if args.max_parallel < 1:
+        parser.error("--max-parallel has to be at least 1")
+    logging.basicConfig(format='%(levelname)s: %(message)s',
+                        level=logging.DEBUG if args.verbose else logging.WARN)
+
+    c = Configuration()
+    c.configfile = args.config
+    c.context = args.context
+    c.read_settings()
+    rollout_path = os.path.join(c.repopath, 'rollout')
+    namespaces = args.namespace
+    if not namespaces and os.path.isdir(rollout_path):
+        namespaces = sorted(
+            namespace for namespace in os.listdir(rollout_path)
+            if os.path.isdir(os.path.join(rollout_path, namespace)))
+    if not namespaces:
+        print("Nothing committed in \"{}\" to compare".format(rollout_path))
+        return
+    if yaml is None:
+        logging.info("PyYAML is not installed, only comparing images")
+
+    def compare(namespace):
+        kubectl = KubeCtl(c.context, namespace, c.kubectlpath,
+                          skip_verify=True)
+        try:
+            return Drift(kubectl, os.path.join(rollout_path, namespace)).compare()
+        except (KubeCtlException, ValueError, KeyError) as e:
+            logging.error("Comparing namespace {} failed. [{}]".format(
+                namespace, e))
+            return None
+
+    from multiprocessing.pool import ThreadPool
+
+    pool = ThreadPool(max(1, min(args.max_parallel, len(namespaces))))
+    try:
+        results = pool.map(compare, namespaces)
+    finally:
+        pool.close()
+        pool.join()
+
+    lines = []
+    counts = dict((category, 0) for category in CATEGORIES)
+    for (namespace, result) in zip(namespaces, results):
+        if result is None:
+            continue
+        for (category, kind, name, detail) in result[1]:
+            counts[category] += 1
+            lines.append((CATEGORIES.index(category), namespace, kind, name,
+                          category, detail))
+    for (_, namespace, kind, name, category, detail) in sorted(lines):
+        print(u"{} {} {}/{}{}".format(namespace, category, kind, name,
+                                      ": " + detail if detail else "").encode('utf-8'))
+    print("Compared {} objects in {} namespaces: {}".format(
+        sum(result[0] for result in results if result),
+        len(namespaces), ", ".join("{} {}".format(counts[category], category)
+                                   for category in CATEGORIES)))
+    if lines or None in results:
+        sys.exit(1)
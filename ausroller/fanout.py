@@ -0,0 +1,71 @@
+# encoding: utf-8
+
+from core import Ausroller
+from timing import Recorder, bound, current_recorder
+import logging
+import os
+import threading
+
+
+class FanOut(object):
+    '''
+    Rolls out the configured applications to several namespace/context
+    targets concurrently. Targets sharing a resources repository write and
+    commit one after another; targets of different contexts sharing a
+    rollout directory each apply the resources, as what was applied is
+    remembered per target.
+    '''
+
+    def __init__(self, configurator):
+        self.c = configurator
+        self._git_locks = {}
+        self._git_locks_lock = threading.Lock()
+
+    def git_lock(self, repopath):
+        with self._git_locks_lock:
+            return self._git_locks.setdefault(os.path.realpath(repopath),
+                                              threading.Lock())
+
+    def deploy_target(self, target):
+        ''' (tuple) -> bool
+            Rolls out to a single (namespace, context) target and returns
+            whether it succeeded. Failures never propagate to other targets.
+        '''
+        (namespace, context) = target
+        logging.info("Starting rollout to {}@{}".format(namespace, context))
+        try:
+            c = self.c.for_target(namespace, context)
+            r = Recorder(parent=current_recorder())
+            with r.activate():
+                c.read_config()
+                Ausroller(c, git_lock=self.git_lock(c.repopath),
+                          recorder=r).deploy()
+        except SystemExit:
+            # the reason has already been logged
+            logging.error("Rollout to {}@{} failed.".format(namespace, context))
+            return False
+        except Exception as e:
+            logging.error("Rollout to {}@{} failed. [{}]".format(
+                namespace, context, e))
+            return False
+        return True
+
+    def deploy(self):
+        ''' () -> list of tuples
+            Rolls out to all targets with at most max_parallel targets at a
+            time and returns a list of ((namespace, context), succeeded).
+        '''
+        from multiprocessing.pool import ThreadPool
+
+        pool = ThreadPool(min(self.c.max_parallel, len(self.c.targets)))
+        try:
+            results = pool.map(bound(self.deploy_target), self.c.targets)
+        finally:
+            pool.close()
+            pool.join()
+        for ((namespace, context), succeeded) in zip(self.c.targets, results):
+            if succeeded:
+                logging.info("{}@{}: succeeded".format(namespace, context))
+            else:
+                logging.error("{}@{}: failed".format(namespace, context))
+        return zip(self.c.targets, results)
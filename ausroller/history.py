@@ -0,0 +1,236 @@
+# encoding: utf-8
+
+from config import Configuration
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+# runs are only ever appended; the indices keep the queries independent of
+# the number of recorded runs
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    namespace TEXT NOT NULL,
+    context TEXT NOT NULL,
+    commit_id TEXT,
+    duration REAL NOT NULL,
+    outcome TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rollouts (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    app TEXT NOT NULL,
+    version TEXT NOT NULL,
+    resources TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS phases (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    name TEXT NOT NULL,
+    calls INTEGER NOT NULL,
+    total REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_context ON runs (context, namespace, id);
+CREATE INDEX IF NOT EXISTS rollouts_by_run ON rollouts (run_id, app);
+CREATE INDEX IF NOT EXISTS rollouts_by_app ON rollouts (app, run_id);
+CREATE INDEX IF NOT EXISTS phases_by_run ON phases (run_id);
+"""
+
+
+# outcomes of runs after which the recorded versions are in the cluster
+DEPLOYED = ('succeeded', 'rolled back')
+
+
+class HistoryError(Exception):
+    pass
+
+
+def percentile(values, p):
+    ''' (list of numbers, int) -> number
+        Returns the p-th percentile of sorted values by the nearest rank.
+        >>> percentile([1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 50)
+        5
+        >>> percentile([1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 95)
+        10
+    '''
+    rank = -(-len(values) * p // 100)
+    return values[max(rank, 1) - 1]
+
+
+class History(object):
+    '''
+    Local append-only record of all rollouts and rollbacks: applications
+    and versions, changed resources, the resulting commit, the outcome and
+    the duration of every phase.
+    '''
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            # concurrent rollouts wait for each other's writes
+            self.db = sqlite3.connect(path, timeout=30)
+            self.db.executescript(SCHEMA)
+        except (OSError, sqlite3.Error) as e:
+            raise HistoryError("Cannot open history \"{}\" [{}]".format(path, e))
+
+    def close(self):
+        self.db.close()
+
+    def record(self, started, namespace, context, commit_id, outcome,
+               rollouts, phases, finished=None):
+        ''' (float, string, string, string, string, list of tuples, list of tuples, float) -> int
+            Appends a run with its (app, version, changed resources)
+            rollouts and (phase, calls, total duration) phases and returns
+            its id.
+        '''
+        finished = finished or time.time()
+        try:
+            with self.db:
+                run_id = self.db.execute(
+                    "INSERT INTO runs (started, namespace, context, commit_id,"
+                    " duration, outcome) VALUES (?, ?, ?, ?, ?, ?)",
+                    (started, namespace, context, commit_id,
+                     finished - started, outcome)).lastrowid
+                self.db.executemany(
+                    "INSERT INTO rollouts VALUES (?, ?, ?, ?)",
+                    [(run_id, app_name, app_version, json.dumps(resources))
+                     for (app_name, app_version, resources) in rollouts])
+                self.db.executemany(
+                    "INSERT INTO phases VALUES (?, ?, ?, ?)",
+                    [(run_id, name, calls, total)
+                     for (name, calls, total) in phases])
+        except sqlite3.Error as e:
+            raise HistoryError("Cannot record rollout [{}]".format(e))
+        return run_id
+
+    @staticmethod
+    def _filter(context, namespace, app_name):
+        conditions = ["runs.context = ?"]
+        parameters = [context]
+        if namespace:
+            conditions.append("runs.namespace = ?")
+            parameters.append(namespace)
+        if app_name:
+            conditions.append("rollouts.app = ?")
+            parameters.append(app_name)
+        return (" AND ".join(conditions), parameters)
+
+    def latest(self, context, namespace=None, app_name=None):
+        ''' (string, string, string) -> list of tuples
+            Returns (namespace, app, version, commit id, finished) of the
+            last successful rollout or rollback of every application and
+            namespace.
+        '''
+        (conditions, parameters) = self._filter(context, namespace, app_name)
+        parameters = list(DEPLOYED) + parameters
+        # SQLite takes the other columns from the row with the maximum
+        return [(namespace, app_name, version, commit_id, finished)
+                for (namespace, app_name, version, commit_id, finished, _)
+                in self.db.execute(
+                    "SELECT runs.namespace, rollouts.app, rollouts.version,"
+                    " runs.commit_id, runs.started + runs.duration,"
+                    " max(runs.id) FROM runs"
+                    " JOIN rollouts ON rollouts.run_id = runs.id"
+                    " WHERE runs.outcome IN (?, ?) AND " + conditions +
+                    " GROUP BY runs.namespace, rollouts.app"
+                    " ORDER BY runs.namespace, rollouts.app", parameters)]
+
+    def versions(self, context, namespace, commit_id):
+        ''' (string, string, string) -> dict
+            Maps the applications to the versions deployed with the given
+            commit of the resources repository.
+        '''
+        return dict(self.db.execute(
+            "SELECT rollouts.app, rollouts.version FROM runs"
+            " JOIN rollouts ON rollouts.run_id = runs.id"
+            " WHERE runs.outcome IN (?, ?) AND runs.context = ? AND"
+            " runs.namespace = ? AND runs.commit_id = ? ORDER BY runs.id",
+            list(DEPLOYED) + [context, namespace, commit_id]))
+
+    def durations(self, context, namespace=None, app_name=None, last=100):
+        ''' (string, string, string, int) -> dict
+            Returns the durations of the last successful rollouts, overall as
+            "total" and of each phase, sorted ascending.
+        '''
+        (conditions, parameters) = self._filter(context, namespace, app_name)
+        runs = self.db.execute(
+            "SELECT DISTINCT runs.id, runs.duration FROM runs"
+            " JOIN rollouts ON rollouts.run_id = runs.id"
+            " WHERE runs.outcome = 'succeeded' AND " + conditions +
+            " ORDER BY runs.id DESC LIMIT ?", parameters + [last]).fetchall()
+        if not runs:
+            return {}
+        result = {'total': sorted(duration for (_, duration) in runs)}
+        for (name, total) in self.db.execute(
+                "SELECT name, total FROM phases WHERE run_id IN ({})".format(
+                    ", ".join("?" * len(runs))),
+                [run_id for (run_id, _) in runs]):
+            result.setdefault(name, []).append(total)
+        for durations in result.values():
+            durations.sort()
+        return result
+
+
+def history(argv):
+    parser = argparse.ArgumentParser(
+        prog='ausroller history',
+        description='Query the history of rollouts recorded on this machine')
+    parser.add_argument('-c', '--config', type=str, default='',
+                        help='Path to config file [$HOME/.ausroller.ini]')
+    parser.add_argument('-C', '--context', type=str, required=True,
+                        help='Kubernetes context whose rollouts to query')
+    parser.add_argument('-n', '--namespace', type=str,
+                        help='Only query rollouts to this namespace')
+    parser.add_argument('-a', '--app', type=str,
+                        help='Only query rollouts of this application')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('latest', help='Show the version last rolled out of every application')
+    durations = commands.add_parser('durations', help='Show p50 and p95 of the duration of rollouts and their phases')
+    durations.add_argument('--last', type=int, default=100,
+                           help='Number of recent successful rollouts to consider [100]')
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='%(levelname)s: %(message)s')
+
+    c = Configuration()
+    c.configfile = args.config
+    c.context = args.context
+    c.read_settings()
+    if not c.historyfile:
+        logging.error("The history is disabled in configuration file \"{}\"".format(
+            c.configfile))
+        sys.exit(1)
+    if not os.path.exists(c.historyfile):
+        logging.warn("No rollout recorded yet")
+        return
+    try:
+        h = History(c.historyfile)
+    except HistoryError as e:
+        logging.error(e)
+        sys.exit(1)
+
+    try:
+        if args.command == 'latest':
+            for (namespace, app_name, version, commit_id, finished) in h.latest(
+                    args.context, args.namespace, args.app):
+                print("{:<24} {:<32} {:<24} {:<12} {}".format(
+                    namespace, app_name, version, (commit_id or '')[:12],
+                    time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(finished))))
+            return
+
+        durations = h.durations(args.context, args.namespace, args.app,
+                                args.last)
+        if not durations:
+            return
+        print("{:<32} {:>6} {:>10} {:>10}".format(
+            "Phase", "Runs", "p50 [s]", "p95 [s]"))
+        for name in ['total'] + sorted(set(durations) - set(['total'])):
+            print("{:<32} {:>6} {:>10.3f} {:>10.3f}".format(
+                name, len(durations[name]), percentile(durations[name], 50),
+                percentile(durations[name], 95)))
+    finally:
+        h.close()
@@ -0,0 +1,198 @@
+# encoding: utf-8
+
+from jinja2 import Environment, TemplateSyntaxError, meta
+from cache import write_atomically
+from catalog import template_catalog
+from config import Configuration
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+
+# variables ausroller passes to every template itself
+BUILTIN_VARIABLES = frozenset(['app_version', 'namespace'])
+index_version = 1
+
+
+class TemplateIndex(object):
+    '''
+    Persistent index of the variables used by every template below a
+    templates directory. Only templates whose content changed since the
+    index was saved are parsed again.
+    '''
+
+    def __init__(self, templates_path, indexfile, env=None):
+        self.templates_path = templates_path
+        self.indexfile = indexfile
+        self.env = env or Environment()
+        self.entries = self._load()
+        self._by_variable = None
+
+    @classmethod
+    def for_configuration(cls, c, env=None):
+        digest = hashlib.sha1(c.templates_path).hexdigest()
+        return cls(c.templates_path,
+                   os.path.join(c.cachepath, 'index', digest + '.json'), env)
+
+    def _load(self):
+        try:
+            with open(self.indexfile) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return {}
+        if data.get('version') != index_version or \
+                data.get('templates_path') != self.templates_path:
+            return {}
+        return data['templates']
+
+    def save(self):
+        try:
+            write_atomically(self.indexfile, json.dumps(
+                {'version': index_version,
+                 'templates_path': self.templates_path,
+                 'templates': self.entries}))
+        except (IOError, OSError) as e:
+            logging.warn("Cannot write template index \"{}\" [{}]".format(
+                self.indexfile, e))
+
+    def template_files(self):
+        ''' () -> list of tuples
+            Returns (name, path) of all templates of the catalog; names are
+            relative to the templates directory.
+        '''
+        catalog = template_catalog(self.templates_path)
+        return [(name, os.path.join(self.templates_path, name))
+                for name in catalog.names()]
+
+    def _parse(self, name, source):
+        try:
+            ast = self.env.parse(source.decode('utf-8'))
+        except TemplateSyntaxError as e:
+            logging.warn("Cannot parse template \"{}\" [{}]".format(name, e))
+            return []
+        return sorted(meta.find_undeclared_variables(ast) -
+                      set(self.env.globals))
+
+    def update(self):
+        ''' () -> list of strings
+            Brings the index up to date and returns the names of the
+            templates which had to be parsed.
+        '''
+        entries = {}
+        parsed = []
+        for (name, path) in self.template_files():
+            stat = os.stat(path)
+            entry = self.entries.get(name)
+            if entry and entry['mtime'] == stat.st_mtime and \
+                    entry['size'] == stat.st_size:
+                entries[name] = entry
+                continue
+            with open(path, 'rb') as f:
+                source = f.read()
+            digest = hashlib.sha1(source).hexdigest()
+            if entry and entry['sha1'] == digest:
+                variables = entry['variables']
+            else:
+                variables = self._parse(name, source)
+                parsed.append(name)
+            entries[name] = {'mtime': stat.st_mtime, 'size': stat.st_size,
+                             'sha1': digest, 'variables': variables}
+        if entries != self.entries:
+            self.entries = entries
+            self._by_variable = None
+            self.save()
+        return parsed
+
+    def variables(self, template):
+        ''' (string) -> set of strings
+            Returns the variables used by the given template.
+        '''
+        entry = self.entries.get(template)
+        return set(entry['variables']) if entry else set()
+
+    def templates(self, variable):
+        ''' (string) -> list of strings
+            Returns the templates using the given variable.
+        '''
+        if self._by_variable is None:
+            self._by_variable = {}
+            for (name, entry) in self.entries.items():
+                for used in entry['variables']:
+                    self._by_variable.setdefault(used, []).append(name)
+        return sorted(self._by_variable.get(variable, []))
+
+    def check(self, variables):
+        ''' (iterable of strings) -> (dict, set of strings)
+            Returns the variables used by templates but missing in the
+            given ones, mapped to the templates using them, and the given
+            variables no template uses.
+        '''
+        defined = set(variables) | BUILTIN_VARIABLES
+        undefined = {}
+        used = set()
+        for (name, entry) in self.entries.items():
+            used.update(entry['variables'])
+            for variable in set(entry['variables']) - defined:
+                undefined.setdefault(variable, []).append(name)
+        return (undefined, set(variables) - used)
+
+
+def index(argv):
+    parser = argparse.ArgumentParser(
+        prog='ausroller index',
+        description='Query which templates use which variables')
+    parser.add_argument('-c', '--config', type=str, default='',
+                        help='Path to config file [$HOME/.ausroller.ini]')
+    parser.add_argument('-C', '--context', type=str, required=True,
+                        help='Kubernetes context whose repository to use')
+    parser.add_argument('-V', '--verbose', action='store_true',
+                        help='Be verbose; print debug messages')
+    commands = parser.add_subparsers(dest='command')
+    query = commands.add_parser('query', help='Show templates using a variable or variables used by a template')
+    what = query.add_mutually_exclusive_group(required=True)
+    what.add_argument('--var', type=str, help='Variable to look up')
+    what.add_argument('--template', type=str,
+                      help='Template to look up, e.g. deployments/app-deployment.tpl.yaml')
+    check = commands.add_parser('check', help='Find undefined and unused variables of a namespace')
+    check.add_argument('-n', '--namespace', type=str, required=True,
+                       help='Namespace whose variables to check')
+    check.add_argument('-s', '--secret', type=str, required=False,
+                       help='Path to file holding [<repopath>/secrets/<namespace>/secret_vars.json]')
+    check.add_argument('-e', '--extravars', type=str, required=False,
+                       help='Path to file holding extra variables')
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='%(levelname)s: %(message)s',
+                        level=logging.DEBUG if args.verbose else logging.WARN)
+
+    c = Configuration()
+    c.configfile = args.config
+    c.context = args.context
+    if args.command == 'check':
+        c.namespace = args.namespace
+        c.secretsfile = args.secret
+        c.extravarsfile = args.extravars
+        c.read_config()
+    else:
+        c.read_settings()
+    template_index = TemplateIndex.for_configuration(c)
+    parsed = template_index.update()
+    logging.debug("Parsed {} templates".format(len(parsed)))
+
+    if args.command == 'query':
+        if args.var:
+            print("\n".join(template_index.templates(args.var)))
+        else:
+            print("\n".join(sorted(template_index.variables(args.template))))
+        return
+
+    (undefined, unused) = template_index.check(
+        set(c.variables) | set(c.extra_variables))
+    for variable in sorted(undefined):
+        print("undefined: {} (used by {})".format(
+            variable, ", ".join(sorted(undefined[variable]))))
+    for variable in sorted(unused):
+        print("unused: {}".format(variable))
+    if undefined:
+        sys.exit(1)
@@ -1,11 +1,18 @@
+import hashlib
+import json
 import logging
+import os
+import pipes
 import re
 import shlex
 import subprocess
 import sys
+import time
+from cache import write_atomically
+from config import kubectl_default_bin
+from timing import current_recorder
 
 kubectl_format = "{kubectl} --context={context} --namespace={namespace} {subcommand}"
-kubectl_default_bin = "kubectl"
 min_version = (1, 4, 0)
 
 
@@ -17,9 +24,112 @@ class KubeCtlException(Exception):
         self.cause = cause
 
 
+def diff_objects(output):
+    ''' (string) -> dict
+        Maps the objects found in the output of "kubectl diff" to "new" or
+        "changed". Objects are named like the files kubectl compares,
+        <group>.<version>.<kind>.<namespace>.<name>.
+        >>> sorted(diff_objects("diff -u -N /tmp/LIVE-1/v1.ConfigMap.ns.app /tmp/MERGED-1/v1.ConfigMap.ns.app\\n"
+        ...              "@@ -0,0 +1,4 @@\\n"
+        ...              "diff -u -N /tmp/LIVE-1/apps.v1.Deployment.ns.app /tmp/MERGED-1/apps.v1.Deployment.ns.app\\n"
+        ...              "@@ -20,7 +20,7 @@\\n").items())
+        [('apps.v1.Deployment.ns.app', 'changed'), ('v1.ConfigMap.ns.app', 'new')]
+    '''
+    objects = {}
+    current = None
+    for line in output.splitlines():
+        if line.startswith("diff "):
+            current = os.path.basename(line.split()[-1])
+            objects[current] = 'changed'
+        elif line.startswith("@@ -0,0 ") and current:
+            # there is no live object to compare with
+            objects[current] = 'new'
+    return objects
+
+
+def is_diff_object(filename, kind, name):
+    ''' (string, string, string) -> bool
+        Checks if a file name of "kubectl diff" belongs to the given object.
+        >>> is_diff_object('apps.v1.Deployment.ns.my.app', 'Deployment', 'my.app')
+        True
+        >>> is_diff_object('apps.v1.Deployment.ns.app', 'StatefulSet', 'app')
+        False
+    '''
+    # namespaces cannot contain dots, names can
+    suffix = ".{}".format(name)
+    if not filename.endswith(suffix):
+        return False
+    prefix = filename[:-len(suffix)].rpartition('.')[0]
+    return prefix.endswith(".{}".format(kind))
+
+
+class VerificationCache(object):
+    '''
+    Remembers successful verifications of kubectl and the cluster for a
+    limited time. Entries are keyed by the kubectl binary and its mtime, the
+    mtimes of the kubeconfig files and the context, so changing any of them
+    forces a new verification.
+    '''
+
+    def __init__(self, cachefile, ttl, ignore_cached=False):
+        self.cachefile = cachefile
+        self.ttl = ttl
+        self.ignore_cached = ignore_cached
+
+    @staticmethod
+    def kubeconfig_files():
+        kubeconfig = os.environ.get('KUBECONFIG')
+        if kubeconfig:
+            return [f for f in kubeconfig.split(os.pathsep) if f]
+        return [os.path.join(os.path.expanduser("~"), '.kube', 'config')]
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def key(self, kubectl_path, context):
+        # distutils takes a while to load and is only needed here
+        from distutils.spawn import find_executable
+
+        binary = find_executable(kubectl_path) or kubectl_path
+        binary = os.path.realpath(binary)
+        parts = [binary, self._mtime(binary), context]
+        for kubeconfig in self.kubeconfig_files():
+            parts.extend([kubeconfig, self._mtime(kubeconfig)])
+        return hashlib.sha1(json.dumps(parts)).hexdigest()
+
+    def _load(self):
+        try:
+            with open(self.cachefile) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def is_verified(self, key):
+        if self.ignore_cached:
+            return False
+        verified_at = self._load().get(key)
+        return verified_at is not None and \
+            0 <= time.time() - verified_at < self.ttl
+
+    def store(self, key):
+        now = time.time()
+        entries = dict((k, v) for (k, v) in self._load().items()
+                       if now - v < self.ttl)
+        entries[key] = now
+        try:
+            write_atomically(self.cachefile, json.dumps(entries))
+        except (IOError, OSError) as e:
+            logging.warn("Cannot write verification cache \"{}\" [{}]".format(
+                self.cachefile, e))
+
+
 class KubeCtl(object):
 
-    def __init__(self, context, namespace, path=kubectl_default_bin, dryrun=False, skip_verify=False):
+    def __init__(self, context, namespace, path=kubectl_default_bin, dryrun=False, skip_verify=False, verify_cache=None):
         if path != None:
             self.path = path
         else:
@@ -34,26 +144,61 @@ class KubeCtl(object):
             "^{}$".format(required_ctx), re.MULTILINE)
 
         if not skip_verify and not dryrun:
-            logging.debug("Running verification checks")
-            try:
-                self.verify_version()
-                self.verify_context_available()
-            except KubeCtlException as e:
-                logging.error("Configuring kubectl failed. [{}]".format(e))
-                sys.exit(1)
-
-    def _run(self, subcmd):
-        cmd = shlex.split(kubectl_format.format(
+            self.verify(verify_cache)
+
+    def verify(self, verify_cache=None):
+        if verify_cache:
+            cache_key = verify_cache.key(self.path, self.context)
+            if verify_cache.is_verified(cache_key):
+                logging.debug("Skipping verification checks, verified recently")
+                return
+        logging.debug("Running verification checks")
+        try:
+            self.verify_version()
+            self.verify_context_available()
+        except KubeCtlException as e:
+            logging.error("Configuring kubectl failed. [{}]".format(e))
+            sys.exit(1)
+        if verify_cache:
+            verify_cache.store(cache_key)
+
+    def command(self, subcmd):
+        return shlex.split(kubectl_format.format(
             kubectl=self.path, namespace=self.namespace, context=self.context, subcommand=subcmd))
 
+    def start(self, subcmd):
+        ''' (string) -> Popen
+            Starts kubectl without waiting for it. Output and errors are
+            combined on stdout.
+        '''
+        cmd = self.command(subcmd)
+        logging.debug("Starting '{}'".format(" ".join(cmd)))
+        current_recorder().count('kubectl subprocesses')
+        return subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+
+    def _run(self, subcmd, input=None, returncodes=(0,)):
+        cmd = self.command(subcmd)
+
         if self.dryrun:
             logging.debug("Skipping '{}'".format(" ".join(cmd)))
             return
         else:
             logging.debug("Running '{}'".format(" ".join(cmd)))
 
+        current_recorder().count('kubectl subprocesses')
         try:
-            return subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+            with current_recorder().phase("kubectl {}".format(subcmd.split()[0])):
+                if input is None and returncodes == (0,):
+                    return subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+                process = subprocess.Popen(
+                    cmd, stdin=None if input is None else subprocess.PIPE,
+                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                output = process.communicate(input)[0]
+                if process.returncode not in returncodes:
+                    raise subprocess.CalledProcessError(
+                        process.returncode, cmd, output)
+                return output
         except subprocess.CalledProcessError as e:
             logging.error("kubectl failed with [{}]".format(e.output))
             raise KubeCtlException("running kubectl failed", e)
@@ -62,6 +207,61 @@ class KubeCtl(object):
         subcmd = "apply -f {}".format(resourcefile)
         self._run(subcmd)
 
+    def apply_resourcefiles(self, resourcefiles):
+        ''' (list of strings) -> list of strings
+            Applies all given resource files with a single kubectl call and
+            returns the names (<kind>/<name>) of the applied objects.
+            kubectl processes the files in the given order. If applying
+            fails the exception names the resource files kubectl
+            complained about.
+        '''
+        subcmd = "apply -o name {}".format(" ".join(
+            "-f {}".format(pipes.quote(f)) for f in resourcefiles))
+        try:
+            return (self._run(subcmd) or "").split()
+        except KubeCtlException as e:
+            output = e.cause.output or ""
+            failed = [f for f in resourcefiles if f in output]
+            raise KubeCtlException("applying {} failed".format(
+                ", ".join(failed or resourcefiles)), e.cause)
+
+    def apply_manifests(self, manifests):
+        ''' (string) -> list of strings
+            Applies the given manifests by passing them to a single kubectl
+            call on stdin and returns the names of the applied objects.
+        '''
+        try:
+            return (self._run("apply -o name -f -", manifests) or "").split()
+        except KubeCtlException as e:
+            raise KubeCtlException("applying manifests failed", e.cause)
+
+    def delete_manifests(self, manifests):
+        ''' (string) -> list of strings
+            Deletes the objects of the given manifests with a single kubectl
+            call and returns the names of the deleted objects. Objects
+            which do not exist are left out.
+        '''
+        try:
+            return (self._run("delete --ignore-not-found -o name -f -",
+                              manifests) or "").split()
+        except KubeCtlException as e:
+            raise KubeCtlException("deleting manifests failed", e.cause)
+
+    def diff_manifests(self, manifests):
+        ''' (string) -> string
+            Compares the given manifests with the cluster by passing them to
+            a single "kubectl diff" call on stdin. Returns the diff of all
+            objects which would change.
+        '''
+        # kubectl diff exits with 1 if there are differences
+        return self._run("diff -f -", manifests, returncodes=(0, 1)) or ""
+
+    def get(self, names, output):
+        ''' (string, string) -> string
+            Returns the given objects printed with the given output format.
+        '''
+        return self._run("get {} -o {}".format(names, pipes.quote(output)))
+
     def get_contexts(self):
         subcmd = "config get-contexts -o name"
         return self._run(subcmd).rstrip()
@@ -1,7 +1,60 @@
 from ausroller import Configuration
 from ausroller import Ausroller
+from ausroller import FanOut
+from ausroller.timing import Recorder, recorder
 
 import logging
+import sys
+
+
+def serve(argv):
+    from ausroller.server import serve
+    serve(argv)
+
+
+def submit(argv):
+    from ausroller.server import submit
+    logging.basicConfig(format='%(levelname)s: %(message)s')
+    submit(argv)
+
+def changed(argv):
+    from ausroller.changes import changed
+    changed(argv)
+
+
+def index(argv):
+    from ausroller.index import index
+    index(argv)
+
+
+def rollback(argv):
+    from ausroller.rollback import rollback
+    rollback(argv)
+
+
+def render_all(argv):
+    from ausroller.render import render_all
+    render_all(argv)
+
+
+def drift(argv):
+    from ausroller.drift import drift
+    drift(argv)
+
+
+def history(argv):
+    from ausroller.history import history
+    history(argv)
+
+# sub commands besides the default rollout
+COMMANDS = {'serve': serve,
+            'submit': submit,
+            'changed': changed,
+            'index': index,
+            'rollback': rollback,
+            'render-all': render_all,
+            'drift': drift,
+            'history': history}
 
 ROLLINGPIN = """
           _______________________
@@ -20,22 +73,47 @@ ROLLINGPIN = """
 
 """
 
-def main():
-    print(ROLLINGPIN)
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in COMMANDS:
+        COMMANDS[argv[0]](argv[1:])
+        return
+
     # parse arguments from command line and
     # read configuration file
 
     c = Configuration()
-    c.parse_args()
+    c.parse_args(argv)
+    print(ROLLINGPIN)
     logging.basicConfig(format='%(levelname)s: %(message)s',
                         level=c.log_level)
     # repair gbp logging
     gbplogger = logging.getLogger("gbp")
     gbplogger.propagate = False
-    c.read_config()
 
-    a = Ausroller(c)
-    a.deploy()
+    try:
+        rollout(c)
+    finally:
+        if c.profile:
+            sys.stderr.write(recorder.table())
+        if c.profile_output:
+            recorder.write(c.profile_output, c.profile_format)
+
+
+def rollout(c):
+    if len(c.targets) > 1:
+        results = FanOut(c).deploy()
+        if not all(succeeded for (_, succeeded) in results):
+            sys.exit(1)
+        return
+
+    # the phases of the rollout are recorded from reading the configuration
+    r = Recorder(parent=recorder)
+    with r.activate():
+        c.read_config()
+        a = Ausroller(c, recorder=r)
+        a.deploy()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,96 @@
+# encoding: utf-8
+import re
+
+# rendered manifests are handled without a YAML parser
+DOCUMENT_SEPARATOR = re.compile(r"^---[ \t]*$", re.MULTILINE)
+
+
+def documents(content):
+    ''' (string) -> list of strings
+        Splits a multi document YAML stream into its non-empty documents.
+        >>> documents("---\\nkind: A\\n---\\n\\n---\\nkind: B\\n")
+        ['kind: A\\n', 'kind: B\\n']
+    '''
+    return [document.lstrip("\n") for document in DOCUMENT_SEPARATOR.split(content)
+            if document.strip()]
+
+
+def join_documents(contents):
+    ''' (list of strings) -> string
+        Joins manifests to a multi document YAML stream.
+        >>> join_documents(["kind: A", "kind: B\\n"])
+        'kind: A\\n---\\nkind: B\\n'
+    '''
+    return "---\n".join(content if content.endswith("\n") else content + "\n"
+                        for content in contents)
+
+
+def _value(line):
+    value = line.split(':', 1)[1].split(' #', 1)[0].strip()
+    return value.strip('"\'')
+
+
+def fields(document):
+    ''' (string) -> dict
+        Returns apiVersion, kind, name and namespace of the object in a
+        YAML document as far as they are given.
+        >>> sorted(fields("apiVersion: apps/v1\\nkind: Deployment\\nmetadata:\\n  labels:\\n    name: x\\n  name: \\"app\\"\\n  namespace: ns\\n").items())
+        [('apiVersion', 'apps/v1'), ('kind', 'Deployment'), ('name', 'app'), ('namespace', 'ns')]
+    '''
+    result = {}
+    in_metadata = False
+    indentation = None
+    for line in document.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        if not line[0].isspace():
+            in_metadata = stripped == 'metadata:'
+            indentation = None
+            key = stripped.split(':', 1)[0]
+            if key in ('apiVersion', 'kind') and ':' in stripped:
+                result[key] = _value(stripped)
+            continue
+        if in_metadata:
+            depth = len(line) - len(line.lstrip())
+            if indentation is None:
+                indentation = depth
+            key = stripped.split(':', 1)[0]
+            if depth == indentation and key in ('name', 'namespace') and \
+                    ':' in stripped:
+                result[key] = _value(stripped)
+    return dict((key, value) for (key, value) in result.items() if value)
+
+
+def header(document):
+    ''' (string) -> (string, string)
+        Returns kind and metadata.name of the object in a YAML document or
+        None for each of them which is missing.
+        >>> header("apiVersion: v1\\nkind: ConfigMap\\nmetadata:\\n  labels:\\n    name: x\\n  name: \\"app\\"\\n")
+        ('ConfigMap', 'app')
+    '''
+    result = fields(document)
+    return (result.get('kind'), result.get('name'))
+
+
+def skeleton(lines):
+    ''' (iterable of strings) -> generator of strings
+        Yields the document separators, apiVersion, kind and metadata of a
+        YAML stream line by line and drops everything else, e.g. the data
+        of a large config map.
+        >>> "".join(skeleton(["kind: ConfigMap\\n", "metadata:\\n", "  name: a\\n",
+        ...                   "data:\\n", "  key: value\\n", "---\\n", "kind: Secret\\n"]))
+        'kind: ConfigMap\\nmetadata:\\n  name: a\\n---\\nkind: Secret\\n'
+    '''
+    keep = False
+    for line in lines:
+        if DOCUMENT_SEPARATOR.match(line):
+            keep = False
+            yield line
+        elif line[:1].isspace() or line.startswith('#'):
+            if keep:
+                yield line
+        else:
+            keep = line.split(':', 1)[0] in ('apiVersion', 'kind', 'metadata')
+            if keep:
+                yield line
@@ -0,0 +1,225 @@
+# encoding: utf-8
+
+from catalog import template_catalog
+from config import Configuration
+from core import render, render_context
+from manifest import documents, fields
+import argparse
+import itertools
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+try:
+    import yaml
+except ImportError:
+    # without PyYAML rendered manifests only get the header check
+    yaml = None
+
+# rendered in place of the version as no version is rolled out
+RENDER_VERSION = u"0.0.0-render-all"
+REQUIRED_FIELDS = ('apiVersion', 'kind', 'name')
+
+# state of a rendering process, set up by _init_worker
+_worker = {}
+
+
+def discover(c, apps=None, namespaces=None):
+    ''' (Configuration, list of strings, list of strings) -> list of tuples
+        Returns (namespace, template) of every application template
+        combined with every namespace having secret variables, optionally
+        restricted to the given applications and namespaces. Returns an
+        empty list if the repository has no secret variables at all.
+    '''
+    catalog = template_catalog(c.templates_path)
+    templates = sorted(name for app_name in catalog.apps()
+                       if not apps or app_name in apps
+                       for name in catalog.templates(app_name).values())
+
+    secrets_path = os.path.join(c.repopath, 'secrets')
+    if not os.path.isdir(secrets_path):
+        logging.error("No secret variables in \"{}\" to render with".format(
+            secrets_path))
+        return []
+    found = sorted(namespace for namespace in os.listdir(secrets_path)
+                   if os.path.isfile(os.path.join(
+                       secrets_path, namespace, 'secret_vars.json')))
+    if namespaces:
+        for namespace in set(namespaces) - set(found):
+            logging.warn("No secret variables for namespace \"{}\"".format(
+                namespace))
+        found = [namespace for namespace in found if namespace in namespaces]
+    return [(namespace, name) for namespace in found for name in templates]
+
+
+def check_manifest(content):
+    ''' (unicode) -> unicode or None
+        Returns why a rendered manifest is not YAML describing Kubernetes
+        objects or None if it is.
+        >>> check_manifest(u"apiVersion: v1\\nkind: ConfigMap\\nmetadata:\\n  name: app\\n")
+        >>> check_manifest(u"apiVersion: v1\\nmetadata:\\n  name: app\\n")
+        u'document 1: no kind'
+    '''
+    if yaml is not None:
+        try:
+            list(yaml.safe_load_all(content))
+        except yaml.YAMLError as e:
+            return u" ".join(unicode(e).split())
+    for (number, line) in enumerate(content.splitlines(), 1):
+        if line[:len(line) - len(line.lstrip())].count("\t"):
+            return u"line {}: tab in indentation".format(number)
+    for (number, document) in enumerate(documents(content), 1):
+        manifest = fields(document)
+        missing = [field for field in REQUIRED_FIELDS if field not in manifest]
+        if missing:
+            return u"document {}: no {}".format(number, ", ".join(missing))
+    return None
+
+
+def describe(e):
+    ''' (Exception) -> unicode
+        Returns a one line description of a template error.
+    '''
+    message = u" ".join(unicode(e).split())
+    lineno = getattr(e, 'lineno', None)
+    if lineno:
+        return u"line {}: {}".format(lineno, message)
+    return message
+
+
+def report(results):
+    ''' (list of tuples) -> list of unicode
+        Returns one line per failed (namespace, template, error); a
+        namespace all of whose templates fail alike gets a single line.
+        >>> report([('a', 'x', None), ('a', 'y', u'undefined'),
+        ...         ('b', 'x', u'no variables'), ('b', 'y', u'no variables')])
+        [u'a y: undefined', u'b (all 2 templates): no variables']
+    '''
+    by_namespace = {}
+    for (namespace, name, error) in results:
+        by_namespace.setdefault(namespace, []).append((name, error))
+    lines = []
+    for namespace in sorted(by_namespace):
+        errors = set(error for (_, error) in by_namespace[namespace])
+        if len(by_namespace[namespace]) > 1 and len(errors) == 1 and \
+                None not in errors:
+            lines.append(u"{} (all {} templates): {}".format(
+                namespace, len(by_namespace[namespace]), errors.pop()))
+            continue
+        lines.extend(u"{} {}: {}".format(namespace, name, error)
+                     for (name, error) in by_namespace[namespace] if error)
+    return lines
+
+
+def _init_worker(c):
+    from jinja2 import Environment, FileSystemLoader, StrictUndefined
+
+    _worker['c'] = c
+    _worker['env'] = Environment(loader=FileSystemLoader(c.templates_path),
+                                 undefined=StrictUndefined, cache_size=-1)
+    _worker['contexts'] = {}
+
+
+def _context(namespace):
+    ''' (string) -> dict or unicode
+        Returns the variables of a namespace or why they cannot be read.
+        They are read once per process.
+    '''
+    contexts = _worker['contexts']
+    if namespace not in contexts:
+        c = _worker['c'].for_target(namespace, _worker['c'].context)
+        try:
+            c.read_config()
+            contexts[namespace] = render_context(_worker['env'], c)
+        except (IOError, ValueError) as e:
+            contexts[namespace] = u"cannot read variables [{}]".format(
+                describe(e))
+        except SystemExit:
+            # read_config has logged why
+            contexts[namespace] = u"cannot read variables"
+    return contexts[namespace]
+
+
+def render_item(item):
+    ''' (tuple) -> tuple
+        Renders one (namespace, template) and returns it with the error
+        found, if any.
+    '''
+    (namespace, name) = item
+    context = _context(namespace)
+    if not isinstance(context, dict):
+        return (namespace, name, context)
+    try:
+        template = _worker['env'].get_template(name)
+        content = render(template, context, RENDER_VERSION)
+    except Exception as e:
+        return (namespace, name, describe(e))
+    return (namespace, name, check_manifest(content))
+
+
+def render_items(c, items, processes=None):
+    ''' (Configuration, list of tuples, int) -> list of tuples
+        Renders all (namespace, template) items, spread over the given
+        number of processes, and returns (namespace, template, error)
+        sorted like the items.
+    '''
+    processes = processes or multiprocessing.cpu_count()
+    if processes == 1 or len(items) < 2:
+        _init_worker(c)
+        results = list(itertools.imap(render_item, items))
+    else:
+        pool = multiprocessing.Pool(processes, _init_worker, (c,))
+        try:
+            # consecutive items mostly share a namespace and with it the
+            # variables a process has already read
+            chunksize = max(1, len(items) // (processes * 4))
+            results = pool.map(render_item, items, chunksize)
+        finally:
+            pool.terminate()
+            pool.join()
+    return results
+
+
+def render_all(argv):
+    parser = argparse.ArgumentParser(
+        prog='ausroller render-all',
+        description='Render every application template in every namespace to find template errors and missing variables')
+    parser.add_argument('-c', '--config', type=str, default='',
+                        help='Path to config file [$HOME/.ausroller.ini]')
+    parser.add_argument('-C', '--context', type=str, required=True,
+                        help='Kubernetes context whose repository to use')
+    parser.add_argument('-n', '--namespace', type=str, action='append',
+                        help='Only render for this namespace; may be given multiple times')
+    parser.add_argument('-a', '--app', type=str, action='append',
+                        help='Only render the templates of this application; may be given multiple times')
+    parser.add_argument('-P', '--processes', type=int, default=0,
+                        help='Number of rendering processes [number of CPUs]')
+    parser.add_argument('-V', '--verbose', action='store_true',
+                        help='Be verbose; print debug messages')
+    args = parser.parse_args(argv)
+    if args.processes < 0:
+        parser.error("--processes must not be negative")
+    logging.basicConfig(format='%(levelname)s: %(message)s',
+                        level=logging.DEBUG if args.verbose else logging.WARN)
+
+    c = Configuration()
+    c.configfile = args.config
+    c.context = args.context
+    c.secretsfile = None
+    c.extravarsfile = None
+    c.read_settings()
+
+    started = time.time()
+    items = discover(c, args.app, args.namespace)
+    results = render_items(c, items, args.processes)
+    errors = [(namespace, name, error) for (namespace, name, error) in results
+              if error]
+    for line in report(results):
+        print(line.encode('utf-8'))
+    print("Rendered {} manifests of {} namespaces in {:.2f}s, {} failed".format(
+        len(results), len(set(namespace for (namespace, _) in items)),
+        time.time() - started, len(errors)))
+    if errors:
+        sys.exit(1)
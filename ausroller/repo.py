@@ -0,0 +1,156 @@
+# encoding: utf-8
+
+from gbp.git import repository
+from timing import current_recorder
+import logging
+import os
+
+
+class CountingGitRepository(repository.GitRepository):
+    '''
+    GitRepository counting the git subprocesses it spawns.
+    '''
+
+    def __init__(self, path, toplevel=True):
+        self.subprocess_count = 0
+        super(CountingGitRepository, self).__init__(path, toplevel)
+
+    def _git_inout(self, *args, **kwargs):
+        self.subprocess_count += 1
+        current_recorder().count('git subprocesses')
+        return super(CountingGitRepository, self)._git_inout(*args, **kwargs)
+
+    def _git_getoutput(self, *args, **kwargs):
+        self.subprocess_count += 1
+        current_recorder().count('git subprocesses')
+        return super(CountingGitRepository, self)._git_getoutput(*args, **kwargs)
+
+
+class RolloutRepository(object):
+    '''
+    Staging session on the repository holding the rollout definitions.
+    The repository is opened once, checked for a clean state once and all
+    files of a rollout are staged and committed with one git call each.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.repo = CountingGitRepository(path)
+
+    @property
+    def subprocess_count(self):
+        return self.repo.subprocess_count
+
+    def is_clean(self, ignore=None):
+        ''' (regex) -> bool
+            Checks for uncommitted changes. Untracked files whose name
+            matches ignore, e.g. temporary files of concurrent rollouts,
+            are left out.
+        '''
+        if ignore is None:
+            (repo_is_clean, repo_msg) = self.repo.is_clean()
+            return repo_is_clean
+        (out, err, ret) = self.repo._git_inout(
+            'status', ['--porcelain', '-z', '--untracked-files=all'],
+            capture_stderr=True)
+        if ret:
+            raise repository.GitRepositoryError(
+                "Cannot read the status: {}".format(err.strip()))
+        return all(entry.startswith('?? ') and
+                   ignore.match(os.path.basename(entry[3:]))
+                   for entry in out.split('\0') if entry)
+
+    def changed_files(self, since, until='HEAD'):
+        ''' (string, string) -> list of strings
+            Returns the paths (relative to the repository) changed between
+            the given revisions.
+        '''
+        (out, err, ret) = self.repo._git_inout(
+            'diff', ['--name-only', '--no-renames', since, until, '--'],
+            capture_stderr=True)
+        if ret:
+            raise repository.GitRepositoryError(
+                "Cannot diff {}..{}: {}".format(since, until, err.strip()))
+        return out.splitlines()
+
+    def show_file(self, revision, path):
+        ''' (string, string) -> string
+            Returns the content of path (relative to the repository) at the
+            given revision or None if it did not exist.
+        '''
+        (out, err, ret) = self.repo._git_inout(
+            'show', ['{}:{}'.format(revision, path)], capture_stderr=True)
+        if ret:
+            return None
+        return out
+
+    def resolve(self, revision):
+        ''' (string) -> string
+            Returns the commit id of the given revision.
+        '''
+        (out, err, ret) = self.repo._git_inout(
+            'rev-parse', ['--verify', '-q', '{}^{{commit}}'.format(revision)],
+            capture_stderr=True)
+        if ret:
+            raise repository.GitRepositoryError(
+                "Unknown revision {}".format(revision))
+        return out.strip()
+
+    def last_commits(self, paths, count):
+        ''' (list of strings, int) -> list of strings
+            Returns the ids of the last count commits touching any of the
+            given paths, newest first.
+        '''
+        (out, err, ret) = self.repo._git_inout(
+            'log', ['-n', str(count), '--format=%H', 'HEAD', '--'] + paths,
+            capture_stderr=True)
+        if ret:
+            raise repository.GitRepositoryError(
+                "Cannot read history: {}".format(err.strip()))
+        return out.split()
+
+    def read_files(self, revision, paths):
+        ''' (string, list of strings) -> dict
+            Returns the contents of the given paths at the given revision
+            read from the object store with a single git process. Paths
+            which did not exist at the revision are left out.
+        '''
+        (out, err, ret) = self.repo._git_inout(
+            'cat-file', ['--batch'],
+            input="".join("{}:{}\n".format(revision, path) for path in paths),
+            capture_stderr=True)
+        if ret:
+            raise repository.GitRepositoryError(
+                "Cannot read objects: {}".format(err.strip()))
+        contents = {}
+        offset = 0
+        for path in paths:
+            end = out.index("\n", offset)
+            header = out[offset:end].split()
+            offset = end + 1
+            if header[-1] == 'missing':
+                continue
+            size = int(header[2])
+            contents[path] = out[offset:offset + size]
+            # the object is followed by a newline
+            offset += size + 1
+        return contents
+
+    def stage(self, files):
+        if files:
+            self.repo.add_files(files)
+
+    def remove(self, files):
+        if files:
+            self.repo.remove_files(files)
+
+    def commit(self, files, message, removed=[]):
+        ''' (list of strings, string, list of strings) -> None
+            Stages and commits the given files and the removal of the
+            removed ones.
+        '''
+        self.stage(files)
+        self.remove(removed)
+        files = files + removed
+        self.repo.commit_files(files, message)
+        logging.debug("Commited changes:\n{}".format("\n".join(files)))
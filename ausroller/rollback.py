@@ -0,0 +1,299 @@
+# encoding: utf-8
+
+from gbp.git.repository import GitRepositoryError
+from config import Configuration
+from core import Ausroller
+from kube import KubeCtlException
+from manifest import join_documents
+from repo import RolloutRepository
+from schedule import batches, waves
+from timing import Recorder, current_recorder, timed
+import logging
+import os
+import sys
+
+
+class Rollback(object):
+    '''
+    Rolls applications back to the manifests committed at an earlier
+    revision of the resources repository. The manifests are read from the
+    git object store and applied as they are, without rendering them again.
+    '''
+
+    def __init__(self, ausroller, repo):
+        self.a = ausroller
+        self.c = ausroller.c
+        self.repo = repo
+        # commit of the rollback, only looked up for the history
+        self.commit_id = None
+
+    def manifest_paths(self, app_name):
+        ''' (string) -> list of tuples
+            Returns (resource, path relative to the repository) of all
+            possible manifests of an application in apply order.
+        '''
+        return [(resource, os.path.relpath(
+            self.a.resource_path(app_name, resource), self.c.repopath))
+            for resource in self.a.resource_types()]
+
+    def revision_of(self, app_name, to):
+        ''' (string, string) -> string
+            Returns the commit to roll the application back to. "previous"
+            is the second to last commit changing its manifests.
+        '''
+        if to != 'previous':
+            return self.repo.resolve(to)
+        paths = [path for (_, path) in self.manifest_paths(app_name)]
+        commits = self.repo.last_commits(paths, 2)
+        if len(commits) < 2:
+            raise GitRepositoryError(
+                "{} has no previous rollout in {}".format(
+                    app_name, self.c.namespace))
+        return commits[1]
+
+    @timed('read manifests')
+    def manifests(self, app_name, revision):
+        ''' (string, string) -> list of tuples
+            Returns (resource, content) of the manifests of the application
+            at the given revision in apply order.
+        '''
+        paths = self.manifest_paths(app_name)
+        contents = self.repo.read_files(revision, [path for (_, path) in paths])
+        return [(resource, contents[path]) for (resource, path) in paths
+                if path in contents]
+
+    def added(self, app_name, revision, manifests):
+        ''' (string, string, list of tuples) -> list of tuples
+            Returns (resource, content) of the manifests of the application
+            committed since the given revision, i.e. of the resources it
+            did not have at the revision.
+        '''
+        restored = set(resource for (resource, _) in manifests)
+        added = []
+        for resource in self.a.resource_types():
+            outfile = self.a.resource_path(app_name, resource)
+            if resource in restored or not os.path.exists(outfile):
+                continue
+            with open(outfile) as f:
+                added.append((resource, f.read()))
+        return added
+
+    def apply(self, rollbacks):
+        ''' (list of tuples) -> list of strings
+            Applies the manifests of the given (app, revision, manifests,
+            added) rollbacks in the order of a rollout and returns the names
+            of the applied objects.
+        '''
+        nodes = [(app_name, resource, content)
+                 for (app_name, _, manifests, _) in rollbacks
+                 for (resource, content) in manifests]
+        if self.c.apply_parallel > 1:
+            groups = waves(nodes)
+        else:
+            groups = batches(nodes)
+        names = []
+        with current_recorder().phase('apply'):
+            for group in groups:
+                # the manifests of a group go to one kubectl call as a
+                # multi document stream
+                names.extend(self.a.kubectl.apply_manifests(join_documents(
+                    [nodes[index][2] for index in group])))
+        return names
+
+    def prune(self, rollbacks):
+        ''' (list of tuples) -> list of strings
+            Deletes the objects of the resources added since the revisions
+            of the given rollbacks, workloads before the config maps and
+            secrets they may refer to, and returns their names.
+        '''
+        nodes = [(app_name, resource, content)
+                 for (app_name, _, _, added) in rollbacks
+                 for (resource, content) in added]
+        order = [index for wave in reversed(waves(nodes)) for index in wave]
+        with current_recorder().phase('delete'):
+            return self.a.kubectl.delete_manifests(join_documents(
+                [nodes[index][2] for index in order]))
+
+    def commit_message(self, rollbacks):
+        if len(rollbacks) == 1:
+            (app_name, revision, _, _) = rollbacks[0]
+            subject = "Rolled back {} to {}".format(app_name, revision[:7])
+        else:
+            subject = "Rolled back {} applications\n\n{}".format(
+                len(rollbacks),
+                "\n".join("{}: {}".format(app_name, revision[:7])
+                          for (app_name, revision, _, _) in rollbacks))
+        return "[{}] {}\n\n{}".format(self.c.namespace, subject,
+                                      self.c.commit_message)
+
+    @timed('write')
+    def write(self, rollbacks):
+        ''' (list of tuples) -> list of strings
+            Writes the manifests of the given (app, revision, manifests,
+            added) rollbacks and returns the files which changed.
+        '''
+        files = []
+        for (app_name, _, manifests, _) in rollbacks:
+            for (resource, content) in manifests:
+                outfile = self.a.resource_path(app_name, resource)
+                if self.a.is_unchanged(outfile, content):
+                    continue
+                outdir = os.path.dirname(outfile)
+                if not os.path.isdir(outdir):
+                    os.makedirs(outdir)
+                with open(outfile, 'wb') as out:
+                    out.write(content)
+                    current_recorder().count('bytes written', len(content))
+                files.append(outfile)
+        return files
+
+    def rollback(self, to, prune=False):
+        '''
+        Roll all configured applications back to the given revision and
+        record the rollback with a new commit. Resources added since the
+        revision are deleted from the cluster and the repository if prune
+        is set, otherwise they are only reported.
+        '''
+        if not self.c.is_dryrun and not self.repo.is_clean():
+            logging.error("Git repo is not in a clean state! Exiting..")
+            sys.exit(1)
+
+        rollbacks = []
+        for (app_name, _) in self.c.apps:
+            revision = self.revision_of(app_name, to)
+            manifests = self.manifests(app_name, revision)
+            if not manifests:
+                logging.error("No manifests of {} found at {}".format(
+                    app_name, revision[:7]))
+                sys.exit(1)
+            logging.info("Rolling back {} to {} ({})".format(
+                app_name, revision[:7],
+                ", ".join(resource for (resource, _) in manifests)))
+            added = self.added(app_name, revision, manifests)
+            for (resource, _) in added:
+                if prune:
+                    logging.info("Deleting {} {} added since {}".format(
+                        app_name, resource, revision[:7]))
+                else:
+                    logging.warn("{} {} was added since {} and is kept, use --prune to delete it".format(
+                        app_name, resource, revision[:7]))
+            rollbacks.append((app_name, revision, manifests,
+                              added if prune else []))
+
+        outcome = 'rollback failed'
+        files = []
+        try:
+            (names, files) = self.restore(rollbacks)
+            if self.c.wait and names:
+                self.a.wait(names)
+            outcome = 'rolled back'
+        finally:
+            self.record_history(outcome, rollbacks, files)
+
+    def restore(self, rollbacks):
+        ''' (list of tuples) -> (list of strings, list of strings)
+            Applies, writes and commits the manifests of the given
+            rollbacks. Returns the names of the applied objects and the
+            files which changed or were removed.
+        '''
+        if self.c.is_dryrun or self.c.is_dryrun_but_templates:
+            logging.info("Dry-run: skip applying the rollback to Kubernetes")
+        try:
+            names = self.apply(rollbacks)
+            if any(added for (_, _, _, added) in rollbacks):
+                self.prune(rollbacks)
+        except KubeCtlException as e:
+            logging.error("Rolling back failed. [{}]".format(e))
+            sys.exit(1)
+
+        files = []
+        if self.c.is_dryrun:
+            logging.info("Dry-run: skip writing and committing the rollback")
+        else:
+            with self.a.git_lock:
+                files = self.write(rollbacks)
+                removed = [self.a.resource_path(app_name, resource)
+                           for (app_name, _, _, added) in rollbacks
+                           for (resource, _) in added]
+                if files or removed:
+                    with current_recorder().phase('commit'):
+                        if self.c.is_dryrun_but_templates:
+                            self.repo.stage(files)
+                            self.repo.remove(removed)
+                        else:
+                            self.repo.commit(
+                                files, self.commit_message(rollbacks),
+                                removed)
+                            if self.c.historyfile:
+                                self.commit_id = self.repo.resolve('HEAD')
+                else:
+                    logging.warn("Manifests are already at the rolled back revision. Nothing to commit.")
+                files += removed
+        return (names, files)
+
+    def record_history(self, outcome, rollbacks, files):
+        '''
+        Append the rollback with the restored versions, the changed
+        resources and the duration of each phase to the local history
+        unless it is disabled or a dry-run. The versions are those recorded
+        for the commit rolled back to, or the commit if it is not recorded.
+        '''
+        if not self.c.historyfile or self.c.is_dryrun or \
+                self.c.is_dryrun_but_templates:
+            return
+        from history import History, HistoryError
+
+        try:
+            history = History(self.c.historyfile)
+            try:
+                rollouts = []
+                for (app_name, revision, manifests, added) in rollbacks:
+                    versions = history.versions(self.c.context,
+                                                self.c.namespace, revision)
+                    changed = [resource
+                               for (resource, _) in manifests + added
+                               if self.a.resource_path(app_name, resource)
+                               in files]
+                    rollouts.append((app_name,
+                                     versions.get(app_name, revision[:12]),
+                                     changed))
+                history.record(self.a.recorder.started, self.c.namespace,
+                               self.c.context, self.commit_id, outcome,
+                               rollouts, self.a.recorder.phases())
+            finally:
+                history.close()
+        except HistoryError as e:
+            logging.warn(e)
+
+
+def rollback(argv):
+    def add_arguments(parser):
+        parser.add_argument('--to', type=str, default='previous',
+                            help='Revision of the resources repository to roll back to, or "previous" for the rollout before the last one of each application [previous]')
+        parser.add_argument('--prune', action='store_true',
+                            help='Delete resources added since the revision from the cluster and the repository instead of only reporting them')
+
+    c = Configuration()
+    args = c.parse_args(argv, prog='ausroller rollback',
+                        add_arguments=add_arguments, versions=False)
+    logging.basicConfig(format='%(levelname)s: %(message)s',
+                        level=c.log_level)
+    logging.getLogger("gbp").propagate = False
+    if c.diff:
+        logging.error("Rollbacks cannot be compared with --diff")
+        sys.exit(2)
+
+    try:
+        for (namespace, context) in c.targets:
+            t = c.for_target(namespace, context)
+            # the phases of the rollback are recorded from reading the
+            # configuration
+            r = Recorder(parent=current_recorder())
+            with r.activate():
+                t.read_config()
+                Rollback(Ausroller(t, recorder=r),
+                         RolloutRepository(t.repopath)).rollback(
+                             args.to, args.prune)
+    except GitRepositoryError as e:
+        logging.error("Rolling back failed. [{}]".format(e))
+        sys.exit(1)
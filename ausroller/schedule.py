@@ -0,0 +1,114 @@
+# encoding: utf-8
+
+from manifest import documents, fields
+import logging
+import re
+
+# within an application config maps, secrets and service accounts are
+# applied before the workloads using them and services, ingresses,
+# autoscalers and disruption budgets after them
+KIND_RANKS = {'configmap': 0, 'secret': 0, 'serviceaccount': 0,
+              'service': 2, 'ingress': 2, 'horizontalpodautoscaler': 2,
+              'poddisruptionbudget': 2, 'pdb': 2}
+workload_rank = 1
+# keys whose "name" refers to a config map or a secret
+REFERENCE_KEYS = {'configMapRef': 'ConfigMap', 'configMapKeyRef': 'ConfigMap',
+                  'configMap': 'ConfigMap', 'secretRef': 'Secret',
+                  'secretKeyRef': 'Secret'}
+REFERENCE_KEY = re.compile(r"^(\s*)(?:- )?({}):\s*$".format(
+    "|".join(REFERENCE_KEYS)))
+SECRET_NAME = re.compile(
+    r"^\s*(?:- )?secretName:\s*[\"']?([^\"'\s#]+)", re.MULTILINE)
+NAME = re.compile(r"^(\s*)(?:- )?name:\s*[\"']?([^\"'\s#]+)")
+
+
+def rank_of(resource):
+    return KIND_RANKS.get(resource, workload_rank)
+
+
+def references(content):
+    ''' (string) -> set of tuples
+        Returns the (kind, name) of the config maps and secrets a manifest
+        refers to in envFrom, env and volumes.
+        >>> sorted(references("envFrom:\\n- configMapRef:\\n    name: app-config\\n"
+        ...                   "volumes:\\n- name: tls\\n  secret:\\n    secretName: app-tls\\n"))
+        [('ConfigMap', 'app-config'), ('Secret', 'app-tls')]
+    '''
+    found = set(('Secret', name) for name in SECRET_NAME.findall(content))
+    lines = content.splitlines()
+    for (number, line) in enumerate(lines):
+        match = REFERENCE_KEY.match(line)
+        if not match:
+            continue
+        depth = len(match.group(1))
+        for child in lines[number + 1:]:
+            if not child.strip():
+                continue
+            name = NAME.match(child)
+            if len(child) - len(child.lstrip()) <= depth:
+                break
+            if name:
+                found.add((REFERENCE_KEYS[match.group(2)], name.group(2)))
+                break
+    return found
+
+
+def referred(nodes):
+    ''' (list of tuples) -> list of sets
+        Returns the indices of the nodes defining the config maps and
+        secrets each (app, resource, manifest) node refers to.
+    '''
+    defined = {}
+    for (index, (_, _, content)) in enumerate(nodes):
+        for document in documents(content):
+            manifest = fields(document)
+            if 'kind' in manifest and 'name' in manifest:
+                defined[(manifest['kind'], manifest['name'])] = index
+    return [set(defined[reference] for reference in references(content)
+                if reference in defined) - set([index])
+            for (index, (_, _, content)) in enumerate(nodes)]
+
+
+def waves(nodes):
+    ''' (list of tuples) -> list of lists
+        Orders (app, resource, manifest) nodes into waves of node indices.
+        A node only depends on the lower ranked resources of its own
+        application and on the config maps and secrets it refers to, so
+        the nodes of a wave can be applied concurrently.
+    '''
+    dependencies = []
+    for (index, (app_name, resource, _)) in enumerate(nodes):
+        depends = set(other for (other, (other_app, other_resource, _))
+                      in enumerate(nodes)
+                      if other_app == app_name and
+                      rank_of(other_resource) < rank_of(resource))
+        depends.discard(index)
+        dependencies.append(depends)
+    for (depends, referring) in zip(dependencies, referred(nodes)):
+        depends.update(referring)
+
+    result = []
+    remaining = set(range(len(nodes)))
+    while remaining:
+        wave = sorted(index for index in remaining
+                      if not dependencies[index] & remaining)
+        if not wave:
+            logging.warn("Resources depend on each other, applying them at once")
+            wave = sorted(remaining)
+        result.append(wave)
+        remaining.difference_update(wave)
+    return result
+
+
+def batches(nodes):
+    ''' (list of tuples) -> list of lists
+        Groups the nodes into the kubectl calls applying them. kubectl
+        applies the files of one call in the given order, but goes on with
+        the next file when one fails. So the waves only need calls of their
+        own if a node refers to a config map or secret of the rollout;
+        otherwise all nodes are applied with one call in wave order.
+    '''
+    ordered = waves(nodes)
+    if any(referred(nodes)):
+        return ordered
+    return [[index for wave in ordered for index in wave]]
@@ -0,0 +1,339 @@
+# encoding: utf-8
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn, UnixStreamServer
+from config import Configuration
+from core import Ausroller
+from timing import Recorder, current_recorder
+import argparse
+import httplib
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+
+default_address = os.path.join(os.path.expanduser("~"), '.cache',
+                               'ausroller', 'ausroller.sock')
+
+# attributes set by Configuration.read_config
+CONFIG_ATTRIBUTES = ['configfile', 'repopath', 'kubectlpath', 'cachepath',
+                     'templatecache', 'variablescache', 'verifyttl',
+                     'backend', 'historyfile', 'templates_path', 'rollout_path', 'secretsfile', 'variables',
+                     'extravarsfile', 'extra_variables']
+
+
+def parse_address(address):
+    ''' (string) -> tuple
+        Returns ('unix', path) for socket paths and ('tcp', (host, port))
+        for <host>:<port> addresses.
+    '''
+    if '/' in address:
+        return ('unix', address)
+    (host, _, port) = address.rpartition(':')
+    return ('tcp', (host or 'localhost', int(port)))
+
+
+def is_loopback(host):
+    ''' (string) -> bool
+        Checks if all addresses of a host are loopback addresses.
+        >>> is_loopback('127.0.0.1')
+        True
+        >>> is_loopback('0.0.0.0')
+        False
+    '''
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, None)]
+    except socket.gaierror:
+        return False
+    return bool(addresses) and all(
+        address.startswith('127.') or address == '::1'
+        for address in addresses)
+
+
+class RolloutService(object):
+    '''
+    Runs rollout requests while keeping the configuration, compiled
+    templates and verified KubeCtl instances warm. Requests for the same
+    namespace run one after another, other namespaces run concurrently.
+    '''
+
+    def __init__(self, configfile):
+        self.configfile = configfile
+        self.lock = threading.Lock()
+        self.namespace_locks = {}
+        self.git_locks = {}
+        self.configs = {}
+        self.kubectls = {}
+
+    def _lock(self, locks, key):
+        with self.lock:
+            return locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def _stamp(c):
+        stamp = []
+        for path in [c.configfile, c.secretsfile, c.extravarsfile]:
+            try:
+                stamp.append((path, os.path.getmtime(path)))
+            except (OSError, TypeError):
+                stamp.append((path, None))
+        return stamp
+
+    def configuration(self, c):
+        ''' (Configuration) -> None
+            Reads the configuration of the parsed request, reusing a
+            previously read one if none of its files changed.
+        '''
+        key = (c.configfile, c.namespace, c.context, c.secretsfile,
+               c.extravarsfile)
+        with self.lock:
+            cached = self.configs.get(key)
+        if cached and cached[0] == self._stamp(cached[1]):
+            logging.debug("Using cached configuration")
+            for attribute in CONFIG_ATTRIBUTES:
+                setattr(c, attribute, getattr(cached[1], attribute))
+            return
+        c.read_config()
+        with self.lock:
+            self.configs[key] = (self._stamp(c), c)
+
+    def kubectl(self, c):
+        dryrun = c.is_dryrun or c.is_dryrun_but_templates
+        key = (c.context, c.namespace, c.kubectlpath, c.backend, dryrun)
+        with self.lock:
+            kubectl = self.kubectls.get(key)
+        if kubectl is None or c.reverify:
+            kubectl = Ausroller.make_kubectl(c)
+            with self.lock:
+                self.kubectls[key] = kubectl
+        return kubectl
+
+    def rollout(self, argv):
+        ''' (list of strings) -> bool
+            Rolls out the request given as ausroller command line arguments.
+            Returns whether all targets succeeded.
+        '''
+        parsed = Configuration()
+        try:
+            parsed.parse_args(['-c', self.configfile] + argv)
+        except SystemExit:
+            logging.error("Invalid rollout arguments {}".format(argv))
+            return False
+
+        succeeded = True
+        for (namespace, context) in parsed.targets:
+            c = parsed.for_target(namespace, context)
+            with self._lock(self.namespace_locks, (context, namespace)):
+                # recorded into the recorder of the request, which is
+                # dropped with it
+                r = Recorder(parent=current_recorder())
+                try:
+                    with r.activate():
+                        self.configuration(c)
+                        kubectl = None if c.is_dryrun else self.kubectl(c)
+                        a = Ausroller(c, git_lock=self._lock(
+                            self.git_locks, os.path.realpath(c.repopath)),
+                            kubectl=kubectl, recorder=r)
+                    a.deploy()
+                except SystemExit:
+                    logging.error("Rollout to {}@{} failed.".format(
+                        namespace, context))
+                    succeeded = False
+                except Exception as e:
+                    logging.error("Rollout to {}@{} failed. [{}]".format(
+                        namespace, context, e))
+                    succeeded = False
+        return succeeded
+
+
+class RequestLogHandler(logging.Handler):
+    '''
+    Streams the log records of a request to the client. Records belong to
+    the request if they are logged by a thread recording into its
+    recorder, i.e. the handling thread and the threads working for it.
+    '''
+
+    def __init__(self, stream, level, recorder):
+        logging.Handler.__init__(self, level)
+        self.stream = stream
+        self.recorder = recorder
+        self.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+
+    def emit(self, record):
+        # handlers are called by the thread logging the record
+        if not current_recorder().is_within(self.recorder):
+            return
+        try:
+            self.stream.write(self.format(record) + "\n")
+            self.stream.flush()
+        except (IOError, socket.error):
+            # the client went away, the rollout goes on regardless
+            pass
+
+
+class RolloutRequestHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        if self.path != '/rollout':
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.getheader('content-length', 0))
+            request = json.loads(self.rfile.read(length))
+            argv = [str(arg) for arg in request['argv']]
+            level = logging.DEBUG if request.get('verbose') else logging.INFO
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_error(400, "Invalid request [{}]".format(e))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.end_headers()
+        # a recorder per request instead of the process recorder, which
+        # would grow with every request
+        recorder = Recorder()
+        handler = RequestLogHandler(self.wfile, level, recorder)
+        logging.getLogger().addHandler(handler)
+        try:
+            with recorder.activate():
+                succeeded = self.server.service.rollout(argv)
+        finally:
+            logging.getLogger().removeHandler(handler)
+        try:
+            self.wfile.write("RESULT: {}\n".format(
+                "succeeded" if succeeded else "failed"))
+        except (IOError, socket.error):
+            pass
+
+    def finish(self):
+        try:
+            BaseHTTPRequestHandler.finish(self)
+        except (IOError, socket.error):
+            pass
+
+    def address_string(self):
+        if isinstance(self.client_address, tuple):
+            return BaseHTTPRequestHandler.address_string(self)
+        return 'local'
+
+    def log_message(self, format, *args):
+        logging.debug("{} {}".format(self.address_string(), format % args))
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+
+    def __init__(self, path):
+        httplib.HTTPConnection.__init__(self, 'localhost')
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def make_server(address, service):
+    (family, location) = parse_address(address)
+    if family == 'unix':
+        socketdir = os.path.dirname(location)
+        if not os.path.isdir(socketdir):
+            os.makedirs(socketdir)
+        if os.path.exists(location):
+            os.unlink(location)
+        server = ThreadingUnixHTTPServer(location, RolloutRequestHandler)
+    else:
+        server = ThreadingHTTPServer(location, RolloutRequestHandler)
+    server.service = service
+    return server
+
+
+def serve(argv):
+    parser = argparse.ArgumentParser(
+        prog='ausroller serve',
+        description='Run rollouts submitted with "ausroller submit"')
+    parser.add_argument('-c', '--config', type=str, required=False,
+                        default=os.path.join(os.path.expanduser("~"),
+                                             ".ausroller.ini"),
+                        help='Path to config file [$HOME/.ausroller.ini]')
+    parser.add_argument('-l', '--listen', type=str, default=default_address,
+                        help='Socket path or <host>:<port> to listen on [{}]'.format(
+                            default_address))
+    parser.add_argument('-V', '--verbose', action='store_true',
+                        help='Be verbose; print debug messages')
+    args = parser.parse_args(argv)
+    (family, location) = parse_address(args.listen)
+    if family == 'tcp' and not is_loopback(location[0]):
+        parser.error("Rollout requests are not authenticated, only listen on localhost")
+
+    # records of all levels are passed on to the request handlers
+    handler = logging.StreamHandler()
+    handler.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+    handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+    logging.getLogger().addHandler(handler)
+    logging.getLogger().setLevel(logging.DEBUG)
+    gbplogger = logging.getLogger("gbp")
+    gbplogger.propagate = False
+    gbplogger.setLevel(handler.level)
+
+    server = make_server(args.listen, RolloutService(args.config))
+    logging.info("Listening on {}".format(args.listen))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if parse_address(args.listen)[0] == 'unix':
+            os.unlink(args.listen)
+
+
+def submit(argv):
+    parser = argparse.ArgumentParser(
+        prog='ausroller submit',
+        description='Submit a rollout to a running "ausroller serve". All '
+        'other arguments are passed on as rollout arguments.')
+    parser.add_argument('-S', '--server', type=str, default=default_address,
+                        help='Socket path or <host>:<port> of the server [{}]'.format(
+                            default_address))
+    (args, rollout_argv) = parser.parse_known_args(argv)
+
+    (family, location) = parse_address(args.server)
+    if family == 'unix':
+        connection = UnixHTTPConnection(location)
+    else:
+        connection = httplib.HTTPConnection(*location)
+    verbose = '-V' in rollout_argv or '--verbose' in rollout_argv
+    try:
+        connection.request('POST', '/rollout',
+                           json.dumps({'argv': rollout_argv,
+                                       'verbose': verbose}),
+                           {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+    except (socket.error, httplib.HTTPException) as e:
+        sys.stderr.write("Cannot reach ausroller server at {} [{}]\n".format(
+            args.server, e))
+        sys.exit(1)
+    if response.status != 200:
+        sys.stderr.write("Rollout rejected: {} {}\n".format(
+            response.status, response.reason))
+        sys.exit(1)
+
+    succeeded = False
+    # the log is streamed line by line until the server closes the connection
+    for line in iter(response.fp.readline, ''):
+        if line.startswith("RESULT: "):
+            succeeded = line.strip() == "RESULT: succeeded"
+        else:
+            sys.stdout.write(line)
+            sys.stdout.flush()
+    if not succeeded:
+        sys.exit(1)
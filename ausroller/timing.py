@@ -0,0 +1,174 @@
+# encoding: utf-8
+
+from contextlib import contextmanager
+from functools import wraps
+import json
+import os
+import threading
+import time
+
+
+# the recorders activated by each thread
+_active = threading.local()
+
+
+class Recorder(object):
+    '''
+    Collects the durations of the rollout phases and counters like the
+    number of spawned subprocesses or written bytes. Everything recorded
+    is passed on to the parent recorder, if any.
+    '''
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.events = []
+            self.counters = {}
+
+    def chain(self):
+        recorder = self
+        while recorder is not None:
+            yield recorder
+            recorder = recorder.parent
+
+    @contextmanager
+    def activate(self):
+        '''
+        Makes this recorder the current recorder of the calling thread.
+        '''
+        stack = _active.__dict__.setdefault('stack', [])
+        stack.append(self)
+        try:
+            yield self
+        finally:
+            stack.pop()
+
+    def is_within(self, recorder):
+        ''' (Recorder) -> bool
+            Checks if this recorder passes on what it records to the given
+            one.
+        '''
+        return any(r is recorder for r in self.chain())
+
+    def add(self, name, start, duration):
+        event = (name, start, duration, threading.current_thread().ident)
+        for recorder in self.chain():
+            with recorder.lock:
+                recorder.events.append(event)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.time() - start)
+
+    def count(self, counter, amount=1):
+        for recorder in self.chain():
+            with recorder.lock:
+                recorder.counters[counter] = \
+                    recorder.counters.get(counter, 0) + amount
+
+    def phases(self):
+        ''' () -> list of tuples
+            Returns (name, calls, total duration) of all phases in the order
+            they were started first.
+        '''
+        totals = {}
+        order = []
+        with self.lock:
+            for (name, start, duration, _) in sorted(self.events,
+                                                     key=lambda e: e[1]):
+                if name not in totals:
+                    order.append(name)
+                    totals[name] = [0, 0.0]
+                totals[name][0] += 1
+                totals[name][1] += duration
+        return [(name, totals[name][0], totals[name][1]) for name in order]
+
+    def table(self):
+        lines = ["{:<32} {:>6} {:>10}".format("Phase", "Calls", "Total [s]")]
+        for (name, calls, total) in self.phases():
+            lines.append("{:<32} {:>6} {:>10.3f}".format(name, calls, total))
+        lines.append("{:<32} {:>6} {:>10.3f}".format(
+            "wall time", "", time.time() - self.started))
+        if self.counters:
+            lines.append("")
+            lines.append("{:<32} {:>17}".format("Counter", "Value"))
+            for (counter, value) in sorted(self.counters.items()):
+                lines.append("{:<32} {:>17}".format(counter, value))
+        return "\n".join(lines) + "\n"
+
+    def as_json(self):
+        return {'wall_time': time.time() - self.started,
+                'phases': [{'name': name, 'calls': calls, 'total': total}
+                           for (name, calls, total) in self.phases()],
+                'counters': dict(self.counters)}
+
+    def as_trace(self):
+        ''' () -> dict
+            Returns the recorded phases in the Chrome trace event format.
+        '''
+        pid = os.getpid()
+        with self.lock:
+            events = [{'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                       'ts': int((start - self.started) * 1e6),
+                       'dur': int(duration * 1e6)}
+                      for (name, start, duration, tid) in self.events]
+            events.extend({'name': counter, 'ph': 'C', 'pid': pid, 'tid': 0,
+                           'ts': 0, 'args': {counter: value}}
+                          for (counter, value) in self.counters.items())
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, outfile, output_format='json'):
+        if output_format == 'trace':
+            report = self.as_trace()
+        else:
+            report = self.as_json()
+        with open(outfile, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+# the recorder of this process, used by threads which activated none
+recorder = Recorder()
+
+
+def current_recorder():
+    ''' () -> Recorder
+        Returns the recorder last activated by the calling thread.
+    '''
+    stack = getattr(_active, 'stack', None)
+    return stack[-1] if stack else recorder
+
+
+def bound(f):
+    '''
+    Returns f running with the current recorder of the calling thread, so
+    pool threads record into the recorder of the thread handing out work.
+    '''
+    active = current_recorder()
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        with active.activate():
+            return f(*args, **kwargs)
+    return wrapper
+
+
+def timed(name):
+    '''
+    Decorator recording every call of the decorated function as phase.
+    '''
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            with current_recorder().phase(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,121 @@
+# encoding: utf-8
+
+from Queue import Queue, Empty
+from kube import KubeCtlException
+from timing import bound
+import logging
+import threading
+import time
+
+# kinds whose rollout is watched with "kubectl rollout status"
+STATUS_KINDS = ['deployment', 'statefulset', 'daemonset']
+# kinds not supported by "kubectl rollout status" which are polled instead
+POLLED_KINDS = ['replicationcontroller']
+poll_interval = 2
+
+
+def kind_of(name):
+    ''' (string) -> string
+        Returns the kind of an object name as printed by kubectl -o name.
+        >>> kind_of('deployment.apps/nginx')
+        'deployment'
+    '''
+    return name.split('/', 1)[0].split('.', 1)[0].lower()
+
+
+class RolloutWatcher(object):
+    '''
+    Watches the rollout of several workloads concurrently. Watching stops
+    as soon as one rollout fails or the timeout is reached.
+    '''
+
+    def __init__(self, kubectl, timeout):
+        self.kubectl = kubectl
+        self.timeout = timeout
+        self.stopped = threading.Event()
+        self.processes = []
+        self.lock = threading.Lock()
+
+    def _watch_status(self, name):
+        with self.lock:
+            if self.stopped.is_set():
+                return False
+            process = self.kubectl.start("rollout status {}".format(name))
+            self.processes.append(process)
+        for line in iter(process.stdout.readline, ''):
+            logging.info("{}: {}".format(name, line.strip()))
+        return process.wait() == 0
+
+    def _poll_ready_replicas(self, name):
+        while not self.stopped.is_set():
+            replicas = self.kubectl.get(
+                name, "jsonpath={.spec.replicas}/{.status.readyReplicas}")
+            (desired, _, ready) = replicas.strip().partition('/')
+            ready = ready or '0'
+            logging.info("{}: {} of {} replicas are ready".format(
+                name, ready, desired))
+            if ready == desired:
+                return True
+            self.stopped.wait(poll_interval)
+        return False
+
+    def _watch(self, name, results):
+        try:
+            if kind_of(name) in POLLED_KINDS:
+                succeeded = self._poll_ready_replicas(name)
+            else:
+                succeeded = self._watch_status(name)
+        except (KubeCtlException, OSError) as e:
+            logging.error("Watching {} failed. [{}]".format(name, e))
+            succeeded = False
+        results.put((name, succeeded))
+
+    def stop(self):
+        with self.lock:
+            self.stopped.set()
+            for process in self.processes:
+                if process.poll() is None:
+                    try:
+                        process.terminate()
+                    except OSError:
+                        pass
+
+    def watch(self, names):
+        ''' (list of strings) -> bool
+            Waits until the rollouts of all watchable objects in names
+            finished. Returns False as soon as one of them fails or the
+            timeout is reached.
+        '''
+        watched = [name for name in names
+                   if kind_of(name) in STATUS_KINDS + POLLED_KINDS]
+        if not watched:
+            return True
+        logging.info("Waiting for rollout of {}".format(", ".join(watched)))
+
+        results = Queue()
+        for name in watched:
+            thread = threading.Thread(target=bound(self._watch),
+                                      args=(name, results))
+            thread.daemon = True
+            thread.start()
+
+        deadline = time.time() + self.timeout
+        pending = len(watched)
+        while pending:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                logging.error("Timed out after {}s waiting for rollouts".format(
+                    self.timeout))
+                self.stop()
+                return False
+            try:
+                (name, succeeded) = results.get(timeout=remaining)
+            except Empty:
+                continue
+            pending -= 1
+            if not succeeded:
+                logging.error("Rollout of {} failed".format(name))
+                self.stop()
+                return False
+            logging.info("{} rolled out, {} remaining".format(name, pending))
+        return True
@@ -0,0 +1,174 @@
+# encoding: utf-8
+'''
+Benchmarks ausroller against a synthetic resources repository and a fake
+kubectl. Runs offline; results are appended to a JSON lines file and
+compared with the previous run using the same parameters.
+
+    python benchmarks/run.py --apps 50 --namespaces 2 --latency 0.05
+'''
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+from ausroller import Ausroller, Configuration, core, version
+from ausroller.timing import recorder
+import synthetic
+
+fake_kubectl = os.path.join(here, 'fake-kubectl')
+context = 'benchmark'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--apps', type=int, default=20,
+                        help='Number of applications [20]')
+    parser.add_argument('--namespaces', type=int, default=1,
+                        help='Number of namespaces [1]')
+    parser.add_argument('--lines', type=int, default=20,
+                        help='Generated data lines per template [20]')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Latency of every fake kubectl call in seconds [0]')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='Rounds per measurement, the fastest counts [3]')
+    parser.add_argument('--results', type=str,
+                        default=os.path.join(os.path.expanduser('~'), '.cache',
+                                             'ausroller', 'benchmarks.jsonl'),
+                        help='File the results are appended to [~/.cache/ausroller/benchmarks.jsonl]')
+    return parser.parse_args()
+
+
+def configuration(workdir, apps, namespace):
+    argv = ['-c', os.path.join(workdir, 'ausroller.ini'),
+            '-n', namespace, '-C', context, '-m', 'benchmark']
+    for app in apps:
+        argv.extend(['-a', app, '-v', '1.0'])
+    c = Configuration()
+    c.parse_args(argv)
+    c.read_config()
+    return c
+
+
+def write_ini(workdir, repopath):
+    with open(os.path.join(workdir, 'ausroller.ini'), 'w') as f:
+        f.write("[ausroller]\n"
+                "kubectlpath = {}\n"
+                "cachepath = {}\n"
+                "verifyttl = 0\n\n"
+                "[{}]\n"
+                "repopath = {}\n".format(fake_kubectl,
+                                         os.path.join(workdir, 'cache'),
+                                         context, repopath))
+
+
+def run_round(workdir, repopath, sha, apps, namespaces):
+    ''' Measures each phase of a rollout to all namespaces in isolation. '''
+    synthetic.reset_repo(repopath, sha)
+    core._environments.clear()
+    timings = {}
+
+    def measure(phase, f):
+        start = time.time()
+        result = f()
+        timings[phase] = timings.get(phase, 0.0) + time.time() - start
+        return result
+
+    for namespace in namespaces:
+        c = measure('read config',
+                    lambda: configuration(workdir, apps, namespace))
+        a = measure('verify', lambda: Ausroller(c))
+        rollouts = measure('render', lambda: [
+            (app, '1.0', a.prepare_k8s_resources(app, '1.0')) for app in apps])
+        written = measure('write and commit',
+                          lambda: a.write_k8s_resources(rollouts))
+        measure('apply', lambda: a.rollout(written))
+
+    # end-to-end with a cold template cache
+    synthetic.reset_repo(repopath, sha)
+    core._environments.clear()
+    start = time.time()
+    for namespace in namespaces:
+        Ausroller(configuration(workdir, apps, namespace)).deploy()
+    timings['deploy'] = time.time() - start
+    return timings
+
+
+def compare(results, previous):
+    print("{:<20} {:>10} {:>10} {:>8}".format("Phase", "Time [s]",
+                                              "Before [s]", "Ratio"))
+    for (phase, seconds) in sorted(results['timings'].items()):
+        before = previous['timings'].get(phase) if previous else None
+        if before:
+            print("{:<20} {:>10.3f} {:>10.3f} {:>8.2f}".format(
+                phase, seconds, before, seconds / before))
+        else:
+            print("{:<20} {:>10.3f} {:>10} {:>8}".format(phase, seconds, "-", "-"))
+    for (counter, value) in sorted(results['counters'].items()):
+        print("{:<20} {:>10}".format(counter, value))
+
+
+def previous_results(resultsfile, params):
+    previous = None
+    if os.path.exists(resultsfile):
+        with open(resultsfile) as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry['params'] == params:
+                    previous = entry
+    return previous
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(format='%(levelname)s: %(message)s',
+                        level=logging.WARN)
+    logging.getLogger("gbp").propagate = False
+    params = {'apps': args.apps, 'namespaces': args.namespaces,
+              'lines': args.lines, 'latency': args.latency}
+
+    workdir = tempfile.mkdtemp(prefix='ausroller-benchmark-')
+    os.environ['FAKE_KUBECTL_LATENCY'] = str(args.latency)
+    os.environ['FAKE_KUBECTL_CONTEXTS'] = context
+    try:
+        repopath = os.path.join(workdir, 'k8s-resources')
+        sha = synthetic.generate_repo(repopath, args.apps, args.namespaces,
+                                      args.lines)
+        write_ini(workdir, repopath)
+        apps = synthetic.app_names(args.apps)
+        namespaces = synthetic.namespaces(args.namespaces)
+
+        best = {}
+        for _ in range(args.rounds):
+            recorder.reset()
+            for (phase, seconds) in run_round(workdir, repopath, sha, apps,
+                                              namespaces).items():
+                best[phase] = min(best.get(phase, seconds), seconds)
+            # counters of the last round
+            counters = dict(recorder.counters)
+    finally:
+        shutil.rmtree(workdir)
+
+    results = {'version': version.__version__,
+               'revision': subprocess.check_output(
+                   ['git', '-C', here, 'describe', '--always', '--dirty']).strip(),
+               'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'params': params,
+               'timings': best,
+               'counters': counters}
+    compare(results, previous_results(args.results, params))
+    directory = os.path.dirname(os.path.abspath(args.results))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(args.results, 'a') as f:
+        f.write(json.dumps(results, sort_keys=True) + "\n")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# encoding: utf-8
+'''
+Generates synthetic k8s-resources repositories for the benchmarks.
+'''
+import json
+import os
+import subprocess
+
+from ausroller.catalog import plural
+from ausroller.core import RESOURCES
+
+# apiVersion and kind of the objects of every resource type
+KINDS = {'configmap': ('v1', 'ConfigMap'),
+         'secret': ('v1', 'Secret'),
+         'deployment': ('apps/v1', 'Deployment'),
+         'service': ('v1', 'Service'),
+         'pod': ('v1', 'Pod'),
+         'replicationcontroller': ('v1', 'ReplicationController'),
+         'horizontalpodautoscaler': ('autoscaling/v1',
+                                     'HorizontalPodAutoscaler'),
+         'statefulset': ('apps/v1', 'StatefulSet')}
+
+TEMPLATE = """apiVersion: {api_version}
+kind: {kind}
+metadata:
+  name: {app}-{resource}
+  namespace: {{{{ namespace }}}}
+  labels:
+    app: {app}
+    version: "{{{{ app_version }}}}"
+data:
+  database: "{{{{ DB_HOST }}}}"
+  password: "{{{{ DB_PASSWORD }}}}"
+{{% for i in range({lines}) %}}  key{{{{ i }}}}: "{{{{ PAYLOAD }}}}-{{{{ i }}}}"
+{{% endfor %}}"""
+
+
+def app_names(apps):
+    return ["app{:04d}".format(i) for i in range(apps)]
+
+
+def namespaces(count):
+    return ["namespace{:02d}".format(i) for i in range(count)]
+
+
+def generate_repo(path, apps, namespace_count, lines=20):
+    ''' (string, int, int, int) -> string
+        Creates a git repository at path with templates of all RESOURCES
+        for the given number of apps and secrets for the given number of
+        namespaces. Returns the sha of the initial commit.
+    '''
+    for resource in RESOURCES:
+        template_dir = os.path.join(path, 'templates', plural(resource))
+        (api_version, kind) = KINDS[resource]
+        os.makedirs(template_dir)
+        for app in app_names(apps):
+            template = os.path.join(template_dir,
+                                    "{}-{}.tpl.yaml".format(app, resource))
+            with open(template, 'w') as f:
+                f.write(TEMPLATE.format(api_version=api_version, kind=kind,
+                                        app=app, resource=resource,
+                                        lines=lines))
+
+    for namespace in namespaces(namespace_count):
+        secret_dir = os.path.join(path, 'secrets', namespace)
+        os.makedirs(secret_dir)
+        with open(os.path.join(secret_dir, 'secret_vars.json'), 'w') as f:
+            json.dump({'DB_HOST': 'db.' + namespace,
+                       'DB_PASSWORD': 'secret',
+                       'PAYLOAD': 'x' * 64}, f)
+
+    git = ['git', '-C', path]
+    subprocess.check_call(git + ['init', '-q'])
+    subprocess.check_call(git + ['config', 'user.name', 'benchmark'])
+    subprocess.check_call(git + ['config', 'user.email', 'benchmark@localhost'])
+    subprocess.check_call(git + ['add', '-A'])
+    subprocess.check_call(git + ['commit', '-q', '-m', 'Synthetic resources'])
+    return subprocess.check_output(git + ['rev-parse', 'HEAD']).strip()
+
+
+def reset_repo(path, sha):
+    ''' (string, string) -> None
+        Drops all rollouts written since the given commit.
+    '''
+    subprocess.check_call(['git', '-C', path, 'reset', '-q', '--hard', sha])
+    subprocess.check_call(['git', '-C', path, 'clean', '-q', '-fdx'])
@@ -0,0 +1,37 @@
+import os
+
+
+class StubConfiguration(object):
+    '''
+    Configuration of a dry-run to the namespace and context "unittest" of
+    the resources repository at repopath, as Configuration.read_config
+    would set it up. Attributes can be overridden with keyword arguments.
+    '''
+
+    def __init__(self, repopath, **attributes):
+        self.repopath = repopath
+        self.templates_path = os.path.join(repopath, 'templates')
+        self.rollout_path = os.path.join(repopath, 'rollout', 'unittest')
+        self.secretsfile = os.path.join(repopath, 'secrets', 'unittest',
+                                        'secret_vars.json')
+        self.extravarsfile = None
+        self.cachepath = os.path.join(repopath, 'cache')
+        self.templatecache = False
+        self.verifyttl = 0
+        self.backend = 'kubectl'
+        self.historyfile = None
+        self.reverify = False
+        self.namespace = 'unittest'
+        self.context = 'unittest'
+        self.kubectlpath = '/bin/false'
+        self.variables = {}
+        self.extra_variables = {}
+        self.apps = []
+        self.commit_message = ''
+        self.is_dryrun = True
+        self.is_dryrun_but_templates = False
+        self.diff = False
+        self.force_apply = False
+        self.apply_parallel = 1
+        self.wait = False
+        self.__dict__.update(attributes)
@@ -0,0 +1,185 @@
+import json
+import os
+import shutil
+import stat
+import threading
+import unittest
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from tempfile import mkdtemp
+from ausroller.api import KubeApi
+from ausroller.kube import KubeCtlException
+
+DISCOVERY = {
+    '/api/v1': {'resources': [
+        {'name': 'configmaps', 'kind': 'ConfigMap', 'namespaced': True},
+        {'name': 'namespaces', 'kind': 'Namespace', 'namespaced': False}]},
+    '/apis/apps/v1': {'resources': [
+        {'name': 'deployments', 'kind': 'Deployment', 'namespaced': True},
+        {'name': 'deployments/scale', 'kind': 'Scale', 'namespaced': True}]},
+}
+
+
+class StubApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def reply(self, status, body):
+        data = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def record(self, body=None):
+        self.server.requests.append(
+            (self.command, self.path, self.headers.getheader('content-type'),
+             self.headers.getheader('authorization'), body))
+        self.server.clients.add(self.client_address)
+
+    def do_GET(self):
+        self.record()
+        if self.path == '/version':
+            self.reply(200, {'gitVersion': 'v1.20.4'})
+        elif self.path in DISCOVERY:
+            self.reply(200, DISCOVERY[self.path])
+        else:
+            self.reply(404, {'message': 'not found'})
+
+    def do_PATCH(self):
+        body = self.rfile.read(int(self.headers.getheader('content-length')))
+        self.record(body)
+        if 'invalid' in body:
+            self.reply(422, {'message': 'invalid manifest'})
+        else:
+            self.reply(200, {})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class KubeApiTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.server = HTTPServer(('127.0.0.1', 0), StubApiHandler)
+        self.server.requests = []
+        self.server.clients = set()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.write_kubeconfig(
+            {'server': 'http://127.0.0.1:{}'.format(
+                self.server.server_address[1])},
+            {'token': 'secret'})
+        self.kubectl = os.path.join(self.tmpdir, 'kubectl')
+        with open(self.kubectl, 'w') as f:
+            f.write('#!/bin/sh\ncat {}\n'.format(
+                os.path.join(self.tmpdir, 'kubeconfig.json')))
+        os.chmod(self.kubectl, stat.S_IRWXU)
+        self.cache = os.path.join(self.tmpdir, 'discovery')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def write_kubeconfig(self, cluster, user):
+        kubeconfig = {
+            'clusters': [{'name': 'stub', 'cluster': cluster}],
+            'users': [{'name': 'stub', 'user': user}],
+            'contexts': [{'name': 'unittest', 'context': {
+                'cluster': 'stub', 'user': 'stub'}}]}
+        with open(os.path.join(self.tmpdir, 'kubeconfig.json'), 'w') as f:
+            json.dump(kubeconfig, f)
+
+    def api(self):
+        return KubeApi('unittest', 'unittest', path=self.kubectl,
+                       discovery_cache=self.cache)
+
+    def test_apply_manifests(self):
+        '''
+        Check that all objects are applied with server-side apply requests
+        on one connection and named like kubectl does.
+        '''
+        api = self.api()
+        names = api.apply_manifests(
+            "apiVersion: v1\nkind: ConfigMap\nmetadata:\n  name: app\n"
+            "---\n"
+            "apiVersion: apps/v1\nkind: Deployment\nmetadata:\n  name: app\n"
+            "---\n"
+            "apiVersion: v1\nkind: Namespace\nmetadata:\n  name: other\n")
+        self.assertEqual(['configmap/app', 'deployment.apps/app',
+                          'namespace/other'], names)
+        patches = [request for request in self.server.requests
+                   if request[0] == 'PATCH']
+        self.assertEqual(
+            ['/api/v1/namespaces/unittest/configmaps/app?fieldManager=ausroller&force=true',
+             '/apis/apps/v1/namespaces/unittest/deployments/app?fieldManager=ausroller&force=true',
+             '/api/v1/namespaces/other?fieldManager=ausroller&force=true'],
+            [path for (_, path, _, _, _) in patches])
+        for (_, _, content_type, authorization, _) in patches:
+            self.assertEqual('application/apply-patch+yaml', content_type)
+            self.assertEqual('Bearer secret', authorization)
+        # version check, two discoveries and three patches on one connection
+        self.assertEqual(6, len(self.server.requests))
+        self.assertEqual(1, len(self.server.clients))
+
+    def test_discovery_is_cached(self):
+        '''
+        Check that a second client reuses the discovered resources.
+        '''
+        manifest = "apiVersion: apps/v1\nkind: Deployment\nmetadata:\n  name: app\n"
+        self.api().apply_manifests(manifest)
+        del self.server.requests[:]
+        self.api().apply_manifests(manifest)
+        self.assertEqual(['/version', '/apis/apps/v1/namespaces/unittest/deployments/app?fieldManager=ausroller&force=true'],
+                         [path for (_, path, _, _, _) in self.server.requests])
+
+    def test_rejected_manifest(self):
+        '''
+        Check that a rejected manifest raises a KubeCtlException naming the
+        server's message.
+        '''
+        with self.assertRaises(KubeCtlException) as e:
+            self.api().apply_manifests(
+                "apiVersion: v1\nkind: ConfigMap\nmetadata:\n  name: invalid\n")
+        self.assertIn('invalid manifest', str(e.exception))
+
+    def test_token_file(self):
+        '''
+        Check that the token of a kubeconfig user is read from its token
+        file.
+        '''
+        tokenfile = os.path.join(self.tmpdir, 'token')
+        with open(tokenfile, 'w') as f:
+            f.write('from-file\n')
+        self.write_kubeconfig(
+            {'server': 'http://127.0.0.1:{}'.format(
+                self.server.server_address[1])},
+            {'tokenFile': tokenfile})
+        self.api()
+        self.assertEqual('Bearer from-file', self.server.requests[0][3])
+
+    def test_unreadable_credentials(self):
+        '''
+        Check that missing certificate and token files raise a
+        KubeCtlException instead of an IOError.
+        '''
+        for (cluster, user) in [
+                ({'server': 'https://127.0.0.1:1',
+                  'certificate-authority': os.path.join(self.tmpdir, 'ca.crt')},
+                 {}),
+                ({'server': 'http://127.0.0.1:1'},
+                 {'tokenFile': os.path.join(self.tmpdir, 'token')})]:
+            self.write_kubeconfig(cluster, user)
+            api = KubeApi('unittest', 'unittest', path=self.kubectl,
+                          skip_verify=True)
+            with self.assertRaises(KubeCtlException):
+                api.pool()
+
+    def test_contexts(self):
+        self.assertEqual('unittest', self.api().get_contexts())
+
+if __name__ == '__main__':
+    unittest.main()
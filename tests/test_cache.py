@@ -0,0 +1,75 @@
+import json
+import os
+import shutil
+import stat
+import unittest
+from tempfile import mkdtemp
+from ausroller.cache import VariablesCache
+
+
+class VariablesCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.varfile = os.path.join(self.tmpdir, 'secret_vars.json')
+        self.cachedir = os.path.join(self.tmpdir, 'cache', 'variables')
+        self.write({'DB_HOST': 'db1'})
+        self.parsed = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, variables):
+        with open(self.varfile, 'w') as f:
+            json.dump(variables, f)
+
+    def parse(self, content):
+        self.parsed.append(content)
+        return json.loads(content)
+
+    def load(self):
+        return VariablesCache(self.cachedir).load(self.varfile, self.parse)
+
+    def test_parsed_once(self):
+        '''
+        Check that an unchanged file is parsed only once and the cache is
+        only readable by its owner.
+        '''
+        self.assertEqual({'DB_HOST': 'db1'}, self.load())
+        self.assertEqual({'DB_HOST': 'db1'}, self.load())
+        self.assertEqual(1, len(self.parsed))
+        self.assertEqual(0700, stat.S_IMODE(os.stat(self.cachedir).st_mode))
+
+    def test_changed_file_is_parsed_again(self):
+        '''
+        Check that a changed file is parsed again.
+        '''
+        self.load()
+        self.write({'DB_HOST': 'db22'})
+        self.assertEqual({'DB_HOST': 'db22'}, self.load())
+        self.assertEqual(2, len(self.parsed))
+
+    def test_touched_file_is_not_parsed_again(self):
+        '''
+        Check that a file with a new modification time but the same content
+        is not parsed again.
+        '''
+        self.load()
+        os.utime(self.varfile, (0, 0))
+        self.assertEqual({'DB_HOST': 'db1'}, self.load())
+        self.assertEqual(1, len(self.parsed))
+
+    def test_corrupt_entry_is_ignored(self):
+        '''
+        Check that a corrupt cache entry is ignored and the file parsed
+        again.
+        '''
+        self.load()
+        cache = VariablesCache(self.cachedir)
+        with open(cache.entry_path(self.varfile), 'w') as f:
+            f.write('garbage')
+        self.assertEqual({'DB_HOST': 'db1'}, self.load())
+        self.assertEqual(2, len(self.parsed))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import logging
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+from ausroller.catalog import TemplateCatalog
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARN)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TemplateCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.templates_path = mkdtemp()
+        self.write('deployments/app-deployment.tpl.yaml')
+        self.write('ingresses/app-ingress.tpl.yaml')
+        self.write('networkpolicies/app-networkpolicy.tpl.yaml')
+        self.write('cronjobs/cleanup-cronjob.tpl.yaml')
+        self.write('cronjobs/README.md')
+        self.catalog = TemplateCatalog(self.templates_path)
+        self.listed = []
+        list_templates = self.catalog._list
+
+        def counting_list(directory):
+            self.listed.append(directory)
+            return list_templates(directory)
+        self.catalog._list = counting_list
+        self.catalog.refresh()
+
+    def tearDown(self):
+        shutil.rmtree(self.templates_path)
+
+    def write(self, name):
+        path = os.path.join(self.templates_path, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write('kind: Any\n')
+
+    def test_any_resource_type(self):
+        '''
+        Check that templates of all resource types are found in the plural
+        directories of their types.
+        '''
+        self.assertEqual({'deployment': 'deployments/app-deployment.tpl.yaml',
+                          'ingress': 'ingresses/app-ingress.tpl.yaml',
+                          'networkpolicy': 'networkpolicies/app-networkpolicy.tpl.yaml'},
+                         self.catalog.templates('app'))
+        self.assertEqual(['app', 'cleanup'], self.catalog.apps())
+        self.assertEqual(['cronjobs/cleanup-cronjob.tpl.yaml',
+                          'deployments/app-deployment.tpl.yaml',
+                          'ingresses/app-ingress.tpl.yaml',
+                          'networkpolicies/app-networkpolicy.tpl.yaml'],
+                         self.catalog.names())
+        self.assertEqual(set(['cronjob', 'deployment', 'ingress',
+                              'networkpolicy']),
+                         self.catalog.resources())
+        self.assertEqual({}, self.catalog.templates('unknown'))
+        self.assertEqual('ingresses', self.catalog.directory('ingress'))
+        self.assertEqual('statefulsets', self.catalog.directory('statefulset'))
+
+    def test_misnamed_templates_are_reported(self):
+        '''
+        Check that templates which cannot be told apart by application and
+        type are reported instead of silently dropped.
+        '''
+        self.write('deployments/other.tpl.yaml')
+        handler = RecordingHandler()
+        logging.getLogger().addHandler(handler)
+        try:
+            self.catalog.refresh()
+        finally:
+            logging.getLogger().removeHandler(handler)
+        self.assertEqual(1, len(handler.records))
+        self.assertIn('deployments/other.tpl.yaml',
+                      handler.records[0].getMessage())
+        self.assertEqual({}, self.catalog.templates('other'))
+
+    def test_only_changed_directories_are_listed(self):
+        '''
+        Check that only directories whose mtime changed are listed again.
+        '''
+        del self.listed[:]
+        self.assertFalse(self.catalog.refresh())
+        self.assertEqual([], self.listed)
+
+        self.write('deployments/other-deployment.tpl.yaml')
+        os.unlink(os.path.join(self.templates_path,
+                               'ingresses/app-ingress.tpl.yaml'))
+        self.write('serviceaccounts/other-serviceaccount.tpl.yaml')
+        self.assertTrue(self.catalog.refresh())
+        self.assertEqual(['deployments', 'ingresses', 'serviceaccounts'],
+                         sorted(self.listed))
+        self.assertEqual(['deployment', 'networkpolicy'],
+                         sorted(self.catalog.templates('app')))
+        self.assertEqual(['deployment', 'serviceaccount'],
+                         sorted(self.catalog.templates('other')))
+
+if __name__ == '__main__':
+    unittest.main()
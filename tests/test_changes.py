@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import subprocess
+import unittest
+from tempfile import mkdtemp
+from ausroller import Ausroller
+from ausroller.changes import ChangeDetector
+from ausroller.repo import RolloutRepository
+from stubs import StubConfiguration
+
+
+class ChangeDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repopath = mkdtemp()
+        self.write('templates/deployments/app-deployment.tpl.yaml',
+                   'image: registry/app:{{ app_version }}\n')
+        self.write('templates/configmaps/app-configmap.tpl.yaml',
+                   'host: {{ DB_HOST }}\n')
+        self.write('templates/configmaps/other-configmap.tpl.yaml',
+                   'user: {{ DB_USER }}\n')
+        self.write('rollout/unittest/deployments/app-deployment.yaml',
+                   'image: registry/app:1.2.3\n')
+        self.write('rollout/unittest/configmaps/app-configmap.yaml',
+                   'host: db1\n')
+        self.write('rollout/unittest/configmaps/other-configmap.yaml',
+                   'user: admin\n')
+        self.write('secrets/unittest/secret_vars.json',
+                   json.dumps({'DB_HOST': 'db1', 'DB_USER': 'admin'}))
+        self.since = self.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.repopath)
+
+    def write(self, path, content):
+        path = os.path.join(self.repopath, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def commit(self):
+        git = ['git', '-C', self.repopath]
+        if not os.path.isdir(os.path.join(self.repopath, '.git')):
+            subprocess.check_call(git + ['init', '-q'])
+        subprocess.check_call(git + ['add', '-A'])
+        subprocess.check_call(git + ['-c', 'user.name=unittest',
+                                     '-c', 'user.email=unittest@localhost',
+                                     'commit', '-q', '-m', 'change'])
+        return subprocess.check_output(git + ['rev-parse', 'HEAD']).strip()
+
+    def detector(self, **attributes):
+        with open(os.path.join(self.repopath, 'secrets', 'unittest',
+                               'secret_vars.json')) as f:
+            variables = json.load(f)
+        c = StubConfiguration(self.repopath, variables=variables,
+                              **attributes)
+        return ChangeDetector(Ausroller(c), RolloutRepository(self.repopath),
+                              self.since)
+
+    def test_changed_variable(self):
+        '''
+        Check that only templates using a changed variable are affected and
+        the deployed version is found in the rolled out manifests.
+        '''
+        self.write('secrets/unittest/secret_vars.json',
+                   json.dumps({'DB_HOST': 'db2', 'DB_USER': 'admin'}))
+        self.commit()
+        (apps, selection) = self.detector().rollouts()
+        self.assertEqual([('app', '1.2.3')], apps)
+        self.assertEqual({'app': ['configmap']}, selection)
+
+    def test_changed_template(self):
+        '''
+        Check that a changed template is affected even though the version
+        line of the template changed, too.
+        '''
+        self.write('templates/deployments/app-deployment.tpl.yaml',
+                   'image: mirror/app:{{ app_version }}\n')
+        self.write('templates/ingresses/app-ingress.tpl.yaml',
+                   'host: {{ DB_HOST }}\n')
+        self.commit()
+        (apps, selection) = self.detector().rollouts()
+        self.assertEqual([('app', '1.2.3')], apps)
+        self.assertEqual({'app': ['deployment', 'ingress']}, selection)
+
+    def test_version_rendered_like_a_rollout(self):
+        '''
+        Check that the deployed version is found by rendering the template
+        with the variables of a rollout.
+        '''
+        self.write('templates/deployments/app-deployment.tpl.yaml',
+                   'image: {{ REGISTRY }}/{{ namespace }}/app:{{ app_version }}\n')
+        self.write('rollout/unittest/deployments/app-deployment.yaml',
+                   'image: mirror/unittest/app:2.0\n')
+        self.since = self.commit()
+        self.write('templates/deployments/app-deployment.tpl.yaml',
+                   'image: {{ REGISTRY }}/{{ namespace }}/app:{{ app_version }}\n'
+                   'replicas: 2\n')
+        self.commit()
+        detector = self.detector(extra_variables={'REGISTRY': 'mirror'})
+        (apps, selection) = detector.rollouts()
+        self.assertEqual([('app', '2.0')], apps)
+        self.assertEqual({'app': ['deployment']}, selection)
+
+if __name__ == '__main__':
+    unittest.main()
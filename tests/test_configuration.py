@@ -33,5 +33,67 @@ class ConfigurationTest(unittest.TestCase):
         self.assertIsInstance(d, dict)
         self.assertDictEqual({'key1': 'value', 'key': 'value'}, d)
 
+    def test_parse_args_app_version_pairs(self):
+        '''
+        Check that repeated --app/--ver options are paired in order.
+        '''
+        c = Configuration()
+        c.parse_args(['-n', 'ns', '-C', 'ctx', '-a', 'app1', '-v', '1.0',
+                      '-a', 'app2', '-v', '2.0'])
+        self.assertEqual([('app1', '1.0'), ('app2', '2.0')], c.apps)
+
+    def test_parse_args_missing_version(self):
+        '''
+        Check that an --app without --ver is rejected.
+        '''
+        c = Configuration()
+        with self.assertRaises(SystemExit):
+            c.parse_args(['-n', 'ns', '-C', 'ctx', '-a', 'app1', '-a', 'app2',
+                          '-v', '1.0'])
+
+    def test_parse_args_manifest(self):
+        '''
+        Check that a manifest file adds its applications sorted by name.
+        '''
+        manifest = '{"app2": "2.0", "app1": "1.0"}'
+        with NamedTemporaryFile() as tempfile:
+            tempfile.write(manifest)
+            tempfile.flush()
+            c = Configuration()
+            c.parse_args(['-n', 'ns', '-C', 'ctx', '-f', tempfile.name])
+        self.assertEqual([('app1', '1.0'), ('app2', '2.0')], c.apps)
+
+    def test_read_manifest_bad_version(self):
+        '''
+        Check that non-string versions in a manifest are rejected.
+        '''
+        with NamedTemporaryFile() as tempfile:
+            tempfile.write('{"app1": 1}')
+            tempfile.flush()
+            with self.assertRaises(ValueError):
+                Configuration.read_manifest(tempfile.name)
+
+    def test_parse_args_targets(self):
+        '''
+        Check that --target options are split into namespace and context.
+        '''
+        c = Configuration()
+        c.parse_args(['-a', 'app', '-v', '1.0', '-t', 'ns1@ctx1',
+                      '-t', 'ns2@ctx2', '-P', '2'])
+        self.assertEqual([('ns1', 'ctx1'), ('ns2', 'ctx2')], c.targets)
+        self.assertEqual(2, c.max_parallel)
+
+        t = c.for_target('ns2', 'ctx2')
+        self.assertEqual(('ns2', 'ctx2'), (t.namespace, t.context))
+        self.assertEqual(('ns1', 'ctx1'), (c.namespace, c.context))
+
+    def test_parse_args_bad_target(self):
+        '''
+        Check that malformed targets are rejected.
+        '''
+        c = Configuration()
+        with self.assertRaises(SystemExit):
+            c.parse_args(['-a', 'app', '-v', '1.0', '-t', 'ns1'])
+
 if __name__ == '__main__':
     unittest.main()
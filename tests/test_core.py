@@ -0,0 +1,326 @@
+import os
+import shutil
+import subprocess
+import threading
+import unittest
+from tempfile import mkdtemp
+from ausroller import Ausroller
+from ausroller.catalog import plural
+from ausroller.kube import KubeCtlException
+from ausroller.timing import Recorder
+from stubs import StubConfiguration
+
+
+class StubKubeCtl(object):
+
+    def __init__(self, output):
+        self.output = output
+        self.diffed = []
+        self.applied = []
+
+    def diff_manifests(self, manifests):
+        self.diffed.append(manifests)
+        return self.output
+
+    def apply_resourcefiles(self, resourcefiles):
+        self.applied.append([os.path.basename(f) for f in resourcefiles])
+        if self.output is None:
+            raise KubeCtlException("applying failed")
+        return []
+
+
+class AusrollerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repopath = mkdtemp()
+        for resource in ['configmap', 'deployment']:
+            os.makedirs(os.path.join(self.repopath, 'templates',
+                                     resource + 's'))
+            self.write_template(resource, 'app',
+                                '{{ greeting }}: {{ app_version }}')
+        self.c = StubConfiguration(self.repopath,
+                                   variables={'greeting': 'hello'})
+
+    def tearDown(self):
+        shutil.rmtree(self.repopath)
+
+    def write_template(self, resource, app_name, content):
+        path = os.path.join(self.repopath, 'templates', plural(resource),
+                            '{}-{}.tpl.yaml'.format(app_name, resource))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def count_compiles(self, ausroller):
+        compiles = []
+        compile = ausroller.env.compile
+
+        def counting_compile(*args, **kwargs):
+            compiles.append(args)
+            return compile(*args, **kwargs)
+        ausroller.env.compile = counting_compile
+        return compiles
+
+    def test_prepare_renders_each_template_once(self):
+        '''
+        Check that every template is compiled exactly once, also across
+        repeated rollouts.
+        '''
+        a = Ausroller(self.c)
+        compiles = self.count_compiles(a)
+        resources = a.prepare_k8s_resources('app', '1.0')
+        self.assertDictEqual({'configmap': 'hello: 1.0',
+                              'deployment': 'hello: 1.0'}, resources)
+        self.assertEqual(2, len(compiles))
+
+        resources = Ausroller(self.c).prepare_k8s_resources('app', '2.0')
+        self.assertEqual('hello: 2.0', resources['deployment'])
+        self.assertEqual(2, len(compiles))
+
+    def test_bytecode_cache(self):
+        '''
+        Check that the on-disk cache is used and invalidated on changes.
+        '''
+        self.c.templatecache = True
+        a = Ausroller(self.c)
+        a.prepare_k8s_resources('app', '1.0')
+        self.assertEqual(2, len(os.listdir(
+            os.path.join(self.c.cachepath, 'templates'))))
+
+        # a fresh environment loads the templates from the bytecode cache
+        a.env.cache.clear()
+        compiles = self.count_compiles(a)
+        a.prepare_k8s_resources('app', '1.0')
+        self.assertEqual(0, len(compiles))
+
+        self.write_template('deployment', 'app', 'changed: {{ app_version }}')
+        a.env.cache.clear()
+        resources = a.prepare_k8s_resources('app', '1.0')
+        self.assertEqual('changed: 1.0', resources['deployment'])
+        self.assertEqual(1, len(compiles))
+
+    def test_prepare_any_resource_type(self):
+        '''
+        Check that templates of resource types besides RESOURCES are
+        rendered and that a selection restricts the rendered types.
+        '''
+        os.makedirs(os.path.join(self.repopath, 'templates', 'ingresses'))
+        self.write_template('ingress', 'app', 'host: {{ greeting }}')
+        a = Ausroller(self.c)
+        resources = a.prepare_k8s_resources('app', '1.0')
+        self.assertEqual(['configmap', 'deployment', 'ingress'],
+                         sorted(resources))
+        self.assertEqual('host: hello', resources['ingress'])
+        self.assertEqual(['ingress'], list(a.prepare_k8s_resources(
+            'app', '1.0', ['ingress', 'secret'])))
+        self.assertEqual(os.path.join(self.c.rollout_path, 'ingresses',
+                                      'app-ingress.yaml'),
+                         a.resource_path('app', 'ingress'))
+
+    def commit_all(self):
+        subprocess.check_call(['git', 'init', '-q', self.repopath])
+        subprocess.check_call(['git', 'config', 'user.name', 'unittest'],
+                              cwd=self.repopath)
+        subprocess.check_call(['git', 'config', 'user.email',
+                               'unittest@localhost'], cwd=self.repopath)
+        # the caches of the stub configuration are kept in the repository
+        with open(os.path.join(self.repopath, '.git', 'info', 'exclude'),
+                  'a') as f:
+            f.write('/cache/\n')
+        subprocess.check_call(['git', 'add', '-A'], cwd=self.repopath)
+        subprocess.check_call(['git', 'commit', '-q', '-m', 'init'],
+                              cwd=self.repopath)
+
+    def test_write_skips_unchanged_resources(self):
+        '''
+        Check that resources identical to the committed ones are only
+        applied again if they were not applied to the target, or forced.
+        '''
+        subprocess.check_call(['git', 'init', '-q', self.repopath])
+        a = Ausroller(self.c)
+        outfile = a.resource_path('app', 'configmap')
+        os.makedirs(os.path.dirname(outfile))
+        with open(outfile, 'w') as f:
+            f.write('hello: 1.0')
+        subprocess.check_call(['git', 'add', '-A'], cwd=self.repopath)
+        subprocess.check_call(['git', '-c', 'user.name=unittest',
+                               '-c', 'user.email=unittest@localhost',
+                               'commit', '-q', '-m', 'init'],
+                              cwd=self.repopath)
+
+        resources = a.prepare_k8s_resources('app', '1.0')
+        written = a.write_k8s_resources([('app', '1.0', resources)])
+        self.assertEqual([('app', ['configmap', 'deployment'])], written)
+
+        a.applied.store(a.applying)
+        written = a.write_k8s_resources([('app', '1.0', resources)])
+        self.assertEqual([('app', ['deployment'])], written)
+        self.c.context = 'other'
+        written = Ausroller(self.c).write_k8s_resources(
+            [('app', '1.0', resources)])
+        self.assertEqual([('app', ['configmap', 'deployment'])], written)
+        self.c.context = 'unittest'
+
+        self.c.force_apply = True
+        written = a.write_k8s_resources([('app', '1.0', resources)])
+        self.assertEqual(['configmap', 'deployment'], sorted(written[0][1]))
+
+    def test_failed_apply_is_repeated(self):
+        '''
+        Check that resources committed by a rollout whose apply failed are
+        applied by the next rollout.
+        '''
+        self.commit_all()
+        self.c.is_dryrun = False
+        self.c.apps = [('app', '1.0')]
+        kubectl = StubKubeCtl(None)
+        with self.assertRaises(SystemExit):
+            Ausroller(self.c, kubectl=kubectl).deploy()
+        status = subprocess.check_output(['git', 'status', '--porcelain'],
+                                         cwd=self.repopath)
+        self.assertEqual('', status)
+
+        kubectl = StubKubeCtl('')
+        Ausroller(self.c, kubectl=kubectl).deploy()
+        self.assertEqual([['app-configmap.yaml', 'app-deployment.yaml']],
+                         kubectl.applied)
+        del kubectl.applied[:]
+        Ausroller(self.c, kubectl=kubectl).deploy()
+        self.assertEqual([], kubectl.applied)
+
+    def test_write_batches_git_calls(self):
+        '''
+        Check that the number of git subprocesses does not grow with the
+        number of written files.
+        '''
+        subprocess.check_call(['git', 'init', '-q', self.repopath])
+        subprocess.check_call(['git', 'config', 'user.name', 'unittest'],
+                              cwd=self.repopath)
+        subprocess.check_call(['git', 'config', 'user.email',
+                               'unittest@localhost'], cwd=self.repopath)
+        self.write_template('configmap', 'other', '{{ app_version }}')
+        subprocess.check_call(['git', 'add', '-A'], cwd=self.repopath)
+        subprocess.check_call(['git', 'commit', '-q', '-m', 'init'],
+                              cwd=self.repopath)
+
+        a = Ausroller(self.c)
+        self.c.is_dryrun = False
+        rollouts = [(app_name, '1.0', a.prepare_k8s_resources(app_name, '1.0'))
+                    for app_name in ['app', 'other']]
+        a.write_k8s_resources(rollouts)
+        # open the repository (3), check its state, add and commit
+        self.assertEqual(6, a.git_subprocesses)
+        status = subprocess.check_output(['git', 'status', '--porcelain'],
+                                         cwd=self.repopath)
+        self.assertEqual('', status)
+
+    def test_write_streams_resources(self):
+        '''
+        Check that streamed resources are written completely and that a
+        failing template leaves no file behind.
+        '''
+        subprocess.check_call(['git', 'init', '-q', self.repopath])
+        subprocess.check_call(['git', 'config', 'user.name', 'unittest'],
+                              cwd=self.repopath)
+        subprocess.check_call(['git', 'config', 'user.email',
+                               'unittest@localhost'], cwd=self.repopath)
+        subprocess.check_call(['git', 'add', '-A'], cwd=self.repopath)
+        subprocess.check_call(['git', 'commit', '-q', '-m', 'init'],
+                              cwd=self.repopath)
+        a = Ausroller(self.c)
+        self.c.is_dryrun = False
+        a.write_k8s_resources([('app', '1.0', a.prepare_k8s_resources(
+            'app', '1.0', stream=True))])
+        with open(a.resource_path('app', 'deployment')) as f:
+            self.assertEqual('hello: 1.0', f.read())
+
+        self.write_template('configmap', 'app', '{{ greeting }}: {{ 1 / 0 }}')
+        subprocess.check_call(['git', 'commit', '-q', '-a', '-m', 'broken'],
+                              cwd=self.repopath)
+        resources = a.prepare_k8s_resources('app', '2.0', stream=True)
+        with self.assertRaises(ZeroDivisionError):
+            a.write_k8s_resources([('app', '2.0', resources)])
+        for resource in ['configmap', 'deployment']:
+            outdir = os.path.dirname(a.resource_path('app', resource))
+            self.assertEqual(['app-{}.yaml'.format(resource)],
+                             os.listdir(outdir))
+        with open(a.resource_path('app', 'deployment')) as f:
+            self.assertEqual('hello: 1.0', f.read())
+
+    def test_render_outside_git_lock(self):
+        '''
+        Check that streamed resources are rendered while another target
+        holds the git lock and that rendering is timed while it happens.
+        '''
+        a = Ausroller(self.c)
+        rendering = threading.Event()
+
+        def generate():
+            rendering.set()
+            yield u'data: 1\n'
+        resources = a.prepare_k8s_resources('app', '1.0', stream=True)
+        resources['configmap'] = generate()
+        r = Recorder()
+        results = []
+
+        def write():
+            with r.activate():
+                results.append(a.write_k8s_resources([('app', '1.0', resources)]))
+        with a.git_lock:
+            thread = threading.Thread(target=write)
+            thread.start()
+            self.assertTrue(rendering.wait(5))
+            self.assertEqual([], results)
+        thread.join()
+        self.assertEqual([[('app', ['configmap', 'deployment'])]], results)
+        self.assertEqual(['write', 'render'],
+                         [name for (name, _, _) in r.phases()])
+
+    def test_rollout_calls(self):
+        '''
+        Check that a rollout is applied with a single kubectl call unless a
+        workload refers to a config map of the rollout.
+        '''
+        kubectl = StubKubeCtl('')
+        self.c.is_dryrun = False
+        a = Ausroller(self.c, kubectl=kubectl)
+        written = [('app', ['configmap', 'deployment']), ('db', ['service'])]
+        a.rollout(written)
+        self.assertEqual([['app-configmap.yaml', 'db-service.yaml',
+                           'app-deployment.yaml']], kubectl.applied)
+
+        for (resource, content) in [
+                ('configmap', 'kind: ConfigMap\nmetadata:\n  name: app\n'),
+                ('deployment', 'kind: Deployment\nmetadata:\n  name: app\n'
+                               'envFrom:\n- configMapRef:\n    name: app\n')]:
+            a.make_directory(os.path.dirname(a.resource_path('app', resource)),
+                             resource)
+            with open(a.resource_path('app', resource), 'w') as f:
+                f.write(content)
+        del kubectl.applied[:]
+        a.rollout(written)
+        self.assertEqual([['app-configmap.yaml', 'db-service.yaml'],
+                          ['app-deployment.yaml']], kubectl.applied)
+
+    def test_diff(self):
+        '''
+        Check that all resources are compared in one kubectl call and each
+        object gets a status.
+        '''
+        self.write_template('configmap', 'app',
+                            'kind: ConfigMap\nmetadata:\n  name: app\n')
+        self.write_template('deployment', 'app',
+                            'kind: Deployment\nmetadata:\n  name: app\n'
+                            'image: app:{{ app_version }}\n')
+        kubectl = StubKubeCtl(
+            'diff -u -N /tmp/LIVE-1/apps.v1.Deployment.unittest.app '
+            '/tmp/MERGED-1/apps.v1.Deployment.unittest.app\n'
+            '@@ -3,1 +3,1 @@\n')
+        a = Ausroller(self.c, kubectl=kubectl)
+        results = a.diff([('app', '1.0', a.prepare_k8s_resources('app', '1.0'))])
+        self.assertEqual([('app', 'configmap', 'ConfigMap/app', 'unchanged'),
+                          ('app', 'deployment', 'Deployment/app', 'changed')],
+                         results)
+        self.assertEqual(1, len(kubectl.diffed))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import json
+import os
+import shutil
+import stat
+import sys
+import unittest
+from StringIO import StringIO
+from tempfile import mkdtemp
+from ausroller.drift import Drift, drift
+from ausroller.kube import KubeCtl
+
+
+def live_object(kind, name, image=None, **extra):
+    item = {'kind': kind, 'metadata': {'name': name}}
+    if image:
+        item['spec'] = {'template': {'spec': {'containers': [
+            {'name': name, 'image': image}]}}}
+    item.update(extra)
+    return item
+
+
+class DriftTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.repopath = os.path.join(self.tmpdir, 'repo')
+        for namespace in ['production', 'staging']:
+            self.write('rollout/{}/deployments/app-deployment.yaml'.format(namespace),
+                       'apiVersion: apps/v1\nkind: Deployment\nmetadata:\n'
+                       '  name: app\nspec:\n  template:\n    spec:\n'
+                       '      containers:\n      - name: app\n'
+                       '        image: registry/app:2.0\n')
+            self.write('rollout/{}/configmaps/app-configmap.yaml'.format(namespace),
+                       'apiVersion: v1\nkind: ConfigMap\nmetadata:\n  name: app\n')
+        self.write('rollout/production/services/app-service.yaml',
+                   'apiVersion: v1\nkind: Service\nmetadata:\n  name: app\n')
+        self.live('production', [
+            live_object('Deployment', 'app', 'registry/app:1.0'),
+            live_object('ConfigMap', 'app'),
+            live_object('ConfigMap', 'kube-root-ca.crt'),
+            live_object('Deployment', 'old', 'registry/old:1.0'),
+            live_object('Deployment', 'operated', 'registry/operated:1.0',
+                        metadata={'name': 'operated',
+                                  'ownerReferences': [{'kind': 'Operator'}]})])
+        self.live('staging', [
+            live_object('Deployment', 'app', 'registry/app:2.0'),
+            live_object('ConfigMap', 'app')])
+
+        self.kubectl = os.path.join(self.tmpdir, 'kubectl')
+        with open(self.kubectl, 'w') as f:
+            f.write('#!/bin/sh\necho "$@" >> {0}/kubectl.log\n'
+                    'cat {0}/live-$(echo "$2" | cut -d= -f2).json\n'.format(
+                        self.tmpdir))
+        os.chmod(self.kubectl, stat.S_IRWXU)
+        self.configfile = os.path.join(self.tmpdir, 'ausroller.ini')
+        with open(self.configfile, 'w') as f:
+            f.write('[ausroller]\nkubectlpath = {}\ncachepath = {}\n'
+                    '[unittest]\nrepopath = {}\n'.format(
+                        self.kubectl, os.path.join(self.tmpdir, 'cache'),
+                        self.repopath))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, content):
+        path = os.path.join(self.repopath, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def live(self, namespace, items):
+        with open(os.path.join(self.tmpdir, 'live-{}.json'.format(namespace)), 'w') as f:
+            json.dump({'kind': 'List', 'items': items}, f)
+
+    def test_compare(self):
+        '''
+        Check that one kubectl call gets all kinds and that objects created
+        by the cluster or by other objects are no extra objects.
+        '''
+        kubectl = KubeCtl('unittest', 'production', self.kubectl,
+                          skip_verify=True)
+        (count, differences) = Drift(kubectl, os.path.join(
+            self.repopath, 'rollout', 'production')).compare()
+        self.assertEqual(3, count)
+        self.assertEqual(
+            [('image', 'Deployment', 'app', 'registry/app:2.0 (live registry/app:1.0)'),
+             ('missing', 'Service', 'app', ''),
+             ('extra', 'Deployment', 'old', '')],
+            differences)
+        with open(os.path.join(self.tmpdir, 'kubectl.log')) as f:
+            self.assertEqual(['--context=unittest --namespace=production get '
+                              'configmap,deployment.v1.apps,service -o json'],
+                             f.read().splitlines())
+
+    def test_modification(self):
+        '''
+        Check that values changed in the cluster and values applied from
+        another manifest are found, but not defaults of the cluster.
+        '''
+        desired = {'object': {'kind': 'ConfigMap', 'metadata': {'name': 'app'},
+                              'data': {'host': 'db1', 'port': '5432'}}}
+        applied = json.dumps({'kind': 'ConfigMap', 'metadata': {'name': 'app'},
+                              'data': {'host': 'db1', 'port': '5432', 'user': 'x'}})
+        item = {'kind': 'ConfigMap',
+                'metadata': {'name': 'app', 'uid': '1',
+                             'annotations': {
+                                 'kubectl.kubernetes.io/last-applied-configuration': applied}},
+                'data': {'host': 'db2', 'port': '5432', 'user': 'x'}}
+        self.assertEqual(['data.host', 'data.user'],
+                         Drift.modification(desired, item))
+
+    def test_stored_values(self):
+        '''
+        Check that the string data of secrets and quantities are compared
+        as the cluster stores them.
+        '''
+        desired = {'object': {'kind': 'Secret', 'metadata': {'name': 'app'},
+                              'stringData': {'password': 'secret'},
+                              'spec': {'resources': {
+                                  'requests': {'cpu': 0.5, 'memory': '1Gi'},
+                                  'limits': {'cpu': 1}}}}}
+        applied = json.dumps(desired['object'])
+        item = {'kind': 'Secret',
+                'metadata': {'name': 'app', 'annotations': {
+                    'kubectl.kubernetes.io/last-applied-configuration': applied}},
+                'data': {'password': 'c2VjcmV0'},
+                'spec': {'resources': {
+                    'requests': {'cpu': '500m', 'memory': '1024Mi'},
+                    'limits': {'cpu': '1'}}}}
+        self.assertEqual([], Drift.modification(desired, item))
+        item['data'] = {'password': 'b3RoZXI='}
+        item['spec']['resources']['limits'] = {'cpu': '2'}
+        self.assertEqual(['data.password', 'spec.resources.limits.cpu'],
+                         Drift.modification(desired, item))
+
+    def test_nothing_committed(self):
+        '''
+        Check that a repository without rollout/ is reported as having
+        nothing to compare.
+        '''
+        shutil.rmtree(os.path.join(self.repopath, 'rollout'))
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            drift(['-c', self.configfile, '-C', 'unittest'])
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertIn('Nothing committed', output)
+
+    def test_drift_command(self):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            with self.assertRaises(SystemExit) as e:
+                drift(['-c', self.configfile, '-C', 'unittest'])
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(1, e.exception.code)
+        self.assertEqual(
+            ['production image Deployment/app: registry/app:2.0 (live registry/app:1.0)',
+             'production missing Service/app',
+             'production extra Deployment/old',
+             'Compared 5 objects in 2 namespaces: 1 image, 1 missing, 0 modified, 1 extra'],
+            output.splitlines())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import shutil
+import stat
+import subprocess
+import unittest
+from tempfile import mkdtemp
+from ausroller import Configuration, FanOut
+
+
+class FanOutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.repopath = os.path.join(self.tmpdir, 'repo')
+        self.write('templates/configmaps/app-configmap.tpl.yaml',
+                   'version: {{ app_version }}\n')
+        self.write('secrets/ns/secret_vars.json', '{}')
+        git = ['git', '-C', self.repopath]
+        subprocess.check_call(git + ['init', '-q'])
+        subprocess.check_call(git + ['config', 'user.name', 'unittest'])
+        subprocess.check_call(git + ['config', 'user.email',
+                                     'unittest@localhost'])
+        subprocess.check_call(git + ['add', '-A'])
+        subprocess.check_call(git + ['commit', '-q', '-m', 'init'])
+
+        self.log = os.path.join(self.tmpdir, 'kubectl.log')
+        kubectl = os.path.join(self.tmpdir, 'kubectl')
+        with open(kubectl, 'w') as f:
+            f.write('#!/bin/sh\n'
+                    'echo "$@" >> {}\n'
+                    'case "$*" in\n'
+                    '    *"version --short"*)\n'
+                    '        printf "Client Version: v1.9.0\\n'
+                    'Server Version: v1.9.0\\n" ;;\n'
+                    '    *"config get-contexts"*)\n'
+                    '        printf "ctx1\\nctx2\\n" ;;\n'
+                    'esac\n'.format(self.log))
+        os.chmod(kubectl, stat.S_IRWXU)
+        self.configfile = os.path.join(self.tmpdir, 'ausroller.ini')
+        with open(self.configfile, 'w') as f:
+            f.write('[ausroller]\nkubectlpath = {}\ncachepath = {}\n'
+                    'verifyttl = 0\nhistory = no\n\n'
+                    '[ctx1]\nrepopath = {}\n\n[ctx2]\nrepopath = {}\n'.format(
+                        kubectl, os.path.join(self.tmpdir, 'cache'),
+                        self.repopath, self.repopath))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, path, content):
+        path = os.path.join(self.repopath, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def applies(self):
+        ''' () -> list of strings
+            Returns the contexts of the kubectl apply calls since the last
+            call.
+        '''
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log) as f:
+            lines = f.read().splitlines()
+        os.unlink(self.log)
+        return sorted(line.split()[0] for line in lines
+                      if line.split()[2] == 'apply')
+
+    def deploy(self):
+        c = Configuration()
+        c.parse_args(['-c', self.configfile, '-t', 'ns@ctx1', '-t', 'ns@ctx2',
+                      '-a', 'app', '-v', '1.0'])
+        return FanOut(c).deploy()
+
+    def test_targets_sharing_a_rollout_directory(self):
+        '''
+        Check that targets in different contexts sharing the rollout
+        directory each apply the resources, but only once.
+        '''
+        self.assertEqual([(('ns', 'ctx1'), True), (('ns', 'ctx2'), True)],
+                         self.deploy())
+        self.assertEqual(['--context=ctx1', '--context=ctx2'], self.applies())
+        self.deploy()
+        self.assertEqual([], self.applies())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+from ausroller.history import History
+
+
+class HistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'history', 'history.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def record(self, namespace, outcome, rollouts, duration, context='unittest'):
+        history = History(self.path)
+        try:
+            return history.record(
+                1000.0, namespace, context, 'c0ffee', outcome, rollouts,
+                [('render', 1, duration / 4), ('apply', 2, duration / 2)],
+                finished=1000.0 + duration)
+        finally:
+            history.close()
+
+    def test_latest(self):
+        '''
+        Check that the last successful rollout of every application and
+        namespace is found.
+        '''
+        self.record('staging', 'succeeded', [('app', '1.0', ['deployment']),
+                                             ('db', '9.6', [])], 10)
+        self.record('staging', 'succeeded', [('app', '1.1', ['deployment'])], 10)
+        self.record('staging', 'failed', [('app', '1.2', ['deployment'])], 10)
+        self.record('production', 'succeeded', [('app', '1.0', [])], 10)
+        self.record('production', 'succeeded', [('app', '2.0', [])], 10,
+                    context='other')
+        history = History(self.path)
+        self.assertEqual([('production', 'app', '1.0'),
+                          ('staging', 'app', '1.1'),
+                          ('staging', 'db', '9.6')],
+                         [latest[:3] for latest in history.latest('unittest')])
+        self.assertEqual([('staging', 'app', '1.1', 'c0ffee', 1010.0)],
+                         history.latest('unittest', 'staging', 'app'))
+
+    def test_durations(self):
+        for duration in [4, 8, 12, 16]:
+            self.record('staging', 'succeeded', [('app', '1.0', [])], duration)
+        self.record('staging', 'failed', [('app', '1.0', [])], 100)
+        self.record('staging', 'succeeded', [('other', '1.0', [])], 200)
+        durations = History(self.path).durations('unittest', app_name='app',
+                                                 last=3)
+        self.assertEqual([8, 12, 16], durations['total'])
+        self.assertEqual([4, 6, 8], durations['apply'])
+        self.assertEqual([2, 3, 4], durations['render'])
+
+    def test_rollbacks(self):
+        '''
+        Check that rollbacks count for the latest versions but not for the
+        durations, and that versions are found by their commit.
+        '''
+        self.record('staging', 'succeeded', [('app', '1.0', [])], 10)
+        self.record('staging', 'rolled back', [('app', '0.9', [])], 100)
+        history = History(self.path)
+        self.assertEqual([('staging', 'app', '0.9')],
+                         [latest[:3] for latest in history.latest('unittest')])
+        self.assertEqual([10], history.durations('unittest')['total'])
+        self.assertEqual({'app': '0.9'},
+                         history.versions('unittest', 'staging', 'c0ffee'))
+        self.assertEqual({}, history.versions('unittest', 'staging', 'bad'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+from ausroller.index import TemplateIndex
+
+
+class TemplateIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.templates_path = os.path.join(self.tmpdir, 'templates')
+        self.indexfile = os.path.join(self.tmpdir, 'cache', 'index.json')
+        self.write('deployments/app-deployment.tpl.yaml',
+                   'image: registry/app:{{ app_version }}\n'
+                   'host: {{ DB_HOST }}\n')
+        self.write('configmaps/app-configmap.tpl.yaml',
+                   'host: {{ DB_HOST }}\nuser: {{ DB_USER }}\n')
+        self.write('ingresses/app-ingress.tpl.yaml',
+                   'host: {{ HOSTNAME }}\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, content):
+        path = os.path.join(self.templates_path, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def index(self):
+        index = TemplateIndex(self.templates_path, self.indexfile)
+        index.update()
+        return index
+
+    def test_templates_of_variable(self):
+        '''
+        Check that all templates using a variable are found.
+        '''
+        index = self.index()
+        self.assertEqual(index.templates('DB_HOST'),
+                         ['configmaps/app-configmap.tpl.yaml',
+                          'deployments/app-deployment.tpl.yaml'])
+        self.assertEqual(index.templates('HOSTNAME'),
+                         ['ingresses/app-ingress.tpl.yaml'])
+        self.assertEqual(index.templates('UNKNOWN'), [])
+
+    def test_variables_of_template(self):
+        '''
+        Check that all variables used by a template are found.
+        '''
+        self.assertEqual(
+            self.index().variables('configmaps/app-configmap.tpl.yaml'),
+            set(['DB_HOST', 'DB_USER']))
+
+    def test_only_changed_templates_are_parsed(self):
+        '''
+        Check that an update only parses the templates changed since the
+        last one.
+        '''
+        self.index()
+        index = TemplateIndex(self.templates_path, self.indexfile)
+        self.assertEqual(index.update(), [])
+        self.write('configmaps/app-configmap.tpl.yaml',
+                   'host: {{ DB_HOST }}\ndb_port: {{ DB_PORT }}\n')
+        self.assertEqual(index.update(),
+                         ['configmaps/app-configmap.tpl.yaml'])
+        self.assertEqual(index.templates('DB_PORT'),
+                         ['configmaps/app-configmap.tpl.yaml'])
+        self.assertEqual(index.templates('DB_USER'), [])
+
+    def test_removed_templates_are_dropped(self):
+        '''
+        Check that removed templates are dropped from the index.
+        '''
+        self.index()
+        os.unlink(os.path.join(self.templates_path,
+                               'ingresses/app-ingress.tpl.yaml'))
+        self.assertEqual(self.index().templates('HOSTNAME'), [])
+
+    def test_check(self):
+        '''
+        Check that variables used but not defined and defined but not used
+        are reported.
+        '''
+        (undefined, unused) = self.index().check(['DB_HOST', 'SMTP_HOST'])
+        self.assertEqual(sorted(undefined), ['DB_USER', 'HOSTNAME'])
+        self.assertEqual(unused, set(['SMTP_HOST']))
@@ -1,5 +1,9 @@
+import os
+import shutil
+import stat
 import unittest
-from ausroller import KubeCtl, KubeCtlException
+from tempfile import NamedTemporaryFile, mkdtemp
+from ausroller.kube import KubeCtl, KubeCtlException, VerificationCache
 
 
 class KubeCtlTest(unittest.TestCase):
@@ -37,6 +41,79 @@ class KubeCtlTest(unittest.TestCase):
                                                  'apply', '-f',
                                                  '/path/to/resourcefile'])
 
+    def test_apply_resourcefiles(self):
+        '''
+        Check that all resource files are passed to one kubectl call in
+        the given order.
+        '''
+        t = KubeCtl('unittest', namespace='doctest', path='/bin/false', skip_verify=True)
+        with self.assertRaises(KubeCtlException) as e:
+            t.apply_resourcefiles(['/path/to/configmap', '/path/to/deployment'])
+        self.assertEqual(e.exception.cause.cmd, ['/bin/false',
+                                                 '--context=unittest',
+                                                 '--namespace=doctest',
+                                                 'apply', '-o', 'name',
+                                                 '-f', '/path/to/configmap',
+                                                 '-f', '/path/to/deployment'])
+
+    def test_apply_resourcefiles_names_failed_file(self):
+        '''
+        Check that the exception names the resource file kubectl failed on.
+        '''
+        with NamedTemporaryFile(delete=False) as script:
+            script.write('#!/bin/sh\n'
+                         'echo \'error when creating "/path/to/deployment"\'\n'
+                         'exit 1\n')
+        os.chmod(script.name, stat.S_IRWXU)
+        try:
+            t = KubeCtl('unittest', 'unittest', path=script.name, skip_verify=True)
+            with self.assertRaises(KubeCtlException) as e:
+                t.apply_resourcefiles(['/path/to/configmap', '/path/to/deployment'])
+            self.assertIn('applying /path/to/deployment failed',
+                          str(e.exception))
+        finally:
+            os.unlink(script.name)
+
+    def test_delete_manifests(self):
+        '''
+        Check that manifests are deleted with one kubectl call ignoring
+        objects which do not exist.
+        '''
+        t = KubeCtl('unittest', namespace='doctest', path='/bin/false', skip_verify=True)
+        with self.assertRaises(KubeCtlException) as e:
+            t.delete_manifests('kind: Service\n')
+        self.assertEqual(e.exception.cause.cmd, ['/bin/false',
+                                                 '--context=unittest',
+                                                 '--namespace=doctest',
+                                                 'delete',
+                                                 '--ignore-not-found',
+                                                 '-o', 'name', '-f', '-'])
+
+    def test_diff_manifests(self):
+        '''
+        Check that differences (exit code 1) are returned and errors
+        (exit code > 1) raised.
+        '''
+        with NamedTemporaryFile(delete=False) as script:
+            script.write('#!/bin/sh\n'
+                         'cat > /dev/null\n'
+                         'echo "diff -u -N $KUBECTL_DIFF_OUTPUT"\n'
+                         'exit $KUBECTL_DIFF_EXIT\n')
+        os.chmod(script.name, stat.S_IRWXU)
+        try:
+            t = KubeCtl('unittest', 'unittest', path=script.name, skip_verify=True)
+            os.environ['KUBECTL_DIFF_OUTPUT'] = 'v1.ConfigMap.unittest.app'
+            os.environ['KUBECTL_DIFF_EXIT'] = '1'
+            self.assertEqual('diff -u -N v1.ConfigMap.unittest.app\n',
+                             t.diff_manifests('kind: ConfigMap\n'))
+            os.environ['KUBECTL_DIFF_EXIT'] = '2'
+            with self.assertRaises(KubeCtlException):
+                t.diff_manifests('kind: ConfigMap\n')
+        finally:
+            del os.environ['KUBECTL_DIFF_OUTPUT']
+            del os.environ['KUBECTL_DIFF_EXIT']
+            os.unlink(script.name)
+
     def test_KubeCtl_defaults(self):
         '''
         Check that KubeCtl uses sane defaults.
@@ -44,3 +121,41 @@ class KubeCtlTest(unittest.TestCase):
         k = KubeCtl('unittest', 'unittest', path=None, skip_verify=True)
         self.assertEqual('kubectl', k.path)
         self.assertEqual(False, k.dryrun)
+
+    def test_verification_cache(self):
+        '''
+        Check that a recent verification is reused unless ignored.
+        '''
+        tempdir = mkdtemp()
+        kubectl = os.path.join(tempdir, 'kubectl')
+        calls = os.path.join(tempdir, 'calls')
+        with open(kubectl, 'w') as script:
+            script.write('#!/bin/sh\n'
+                         'echo "$@" >> {}\n'
+                         'case "$*" in\n'
+                         '  *version*) printf "Client Version: v1.9.0\\n'
+                         'Server Version: v1.9.0\\n";;\n'
+                         '  *) echo unittest;;\n'
+                         'esac\n'.format(calls))
+        os.chmod(kubectl, stat.S_IRWXU)
+        kubeconfig = os.environ.get('KUBECONFIG')
+        os.environ['KUBECONFIG'] = os.path.join(tempdir, 'kubeconfig')
+        try:
+            cachefile = os.path.join(tempdir, 'cache', 'verified.json')
+            KubeCtl('unittest', 'unittest', path=kubectl,
+                    verify_cache=VerificationCache(cachefile, 60))
+            KubeCtl('unittest', 'unittest', path=kubectl,
+                    verify_cache=VerificationCache(cachefile, 60))
+            with open(calls) as f:
+                self.assertEqual(2, len(f.readlines()))
+
+            KubeCtl('unittest', 'unittest', path=kubectl,
+                    verify_cache=VerificationCache(cachefile, 60, True))
+            with open(calls) as f:
+                self.assertEqual(4, len(f.readlines()))
+        finally:
+            if kubeconfig is None:
+                del os.environ['KUBECONFIG']
+            else:
+                os.environ['KUBECONFIG'] = kubeconfig
+            shutil.rmtree(tempdir)
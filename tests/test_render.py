@@ -0,0 +1,86 @@
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+from ausroller.config import Configuration
+from ausroller.render import discover, render_items
+
+
+class RenderAllTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.repopath = os.path.join(self.tmpdir, 'repo')
+        self.write('templates/deployments/app-deployment.tpl.yaml',
+                   'apiVersion: apps/v1\nkind: Deployment\nmetadata:\n'
+                   '  name: app\nspec:\n  image: registry/app:{{ app_version }}\n')
+        self.write('templates/configmaps/app-configmap.tpl.yaml',
+                   'apiVersion: v1\nkind: ConfigMap\nmetadata:\n'
+                   '  name: app\ndata:\n  host: "{{ DB_HOST }}"\n')
+        self.write('templates/services/web-service.tpl.yaml',
+                   'apiVersion: v1\nmetadata:\n  name: web\n')
+        self.write('templates/README.tpl.yaml', '{{ nothing }}')
+        self.write('secrets/staging/secret_vars.json', '{"DB_HOST": "db1"}')
+        self.write('secrets/production/secret_vars.json', '{}')
+        self.write('secrets/broken/secret_vars.json', '{"DB_HOST": ')
+        self.configfile = os.path.join(self.tmpdir, 'ausroller.ini')
+        with open(self.configfile, 'w') as f:
+            f.write('[ausroller]\nkubectlpath = /bin/true\ncachepath = {}\n'
+                    '[unittest]\nrepopath = {}\n'.format(
+                        os.path.join(self.tmpdir, 'cache'), self.repopath))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, content):
+        path = os.path.join(self.repopath, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def configuration(self):
+        c = Configuration()
+        c.configfile = self.configfile
+        c.context = 'unittest'
+        c.secretsfile = None
+        c.extravarsfile = None
+        c.read_settings()
+        return c
+
+    def test_discover(self):
+        c = self.configuration()
+        self.assertEqual(
+            [('staging', 'configmaps/app-configmap.tpl.yaml'),
+             ('staging', 'deployments/app-deployment.tpl.yaml')],
+            discover(c, apps=['app'], namespaces=['staging', 'unknown']))
+        self.assertEqual(9, len(discover(c)))
+
+    def test_discover_without_secrets(self):
+        '''
+        Check that a repository without secrets/ has nothing to render.
+        '''
+        shutil.rmtree(os.path.join(self.repopath, 'secrets'))
+        self.assertEqual([], discover(self.configuration()))
+
+    def test_render_items(self):
+        '''
+        Check that missing variables, invalid manifests and unreadable
+        variables are reported alike by one or several processes.
+        '''
+        c = self.configuration()
+        items = discover(c, namespaces=['staging', 'production', 'broken'])
+        errors = dict(((namespace, name), error)
+                      for (namespace, name, error) in render_items(c, items, 1))
+        self.assertIsNone(errors[('staging', 'configmaps/app-configmap.tpl.yaml')])
+        self.assertIsNone(errors[('staging', 'deployments/app-deployment.tpl.yaml')])
+        self.assertEqual("document 1: no kind",
+                         errors[('staging', 'services/web-service.tpl.yaml')])
+        self.assertEqual("'DB_HOST' is undefined",
+                         errors[('production', 'configmaps/app-configmap.tpl.yaml')])
+        self.assertTrue(errors[('broken', 'deployments/app-deployment.tpl.yaml')]
+                        .startswith("cannot read variables"))
+        self.assertEqual(render_items(c, items, 1), render_items(c, items, 2))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+import os
+import shutil
+import subprocess
+import threading
+import unittest
+from tempfile import mkdtemp
+from ausroller.core import RESOURCES
+from ausroller.history import History
+from ausroller.repo import RolloutRepository
+from ausroller.rollback import Rollback
+from ausroller.timing import Recorder
+from stubs import StubConfiguration
+
+
+class StubKubeCtl(object):
+
+    def __init__(self):
+        self.applied = []
+        self.deleted = []
+
+    def apply_manifests(self, manifests):
+        self.applied.append(manifests)
+        return ['deployment.apps/app']
+
+    def delete_manifests(self, manifests):
+        self.deleted.append(manifests)
+        return ['service/app']
+
+
+class StubAusroller(object):
+
+    def __init__(self, c):
+        self.c = c
+        self.git_lock = threading.Lock()
+        self.kubectl = StubKubeCtl()
+        self.recorder = Recorder()
+
+    def resource_types(self):
+        return RESOURCES
+
+    def resource_path(self, app_name, resource):
+        return os.path.join(self.c.rollout_path, "{}s".format(resource),
+                            "{}-{}.yaml".format(app_name, resource))
+
+    @staticmethod
+    def is_unchanged(outfile, content):
+        return os.path.exists(outfile) and open(outfile).read() == content
+
+
+class RollbackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repopath = mkdtemp()
+        self.first = self.rollout('1.0', 'db1')
+        self.second = self.rollout('2.0', 'db2')
+
+    def tearDown(self):
+        shutil.rmtree(self.repopath)
+
+    def write(self, path, content):
+        path = os.path.join(self.repopath, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def rollout(self, version, host):
+        self.write('rollout/unittest/deployments/app-deployment.yaml',
+                   'image: registry/app:{}\n'.format(version))
+        self.write('rollout/unittest/configmaps/app-configmap.yaml',
+                   'host: {}\n'.format(host))
+        git = ['git', '-C', self.repopath]
+        if not os.path.isdir(os.path.join(self.repopath, '.git')):
+            subprocess.check_call(git + ['init', '-q'])
+            subprocess.check_call(git + ['config', 'user.name', 'unittest'])
+            subprocess.check_call(git + ['config', 'user.email',
+                                         'unittest@localhost'])
+        subprocess.check_call(git + ['add', '-A'])
+        subprocess.check_call(git + ['commit', '-q', '-m', version])
+        return subprocess.check_output(git + ['rev-parse', 'HEAD']).strip()
+
+    def test_read_files(self):
+        '''
+        Check that files are read at the revision and missing ones are
+        left out.
+        '''
+        repo = RolloutRepository(self.repopath)
+        before = repo.subprocess_count
+        files = repo.read_files(self.first, [
+            'rollout/unittest/configmaps/app-configmap.yaml',
+            'rollout/unittest/services/app-service.yaml',
+            'rollout/unittest/deployments/app-deployment.yaml'])
+        self.assertEqual(
+            {'rollout/unittest/configmaps/app-configmap.yaml': 'host: db1\n',
+             'rollout/unittest/deployments/app-deployment.yaml':
+             'image: registry/app:1.0\n'}, files)
+        self.assertEqual(1, repo.subprocess_count - before)
+
+    def test_rollback_to_previous(self):
+        '''
+        Check that the previous manifests are applied in one call and
+        committed.
+        '''
+        repo = RolloutRepository(self.repopath)
+        a = StubAusroller(StubConfiguration(
+            self.repopath, apps=[('app', None)], is_dryrun=False))
+        Rollback(a, repo).rollback('previous')
+        self.assertEqual(['host: db1\n---\nimage: registry/app:1.0\n'],
+                         a.kubectl.applied)
+        with open(a.resource_path('app', 'deployment')) as f:
+            self.assertEqual('image: registry/app:1.0\n', f.read())
+        self.assertTrue(repo.is_clean())
+        message = subprocess.check_output(
+            ['git', '-C', self.repopath, 'log', '-1', '--format=%s'])
+        self.assertEqual("[unittest] Rolled back app to {}".format(
+            self.first[:7]), message.strip())
+
+    def test_rollback_in_dependency_order(self):
+        '''
+        Check that a deployment referring to a config map of the rollback
+        is applied with a call after the config map.
+        '''
+        self.write('rollout/unittest/deployments/app-deployment.yaml',
+                   'kind: Deployment\nmetadata:\n  name: app\n'
+                   'envFrom:\n- configMapRef:\n    name: app\n')
+        self.write('rollout/unittest/configmaps/app-configmap.yaml',
+                   'kind: ConfigMap\nmetadata:\n  name: app\n')
+        subprocess.check_call(['git', '-C', self.repopath, 'commit', '-q',
+                               '-a', '-m', 'referring'])
+        revision = subprocess.check_output(
+            ['git', '-C', self.repopath, 'rev-parse', 'HEAD']).strip()
+        self.rollout('3.0', 'db3')
+        a = StubAusroller(StubConfiguration(self.repopath,
+                                            apps=[('app', None)]))
+        Rollback(a, RolloutRepository(self.repopath)).rollback(revision)
+        self.assertEqual(['kind: ConfigMap\nmetadata:\n  name: app\n',
+                          'kind: Deployment\nmetadata:\n  name: app\n'
+                          'envFrom:\n- configMapRef:\n    name: app\n'],
+                         a.kubectl.applied)
+
+    def test_added_resources(self):
+        '''
+        Check that resources added since the revision are kept unless
+        pruning, which deletes them from the cluster and the repository.
+        '''
+        self.write('rollout/unittest/services/app-service.yaml',
+                   'kind: Service\n')
+        subprocess.check_call(['git', '-C', self.repopath, 'add', '-A'])
+        subprocess.check_call(['git', '-C', self.repopath, 'commit', '-q',
+                               '-m', 'service'])
+        repo = RolloutRepository(self.repopath)
+        a = StubAusroller(StubConfiguration(
+            self.repopath, apps=[('app', None)], is_dryrun=False))
+        service = a.resource_path('app', 'service')
+
+        Rollback(a, repo).rollback(self.second)
+        self.assertEqual([], a.kubectl.deleted)
+        self.assertTrue(os.path.exists(service))
+
+        Rollback(a, repo).rollback(self.first, prune=True)
+        self.assertEqual(['kind: Service\n'], a.kubectl.deleted)
+        self.assertFalse(os.path.exists(service))
+        self.assertTrue(repo.is_clean())
+        files = subprocess.check_output(
+            ['git', '-C', self.repopath, 'ls-files', 'rollout'])
+        self.assertNotIn('services', files)
+
+    def test_rollback_is_recorded(self):
+        '''
+        Check that a rollback is recorded with the versions rolled out with
+        the restored commit and the changed resources.
+        '''
+        historyfile = os.path.join(self.repopath, 'history.sqlite')
+        history = History(historyfile)
+        history.record(1000.0, 'unittest', 'unittest', self.first,
+                       'succeeded', [('app', '1.0', ['deployment'])], [])
+        history.record(1000.0, 'unittest', 'unittest', self.second,
+                       'succeeded', [('app', '2.0', ['deployment'])], [])
+        history.close()
+        with open(os.path.join(self.repopath, '.gitignore'), 'w') as f:
+            f.write('history.sqlite\n.gitignore\n')
+
+        repo = RolloutRepository(self.repopath)
+        a = StubAusroller(StubConfiguration(
+            self.repopath, apps=[('app', None)], is_dryrun=False,
+            historyfile=historyfile))
+        Rollback(a, repo).rollback('previous')
+        history = History(historyfile)
+        try:
+            latest = history.latest('unittest', 'unittest', 'app')
+            (_, _, version, commit_id, _) = latest[0]
+            self.assertEqual('1.0', version)
+            self.assertEqual(repo.resolve('HEAD'), commit_id)
+            self.assertEqual(
+                [('rolled back', '["configmap", "deployment"]')],
+                history.db.execute(
+                    "SELECT outcome, resources FROM runs JOIN rollouts"
+                    " ON rollouts.run_id = runs.id WHERE runs.commit_id = ?",
+                    [commit_id]).fetchall())
+        finally:
+            history.close()
+
+if __name__ == '__main__':
+    unittest.main()
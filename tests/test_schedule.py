@@ -0,0 +1,57 @@
+import unittest
+from ausroller.schedule import batches, waves
+
+
+def manifest(kind, name, body=''):
+    return "kind: {}\nmetadata:\n  name: {}\n{}".format(kind, name, body)
+
+
+class WavesTest(unittest.TestCase):
+
+    def test_kind_ranks_within_an_application(self):
+        '''
+        Check that config maps and secrets come before workloads and
+        services after them, while applications are independent.
+        '''
+        nodes = [('a', 'deployment', manifest('Deployment', 'a')),
+                 ('a', 'service', manifest('Service', 'a')),
+                 ('a', 'secret', manifest('Secret', 'a')),
+                 ('b', 'deployment', manifest('Deployment', 'b'))]
+        self.assertEqual([[2, 3], [0], [1]], waves(nodes))
+
+    def test_references_across_applications(self):
+        '''
+        Check that a workload waits for the config maps and secrets of
+        other applications it refers to.
+        '''
+        nodes = [('a', 'deployment', manifest(
+                     'Deployment', 'a',
+                     'spec:\n  envFrom:\n  - configMapRef:\n      name: shared\n')),
+                 ('b', 'deployment', manifest('Deployment', 'b')),
+                 ('shared', 'configmap', manifest('ConfigMap', 'shared'))]
+        self.assertEqual([[1, 2], [0]], waves(nodes))
+
+    def test_batches(self):
+        '''
+        Check that a rollout without references is applied with one call in
+        wave order and that references split the calls into waves.
+        '''
+        nodes = [('a', 'deployment', manifest('Deployment', 'a')),
+                 ('a', 'service', manifest('Service', 'a')),
+                 ('a', 'configmap', manifest('ConfigMap', 'a'))]
+        self.assertEqual([[2, 0, 1]], batches(nodes))
+        nodes[0] = ('a', 'deployment', manifest(
+            'Deployment', 'a', 'envFrom:\n- configMapRef:\n    name: a\n'))
+        self.assertEqual([[2], [0], [1]], batches(nodes))
+
+    def test_cycles_are_applied_at_once(self):
+        nodes = [('a', 'deployment', manifest(
+                     'Deployment', 'a', 'volumes:\n- secret:\n    secretName: b\n')),
+                 ('b', 'secret', manifest(
+                     'Secret', 'b', 'x:\n  configMapKeyRef:\n    name: c\n')),
+                 ('c', 'configmap', manifest(
+                     'ConfigMap', 'c', 'y:\n  secretName: b\n'))]
+        self.assertEqual([[0, 1, 2]], waves(nodes))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import httplib
+import json
+import logging
+import threading
+import unittest
+from StringIO import StringIO
+from ausroller.server import RequestLogHandler, RolloutService, make_server, parse_address
+from ausroller.timing import Recorder, bound
+
+
+class ServerTest(unittest.TestCase):
+
+    def test_parse_address(self):
+        '''
+        Check that socket paths and host:port addresses are told apart.
+        '''
+        self.assertEqual(('unix', '/run/ausroller.sock'),
+                         parse_address('/run/ausroller.sock'))
+        self.assertEqual(('tcp', ('127.0.0.1', 8642)),
+                         parse_address('127.0.0.1:8642'))
+        self.assertEqual(('tcp', ('localhost', 8642)), parse_address(':8642'))
+
+    def test_invalid_rollout_request(self):
+        '''
+        Check that invalid rollout arguments are reported as failed.
+        '''
+        server = make_server('127.0.0.1:0',
+                             RolloutService('/does/not/exist.ini'))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            connection = httplib.HTTPConnection(*server.server_address)
+            connection.request('POST', '/nothing', '{}')
+            self.assertEqual(404, connection.getresponse().status)
+
+            connection = httplib.HTTPConnection(*server.server_address)
+            connection.request('POST', '/rollout', 'no json')
+            self.assertEqual(400, connection.getresponse().status)
+
+            connection = httplib.HTTPConnection(*server.server_address)
+            connection.request('POST', '/rollout',
+                               json.dumps({'argv': ['--namespace', 'unittest']}))
+            response = connection.getresponse()
+            self.assertEqual(200, response.status)
+            self.assertTrue(response.read().endswith("RESULT: failed\n"))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_request_log(self):
+        '''
+        Check that the log of a request includes the records of the threads
+        working for it, but not those of other threads.
+        '''
+        stream = StringIO()
+        recorder = Recorder()
+        logger = logging.getLogger('unittest.request')
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        handler = RequestLogHandler(stream, logging.INFO, recorder)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+
+        def run(target, message):
+            thread = threading.Thread(target=target, args=(message,))
+            thread.start()
+            thread.join()
+        try:
+            with recorder.activate():
+                logger.info("request")
+                logger.debug("hidden")
+                run(bound(logger.info), "worker")
+            run(logger.info, "other request")
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual("request\nworker\n", stream.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import unittest
+from tempfile import mkdtemp
+
+# seconds each entry path may take from importing ausroller until the
+# command returned, measured in a fresh interpreter (best of three runs).
+# They leave room for slow machines; the modules loaded are checked
+# exactly.
+STARTUP_BUDGET = {'import': 0.15,
+                  'version': 0.15,
+                  'bad arguments': 0.15,
+                  'dry-run': 0.5}
+
+SCRIPT = '''
+import json
+import sys
+import time
+start = time.time()
+from ausroller.main import main
+argv = json.loads(sys.argv[1])
+if argv is not None:
+    try:
+        main(argv)
+    except SystemExit:
+        pass
+print(json.dumps({"seconds": time.time() - start,
+                  "modules": sorted(name for name in sys.modules
+                                    if sys.modules[name])}))
+'''
+
+toplevel = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StartupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        repopath = os.path.join(self.tmpdir, 'repo')
+        os.makedirs(os.path.join(repopath, 'templates', 'configmaps'))
+        os.makedirs(os.path.join(repopath, 'secrets', 'unittest'))
+        with open(os.path.join(repopath, 'templates', 'configmaps',
+                               'app-configmap.tpl.yaml'), 'w') as f:
+            f.write('version: {{ app_version }}\n')
+        with open(os.path.join(repopath, 'secrets', 'unittest',
+                               'secret_vars.json'), 'w') as f:
+            f.write('{}')
+        self.configfile = os.path.join(self.tmpdir, 'ausroller.ini')
+        with open(self.configfile, 'w') as f:
+            f.write("[ausroller]\nkubectlpath = /bin/false\n"
+                    "cachepath = {}\n\n[unittest]\nrepopath = {}\n".format(
+                        os.path.join(self.tmpdir, 'cache'), repopath))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def start(self, argv):
+        '''
+        Runs the entry path given by argv (None for importing only) three
+        times in a fresh interpreter and returns the fastest run with the
+        seconds it took and the names of the imported modules.
+        '''
+        env = dict(os.environ, PYTHONPATH=toplevel)
+        runs = []
+        for _ in range(3):
+            with open(os.devnull, 'w') as devnull:
+                output = subprocess.check_output(
+                    [sys.executable, '-c', SCRIPT, json.dumps(argv)],
+                    env=env, stderr=devnull)
+            runs.append(json.loads(output.splitlines()[-1]))
+        return min(runs, key=lambda run: run['seconds'])
+
+    def check(self, path, argv, unwanted):
+        run = self.start(argv)
+        for module in unwanted:
+            self.assertNotIn(module, run['modules'],
+                             "{} imports {}".format(path, module))
+        self.assertLess(run['seconds'], STARTUP_BUDGET[path],
+                        "{} took {:.3f}s".format(path, run['seconds']))
+
+    def test_import(self):
+        '''
+        Check that importing the package loads neither jinja2, gbp nor the
+        kubectl wrapper.
+        '''
+        self.check('import', None, ['jinja2', 'gbp', 'multiprocessing',
+                                    'distutils', 'ausroller.kube'])
+
+    def test_version(self):
+        '''
+        Check that --version only prints the version.
+        '''
+        self.check('version', ['--version'], ['jinja2', 'gbp', 'distutils',
+                                              'ausroller.kube'])
+
+    def test_bad_arguments(self):
+        '''
+        Check that argument errors are reported without loading the
+        renderer, git or kubectl.
+        '''
+        self.check('bad arguments', ['--app', 'app'],
+                   ['jinja2', 'gbp', 'distutils', 'ausroller.kube'])
+
+    def test_dryrun(self):
+        '''
+        Check that a dry-run renders without loading git or kubectl.
+        '''
+        self.check('dry-run', ['-c', self.configfile, '-n', 'unittest',
+                               '-C', 'unittest', '-a', 'app', '-v', '1.0',
+                               '-d'], ['gbp', 'distutils', 'ausroller.kube'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from multiprocessing.pool import ThreadPool
+from ausroller.timing import Recorder, bound, recorder, timed
+
+
+class RecorderTest(unittest.TestCase):
+
+    def test_phases(self):
+        '''
+        Check that phases are summed up per name in order of appearance.
+        '''
+        r = Recorder()
+        with r.phase('render'):
+            pass
+        with r.phase('apply'):
+            pass
+        with r.phase('render'):
+            pass
+        r.count('kubectl subprocesses', 2)
+        self.assertEqual(['render', 'apply'],
+                         [name for (name, _, _) in r.phases()])
+        self.assertEqual([2, 1], [calls for (_, calls, _) in r.phases()])
+        self.assertEqual({'kubectl subprocesses': 2},
+                         r.as_json()['counters'])
+
+    def test_as_trace(self):
+        '''
+        Check that phases are exported as complete trace events.
+        '''
+        r = Recorder()
+        with r.phase('write'):
+            pass
+        events = r.as_trace()['traceEvents']
+        self.assertEqual(1, len(events))
+        self.assertEqual('X', events[0]['ph'])
+        self.assertEqual('write', events[0]['name'])
+
+    def test_rollout_recorder(self):
+        '''
+        Check that a rollout recorder collects the phases of the threads
+        working for it and passes them on to its parent only.
+        '''
+        @timed('apply')
+        def apply(_):
+            pass
+
+        parent = Recorder()
+        r = Recorder(parent=parent)
+        before = len(recorder.events)
+        with r.activate():
+            pool = ThreadPool(2)
+            try:
+                pool.map(bound(apply), range(4))
+            finally:
+                pool.close()
+                pool.join()
+        apply(None)
+        self.assertEqual([('apply', 4)],
+                         [(name, calls) for (name, calls, _) in r.phases()])
+        self.assertEqual(4, len(parent.events))
+        self.assertEqual(before + 1, len(recorder.events))
+        self.assertTrue(r.is_within(parent))
+        self.assertFalse(parent.is_within(r))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import shutil
+import stat
+import time
+import unittest
+from tempfile import mkdtemp
+from ausroller.kube import KubeCtl
+from ausroller.watch import RolloutWatcher
+
+FAKE_KUBECTL = """#!/bin/sh
+case "$*" in
+  *"rollout status deployment.apps/ok"*) echo "rolled out";;
+  *"rollout status deployment.apps/slow"*) sleep 30;;
+  *"rollout status deployment.apps/bad"*) echo "failed"; exit 1;;
+  *"get replicationcontroller/rc"*) echo "2/2";;
+  *) exit 1;;
+esac
+"""
+
+
+class RolloutWatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = mkdtemp()
+        path = os.path.join(self.tempdir, 'kubectl')
+        with open(path, 'w') as script:
+            script.write(FAKE_KUBECTL)
+        os.chmod(path, stat.S_IRWXU)
+        self.kubectl = KubeCtl('unittest', 'unittest', path=path,
+                               skip_verify=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_watch_succeeds(self):
+        '''
+        Check that watching succeeds when all workloads are rolled out and
+        other kinds are ignored.
+        '''
+        w = RolloutWatcher(self.kubectl, 10)
+        self.assertTrue(w.watch(['deployment.apps/ok',
+                                 'replicationcontroller/rc',
+                                 'service/ignored']))
+
+    def test_watch_fails_fast(self):
+        '''
+        Check that a failing rollout stops the watch without waiting for
+        slower ones.
+        '''
+        w = RolloutWatcher(self.kubectl, 20)
+        start = time.time()
+        self.assertFalse(w.watch(['deployment.apps/slow',
+                                  'deployment.apps/bad']))
+        self.assertLess(time.time() - start, 10)
+
+    def test_watch_timeout(self):
+        '''
+        Check that watching gives up after the timeout.
+        '''
+        w = RolloutWatcher(self.kubectl, 1)
+        start = time.time()
+        self.assertFalse(w.watch(['deployment.apps/slow']))
+        self.assertLess(time.time() - start, 10)
+
+if __name__ == '__main__':
+    unittest.main()